@@ -20,6 +20,17 @@ def main():
     sys.exit(main(sys.argv))
 
 
+def admin():
+
+    # Ensure the top-level package is on the path
+    currentdir = os.path.dirname(os.path.realpath(__file__))
+    sys.path.append(currentdir)
+
+    # Run the admin command with the command line args.
+    from admin import main
+    sys.exit(main(sys.argv))
+
+
 if __name__ == '__main__':
 
     sys.exit(main())
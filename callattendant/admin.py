@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  admin.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import copy
+import getopt
+import os
+import sqlite3
+import sys
+import time
+
+from app import make_config
+from migrations import migrate
+from screening.blacklist import Blacklist
+from screening.bulkimport import read_numbers, import_blacklist
+from screening.callstats import rebuild_call_stats
+from screening.spamsnapshot import build_snapshot
+from screening.whatif import make_screener, read_call_log, compare_decisions, months_ago
+
+
+# The supported commands
+COMMANDS = ("import-blacklist", "build-snapshot", "what-if", "rebuild-stats")
+
+# The commands that take a FILE argument
+FILE_COMMANDS = ("import-blacklist", "build-snapshot", "what-if")
+
+
+def import_blacklist_file(config, filename, reason="", number_column=0, batch_size=10000):
+    """
+    Imports a CSV file of spam numbers into the blacklist.
+        :param config: the application config dict
+        :param filename: the CSV file
+        :param reason: the reason stored with numbers that don't have one
+        :param number_column: the column index or header name of the numbers
+        :param batch_size: the number of rows inserted per batch
+        :return: the import stats dict
+    """
+    db = sqlite3.connect(config["DB_FILE"])
+    try:
+        blacklist = Blacklist(db, config)   # Ensure the table exists
+
+        def progress(count, elapsed):
+            print("\r  {:,} numbers, {:,.0f}/sec".format(count, count / elapsed if elapsed else 0), end="")
+            sys.stdout.flush()
+
+        print("Importing {} into the blacklist".format(filename))
+        with open(filename, mode="r", newline="", encoding="utf-8", errors="replace") as f:
+            country_code = str(config.get("PHONE_COUNTRY_CODE", "1"))
+            rows = read_numbers(f, number_column=number_column, country_code=country_code)
+            stats = import_blacklist(db, rows, reason, batch_size=batch_size, progress=progress,
+                                     country_code=country_code)
+        print()
+        blacklist.rebuild_filter()
+        print("Imported {:,} numbers ({:,} skipped) in {:.1f} seconds: {:,.0f} numbers/sec".format(
+            stats["imported"], stats["skipped"], stats["elapsed"], stats["rate"]))
+        return stats
+    finally:
+        db.close()
+
+
+def build_snapshot_file(config, filename, number_column=0):
+    """
+    Builds the SNAPSHOT service's file (BLOCK_SERVICE_SNAPSHOT_FILE) from
+    a CSV file of spam numbers, replacing the previous snapshot.
+        :param config: the application config dict
+        :param filename: the CSV file
+        :param number_column: the column index or header name of the numbers
+        :return: the number of unique numbers in the snapshot
+    """
+    snapshot_file = config["BLOCK_SERVICE_SNAPSHOT_FILE"]
+    print("Building {} from {}".format(snapshot_file, filename))
+    start = time.time()
+    country_code = str(config.get("PHONE_COUNTRY_CODE", "1"))
+    with open(filename, mode="r", newline="", encoding="utf-8", errors="replace") as f:
+        rows = read_numbers(f, number_column=number_column, country_code=country_code)
+        count = build_snapshot((number for number, name, reason in rows), snapshot_file, country_code)
+    print("Saved {:,} numbers in {:.1f} seconds".format(count, time.time() - start))
+    return count
+
+
+def what_if(config, rules_file, months=3, limit=100):
+    """
+    Reports how the calls in the call log would be screened with the
+    candidate rules in the rules file versus the current rules.
+        :param config: the application config dict
+        :param rules_file: a python configuration file with the candidate
+            rules, e.g., BLOCK_NAME_PATTERNS = {...}
+        :param months: the number of months of call history to screen
+        :param limit: the max number of changed calls to list
+        :return: the report dict
+    """
+    rules = copy.copy(config)
+    rules.from_pyfile(rules_file)
+
+    db = sqlite3.connect(config["DB_FILE"])
+    screener = make_screener(db, config)
+    try:
+        calls = read_call_log(db, since=months_ago(months))
+        report = compare_decisions(screener, calls, rules, max_changes=limit)
+    finally:
+        db.close()
+
+    print("Screened {:,} calls in {:.1f} seconds".format(report["total"], report["elapsed"]))
+    print("Current\t\tCandidate\tCalls")
+    for (old_action, new_action), count in sorted(report["transitions"].items()):
+        print("{:<10}\t{:<10}\t{:,}".format(old_action, new_action, count))
+    if report["changes"]:
+        print("Changed decisions:")
+    for call, old_action, new_action, reason in report["changes"]:
+        print("  {} {} {}: {} -> {} ({})".format(
+            call["DateTime"], call["NMBR"], call["NAME"], old_action, new_action, reason))
+    return report
+
+
+def rebuild_stats(config):
+    """
+    Rebuilds the daily call statistics shown on the dashboard from the
+    call log.
+        :param config: the application config dict
+        :return: the number of calls counted
+    """
+    db = sqlite3.connect(config["DB_FILE"])
+    try:
+        migrate(db, config)
+        start = time.time()
+        count = rebuild_call_stats(db)
+    finally:
+        db.close()
+    print("Counted {:,} calls in {:.1f} seconds".format(count, time.time() - start))
+    return count
+
+
+def get_args(argv):
+    """Get and validate the command line arguments.
+        :param argv:
+            sys.argv from main
+        :return:
+            dict: the options,
+            list: the command and its arguments
+    """
+    options = {
+        "config": None,
+        "data-path": None,
+        "reason": "Imported",
+        "column": 0,
+        "batch-size": 10000,
+        "months": 3,
+        "limit": 100,
+    }
+    try:
+        opts, args = getopt.getopt(argv[1:], "hc:d:r:n:b:m:l:", [
+            "help", "config=", "data-path=", "reason=", "column=", "batch-size=", "months=", "limit="])
+        if not args:
+            raise getopt.GetoptError("a command is required")
+        if args[0] not in COMMANDS:
+            raise getopt.GetoptError("unknown command: {}".format(args[0]))
+        if args[0] in FILE_COMMANDS and len(args) != 2:
+            raise getopt.GetoptError("{} requires a FILE argument".format(args[0]))
+        if args[0] not in FILE_COMMANDS and len(args) != 1:
+            raise getopt.GetoptError("{} doesn't take arguments".format(args[0]))
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                show_syntax()
+                sys.exit()
+            elif opt in ("-c", "--config"):
+                options["config"] = arg
+            elif opt in ("-d", "--data-path"):
+                options["data-path"] = arg
+            elif opt in ("-r", "--reason"):
+                options["reason"] = arg
+            elif opt in ("-n", "--column"):
+                options["column"] = int(arg) if arg.isdigit() else arg
+            elif opt in ("-b", "--batch-size"):
+                options["batch-size"] = int(arg)
+            elif opt in ("-m", "--months"):
+                options["months"] = int(arg)
+            elif opt in ("-l", "--limit"):
+                options["limit"] = int(arg)
+    except (getopt.GetoptError, ValueError) as e:
+        print("Error: {}".format(e))
+        show_syntax()
+        sys.exit(2)
+
+    return options, args
+
+
+def show_syntax():
+    """
+    Print the command line syntax.
+    """
+    print("Usage: callattendant-admin [OPTIONS] COMMAND [FILE]")
+    print("Commands:")
+    print("import-blacklist FILE\t\t import a CSV file of numbers into the blacklist")
+    print("build-snapshot FILE\t\t build the SNAPSHOT service's file from a CSV file of numbers")
+    print("what-if FILE\t\t\t compare the call history screened with the rules in FILE")
+    print("rebuild-stats\t\t\t rebuild the dashboard's daily call statistics from the call log")
+    print("Options:")
+    print("-c, --config [FILE]\t\t load a python configuration file")
+    print("-d, --data-path [FOLDER]\t path to data and configuration files")
+    print("-r, --reason [TEXT]\t\t the reason for numbers without one (default: Imported)")
+    print("-n, --column [N|NAME]\t\t the column containing the numbers (default: 0)")
+    print("-b, --batch-size [N]\t\t the number of rows inserted per batch (default: 10000)")
+    print("-m, --months [N]\t\t the months of call history for what-if (default: 3)")
+    print("-l, --limit [N]\t\t\t the max number of changed calls listed by what-if (default: 100)")
+    print("-h, --help\t\t\t displays this help text")
+
+
+def main(argv):
+    """
+    Performs an administrative command on the call attendant's database.
+        :param argv:
+            The command line arguments, e.g., --data-path [FOLDER] import-blacklist [FILE]
+    """
+    options, args = get_args(argv)
+    command = args[0]
+    filename = args[1] if len(args) > 1 else None
+
+    if filename is not None and not os.path.isfile(filename):
+        print("Error: file not found: {}".format(filename))
+        return 1
+
+    config = make_config(options["config"], options["data-path"])
+
+    if command == "import-blacklist":
+        import_blacklist_file(config, filename, options["reason"], options["column"], options["batch-size"])
+    elif command == "build-snapshot":
+        build_snapshot_file(config, filename, options["column"])
+    elif command == "what-if":
+        what_if(config, os.path.abspath(filename), options["months"], options["limit"])
+    elif command == "rebuild-stats":
+        rebuild_stats(config)
+    return 0
+
+
+if __name__ == '__main__':
+
+    sys.exit(main(sys.argv))
@@ -33,8 +33,11 @@ from pprint import pprint
 from shutil import copyfile
 
 from config import Config
+from screening.blacklist import Blacklist
 from screening.calllogger import CallLogger
 from screening.callscreener import CallScreener
+from screening.screeningtrace import ScreeningTrace
+from screening.expiry import ExpiryReaper
 from hardware.modem import Modem
 from hardware.indicators import ApprovedIndicator, BlockedIndicator
 from messaging.voicemail import VoiceMail
@@ -68,11 +71,11 @@ class CallAttendant(object):
         #  Hardware subsystem
         #  Initialize the visual indicators (LEDs)
         self.approved_indicator = ApprovedIndicator(
-                self.config.get("GPIO_LED_APPROVED_PIN"),
-                self.config.get("GPIO_LED_APPROVED_BRIGHTNESS", 100))
+            self.config.get("GPIO_LED_APPROVED_PIN"),
+            self.config.get("GPIO_LED_APPROVED_BRIGHTNESS", 100))
         self.blocked_indicator = BlockedIndicator(
-                self.config.get("GPIO_LED_BLOCKED_PIN"),
-                self.config.get("GPIO_LED_BLOCKED_BRIGHTNESS", 100))
+            self.config.get("GPIO_LED_BLOCKED_PIN"),
+            self.config.get("GPIO_LED_BLOCKED_BRIGHTNESS", 100))
         #  Create (and open) the modem
         self.modem = Modem(self.config)
         self.config["MODEM_ONLINE"] = self.modem.is_open  # signal the webapp not online
@@ -80,6 +83,15 @@ class CallAttendant(object):
         # Screening subsystem
         self.logger = CallLogger(self.db, self.config)
         self.screener = CallScreener(self.db, self.config)
+        if not self.config["BLOCK_BLOOM_FILTER"]:
+            # Remove the filter left from when it was enabled; it's rebuilt if re-enabled
+            Blacklist(self.db, self.config).remove_filter()
+        # Remove the temporary whitelist and blacklist entries when they expire.
+        # Skip if testing, because the reaper can't share a memory database.
+        self.reaper = None
+        if not self.config["TESTING"]:
+            self.reaper = ExpiryReaper(self.config['DB_FILE'], self.config)
+            self.reaper.start()
 
         # Messaging subsystem
         self.voice_mail = VoiceMail(self.db, self.config, self.modem)
@@ -89,7 +101,7 @@ class CallAttendant(object):
         # we use a memory database which can't be shared between threads.
         if not self.config["TESTING"]:
             print("Starting the Flask webapp")
-            webapp.start(self.config)
+            webapp.start(self.config, self.screener.service_status)
 
     def handle_caller(self, caller):
         """
@@ -112,6 +124,7 @@ class CallAttendant(object):
         """
         # Get relevant config settings
         screening_mode = self.config['SCREENING_MODE']
+        speculative_lookup = self.config['BLOCK_SERVICE_SPECULATIVE']
         blocked = self.config.get_namespace("BLOCKED_")
         screened = self.config.get_namespace("SCREENED_")
         permitted = self.config.get_namespace("PERMITTED_")
@@ -148,21 +161,44 @@ class CallAttendant(object):
                 caller_blocked = False
                 action = ""
                 reason = ""
+                trace = ScreeningTrace()
 
                 # Check the whitelist
                 if "whitelist" in screening_mode:
                     print("> Checking whitelist(s)")
-                    is_whitelisted, reason = self.screener.is_whitelisted(caller)
+                    is_whitelisted, reason = self.screener.is_whitelisted(caller, trace=trace)
                     if is_whitelisted:
                         caller_permitted = True
                         action = "Permitted"
                         self.approved_indicator.blink()
 
                 # Now check the blacklist if not preempted by whitelist
+                lookup = None
                 if not caller_permitted and "blacklist" in screening_mode:
                     print("> Checking blacklist(s)")
-                    is_blacklisted, reason = self.screener.is_blacklisted(caller)
+                    if speculative_lookup:
+                        # Check the local lists now and start the online lookup
+                        # so that it runs while we're counting the rings
+                        is_blacklisted, reason = self.screener.is_blacklisted(caller, check_service=False, trace=trace)
+                        if not is_blacklisted:
+                            lookup = self.screener.start_service_lookup(caller, trace)
+                    else:
+                        is_blacklisted, reason = self.screener.is_blacklisted(caller, trace=trace)
+                    if is_blacklisted:
+                        caller_blocked = True
+                        action = "Blocked"
+                        self.blocked_indicator.blink()
+
+                # Count rings until the earliest point that a blocked or screened
+                # caller might be answered, then get the online lookup result.
+                ok_to_answer = True
+                ring_count = 1
+                if lookup is not None:
+                    ring_count = max(1, min(blocked["rings_before_answer"], screened["rings_before_answer"]))
+                    ok_to_answer = self.wait_for_rings(ring_count)
+                    is_blacklisted, service_reason = self.screener.finish_service_lookup(lookup)
                     if is_blacklisted:
+                        reason = service_reason
                         caller_blocked = True
                         action = "Blocked"
                         self.blocked_indicator.blink()
@@ -172,8 +208,10 @@ class CallAttendant(object):
                     action = "Screened"
 
                 # Log every call to the database (and console)
-                call_no = self.logger.log_caller(caller, action, reason)
+                call_no = self.logger.log_caller(caller, action, reason, trace)
                 print("--> {} {}: {}".format(number, action, reason))
+                if self.config["DEBUG"]:
+                    print("--> Screened in {}us: {}".format(trace.total(), trace))
 
                 # Gather the data used to answer the call
                 if caller_permitted:
@@ -190,7 +228,8 @@ class CallAttendant(object):
                     rings_before_answer = blocked["rings_before_answer"]
 
                 # Waits for the callee to answer the phone, if configured to do so.
-                ok_to_answer = self.wait_for_rings(rings_before_answer)
+                if ok_to_answer:
+                    ok_to_answer = self.wait_for_rings(rings_before_answer, ring_count)
 
                 # Answer the call!
                 if ok_to_answer and "answer" in actions:
@@ -222,6 +261,12 @@ class CallAttendant(object):
         self.modem.stop()
         print("-> Stopping voice mail")
         self.voice_mail.stop()
+        print("-> Stopping call screener")
+        self.screener.close()
+        print("-> Writing the call log")
+        self.logger.close()
+        if self.reaper is not None:
+            self.reaper.stop()
         print("-> Releasing resources")
         self.approved_indicator.close()
         self.blocked_indicator.close()
@@ -273,11 +318,14 @@ class CallAttendant(object):
         """
         pass
 
-    def wait_for_rings(self, rings_before_answer):
+    def wait_for_rings(self, rings_before_answer, ring_count=1):
         """
         Waits for the given number of rings to occur.
         :param rings_before_answer:
             the number of rings to wait for.
+        :param ring_count:
+            the number of rings that have already occurred;
+            we've already had at least 1 ring to get here.
         :return:
             True if the ring count meets or exceeds the rings before answer;
             False if the rings stop or if another call comes in.
@@ -287,7 +335,6 @@ class CallAttendant(object):
         RING_CADENCE = 6.0  # secs
         RING_WAIT_SECS = RING_CADENCE + (RING_CADENCE * 0.5)
         ok_to_answer = True
-        ring_count = 1  # Already had at least 1 ring to get here
         last_ring = datetime.now()
         while ring_count < rings_before_answer:
             if not self._caller_queue.empty():
@@ -9,6 +9,7 @@
 
 import errno
 import os
+import re
 import types
 
 from tempfile import gettempdir
@@ -27,12 +28,38 @@ default_config = {
 
     "DATABASE": "callattendant.db",
     "SCREENING_MODE": ("whitelist", "blacklist"),
+    "SCREENING_IN_MEMORY": True,
 
     "PHONE_DISPLAY_SEPARATOR": "-",
     "PHONE_DISPLAY_FORMAT": "###-###-####",
+    "PHONE_COUNTRY_CODE": "1",
 
     "BLOCK_ENABLED": True,
     "BLOCK_SERVICE": "NOMOROBO",
+    "BLOCK_SERVICE_POLICY": "any",
+    "BLOCK_SERVICE_SPAMLIST_FILE": "spamlist.txt",
+    "BLOCK_SERVICE_SNAPSHOT_FILE": "spamsnapshot.bin",
+    "BLOCK_SERVICE_HTTP_URL": "",
+    "BLOCK_SERVICE_SPECULATIVE": False,
+    "BLOCK_SERVICE_CACHE_SIZE": 1000,
+    "BLOCK_SERVICE_CACHE_SPAM_TTL": 30 * 24 * 60 * 60,
+    "BLOCK_SERVICE_CACHE_NOT_SPAM_TTL": 24 * 60 * 60,
+    "BLOCK_SERVICE_TIMEOUT": 2.0,
+    "BLOCK_SERVICE_TIMEOUTS": {},
+    "BLOCK_SERVICE_BREAKER_THRESHOLD": 3,
+    "BLOCK_SERVICE_BREAKER_COOLDOWN": 300,
+
+    "BLOCK_BURST_CALLS": 0,
+    "BLOCK_BURST_WINDOW": 60,
+    "BLOCK_BURST_ACTION": "blacklist",
+    "BLOCK_BURST_MAX_NUMBERS": 10000,
+
+    "BLOCK_NEIGHBOR_SPOOF": False,
+    "BLOCK_NEIGHBOR_HOME_NUMBER": "",
+    "BLOCK_NEIGHBOR_THRESHOLD": 4,
+
+    "BLOCK_BLOOM_FILTER": False,
+    "BLOCK_BLOOM_FILTER_ERROR_RATE": 0.01,
 
     "BLOCK_NAME_PATTERNS": {"V[0-9]{15}": "Telemarketer Caller ID", },
     "BLOCK_NUMBER_PATTERNS": {},
@@ -142,6 +169,8 @@ class Config(dict):
             return
 
         self["DB_FILE"] = os.path.join(datapath, self["DATABASE"])
+        self["BLOCK_SERVICE_SPAMLIST_FILE"] = os.path.join(datapath, self["BLOCK_SERVICE_SPAMLIST_FILE"])
+        self["BLOCK_SERVICE_SNAPSHOT_FILE"] = os.path.join(datapath, self["BLOCK_SERVICE_SNAPSHOT_FILE"])
 
         self["BLOCKED_GREETING_FILE"] = os.path.join(rootpath, self["BLOCKED_GREETING_FILE"])
         self["SCREENED_GREETING_FILE"] = os.path.join(rootpath, self["SCREENED_GREETING_FILE"])
@@ -177,11 +206,75 @@ class Config(dict):
             print("* BLOCK_ENABLED should be a bool: {}".format(type(self["BLOCK_ENABLED"])))
             success = False
 
+        if not isinstance(self["BLOCK_SERVICE_SPECULATIVE"], bool):
+            print("* BLOCK_SERVICE_SPECULATIVE should be a bool: {}".format(type(self["BLOCK_SERVICE_SPECULATIVE"])))
+            success = False
+        if not isinstance(self["BLOCK_BLOOM_FILTER"], bool):
+            print("* BLOCK_BLOOM_FILTER should be a bool: {}".format(type(self["BLOCK_BLOOM_FILTER"])))
+            success = False
+        if not isinstance(self["BLOCK_BLOOM_FILTER_ERROR_RATE"], float) or \
+                not 0 < self["BLOCK_BLOOM_FILTER_ERROR_RATE"] < 1:
+            print("* BLOCK_BLOOM_FILTER_ERROR_RATE should be between 0 and 1: {}".format(
+                self["BLOCK_BLOOM_FILTER_ERROR_RATE"]))
+            success = False
+        if not isinstance(self["SCREENING_IN_MEMORY"], bool):
+            print("* SCREENING_IN_MEMORY should be a bool: {}".format(type(self["SCREENING_IN_MEMORY"])))
+            success = False
+
         for mode in self["SCREENING_MODE"]:
             if mode not in ("whitelist", "blacklist"):
                 print("* SCREENING_MODE option is invalid: {}".format(mode))
                 success = False
 
+        services = self["BLOCK_SERVICE"]
+        if isinstance(services, str):
+            services = [services]
+        if not isinstance(services, (list, tuple)):
+            print("* BLOCK_SERVICE should be a str or a list: {}".format(type(services)))
+            success = False
+        elif "HTTP" in [name.upper() for name in services] and not self["BLOCK_SERVICE_HTTP_URL"]:
+            print("* BLOCK_SERVICE_HTTP_URL is required by the HTTP service")
+            success = False
+        if self["BLOCK_SERVICE_POLICY"] not in ("any", "majority", "all"):
+            print("* BLOCK_SERVICE_POLICY option is invalid: {}".format(self["BLOCK_SERVICE_POLICY"]))
+            success = False
+
+        for key in ("BLOCK_NAME_PATTERNS", "BLOCK_NUMBER_PATTERNS", "PERMIT_NAME_PATTERNS", "PERMIT_NUMBER_PATTERNS"):
+            if not self._validate_patterns(key):
+                success = False
+
+        if not isinstance(self["BLOCK_NEIGHBOR_SPOOF"], bool):
+            print("* BLOCK_NEIGHBOR_SPOOF should be a bool: {}".format(type(self["BLOCK_NEIGHBOR_SPOOF"])))
+            success = False
+        if self["BLOCK_NEIGHBOR_SPOOF"] and not re.match(r"^1?[0-9]{10}$", self["BLOCK_NEIGHBOR_HOME_NUMBER"]):
+            print("* BLOCK_NEIGHBOR_HOME_NUMBER should be a 10 digit number: {}".format(
+                self["BLOCK_NEIGHBOR_HOME_NUMBER"]))
+            success = False
+
+        if self["BLOCK_BURST_ACTION"] not in ("blacklist", "block", "screen"):
+            print("* BLOCK_BURST_ACTION option is invalid: {}".format(self["BLOCK_BURST_ACTION"]))
+            success = False
+
+        for key in ("BLOCK_SERVICE_CACHE_SIZE", "BLOCK_SERVICE_CACHE_SPAM_TTL", "BLOCK_SERVICE_CACHE_NOT_SPAM_TTL",
+                    "BLOCK_SERVICE_BREAKER_THRESHOLD", "BLOCK_BURST_CALLS", "BLOCK_NEIGHBOR_THRESHOLD"):
+            if not isinstance(self[key], int):
+                print("* {} should be an integer: {}".format(key, type(self[key])))
+                success = False
+        timeouts = self["BLOCK_SERVICE_TIMEOUTS"]
+        if not isinstance(timeouts, dict):
+            print("* BLOCK_SERVICE_TIMEOUTS must be a dict, not {}".format(type(timeouts)))
+            success = False
+        else:
+            for name, timeout in timeouts.items():
+                if not isinstance(timeout, (int, float)) or timeout <= 0:
+                    print("* BLOCK_SERVICE_TIMEOUTS[{}] should be a positive number: {}".format(name, timeout))
+                    success = False
+        for key in ("BLOCK_SERVICE_TIMEOUT", "BLOCK_SERVICE_BREAKER_COOLDOWN",
+                    "BLOCK_BURST_WINDOW", "BLOCK_BURST_MAX_NUMBERS"):
+            if not isinstance(self[key], (int, float)) or self[key] <= 0:
+                print("* {} should be a positive number: {}".format(key, self[key]))
+                success = False
+
         if not self._validate_actions("BLOCKED_ACTIONS"):
             success = False
         if not self._validate_actions("SCREENED_ACTIONS"):
@@ -196,7 +289,8 @@ class Config(dict):
             print("* SCREENED_RINGS_BEFORE_ANSWER should be an integer: {}".format(type(self["SCREENED_RINGS_BEFORE_ANSWER"])))
             success = False
         if not isinstance(self["PERMITTED_RINGS_BEFORE_ANSWER"], int):
-            print("* PERMITTED_RINGS_BEFORE_ANSWER should be an integer: {}".format(type(self["PERMITTED_RINGS_BEFORE_ANSWER"])))
+            print("* PERMITTED_RINGS_BEFORE_ANSWER should be an integer: {}".format(
+                type(self["PERMITTED_RINGS_BEFORE_ANSWER"])))
             success = False
 
         filepath = self["BLOCKED_GREETING_FILE"]
@@ -236,13 +330,35 @@ class Config(dict):
         if not os.path.exists(filepath):
             print("* VOICE_MAIL_MESSAGE_FOLDER not found: {}".format(filepath))
             success = False
+        if not re.match(r"^[0-9]{1,3}$", str(self["PHONE_COUNTRY_CODE"])):
+            print("* PHONE_COUNTRY_CODE should be a 1 to 3 digit calling code: {}".format(self["PHONE_COUNTRY_CODE"]))
+            success = False
 
         # Warnings
         if not self["PHONE_DISPLAY_SEPARATOR"] in self["PHONE_DISPLAY_FORMAT"]:
-            print("* WARNING: PHONE_DISPLAY_SEPARATOR not used in PHONE_DISPLAY_FORMAT: '{}'".format(self["PHONE_DISPLAY_SEPARATOR"]))
+            print("* WARNING: PHONE_DISPLAY_SEPARATOR not used in PHONE_DISPLAY_FORMAT: '{}'".format(
+                self["PHONE_DISPLAY_SEPARATOR"]))
 
         return success
 
+    def _validate_patterns(self, key):
+        """
+        :param key:
+            String: "BLOCK_NAME_PATTERNS", "PERMIT_NUMBER_PATTERNS", etc.
+        """
+        if not isinstance(self[key], dict):
+            print("* {} must be a dict, not {}".format(key, type(self[key])))
+            return False
+
+        for pattern in self[key].keys():
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                print("* {} contains an invalid pattern: '{}': {}".format(key, pattern, e))
+                return False
+
+        return True
+
     def _validate_actions(self, key):
         """
         :param key:
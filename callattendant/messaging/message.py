@@ -27,6 +27,8 @@ import os
 from pprint import pprint
 from datetime import datetime
 
+from migrations import migrate
+
 
 global unplayed_count
 unplayed_count = 0
@@ -53,17 +55,7 @@ class Message:
 
         # Create the message table if it does not exist
         if self.db:
-            sql = """
-                CREATE TABLE IF NOT EXISTS Message (
-                    MessageID INTEGER PRIMARY KEY AUTOINCREMENT,
-                    CallLogID INTEGER,
-                    Played BOOLEAN DEFAULT 0 NOT NULL CHECK (Played IN (0,1)),
-                    Filename TEXT,
-                    DateTime TEXT,
-                    FOREIGN KEY(CallLogID) REFERENCES CallLog(CallLogID));"""
-            curs = self.db.cursor()
-            curs.executescript(sql)
-            curs.close()
+            migrate(self.db, self.config)
 
         self._update_unplayed_count()
 
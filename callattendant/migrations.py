@@ -0,0 +1,419 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  migrations.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+# ==============================================================================
+# The database schema is versioned with SQLite's PRAGMA user_version, which is
+# 0 in a new database and in the databases created by versions of callattendant
+# that preceded this module. Each migration step upgrades the schema from the
+# previous version, so a new database runs all of the steps and an existing
+# database only runs the steps it hasn't seen. Once the schema is current,
+# starting up only reads the pragma.
+#
+# To change the schema, append a new step; never modify a released step.
+# ==============================================================================
+
+from screening.normalize import canonical_number
+
+# The number of rows updated per transaction when backfilling a new column
+BACKFILL_BATCH_SIZE = 5000
+
+
+def get_version(db):
+    """
+    Returns the schema version of the database.
+        :param db: the database connection
+    """
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(db, config):
+    """
+    Upgrades the database schema to the current version. Each step runs
+    in a transaction together with the update of the version, so a failed
+    step is rolled back and retried the next time. The steps that convert
+    a large table commit it in batches instead, see backfill; they can be
+    interrupted and rerun, and run by two connections at once, e.g., the
+    call attendant and the web app, since the work done is skipped and
+    rechecked under the write lock. The version is never set back by a
+    step that another connection finished first.
+        :param db: the database connection
+        :param config: the application config dict
+        :return: the schema version
+    """
+    version = get_version(db)
+    while version < SCHEMA_VERSION:
+        step = MIGRATIONS[version]
+        # Take the write lock before checking the version again, as
+        # another connection, e.g., the web app, may be migrating it
+        begin_write(db)
+        try:
+            if get_version(db) == version:
+                print(">> Upgrading the database to version {}: {}".format(
+                    version + 1, step.__doc__.strip().splitlines()[0]))
+                step(db, config)
+                # A step that committed in batches has released the lock
+                if not db.in_transaction:
+                    db.execute("BEGIN IMMEDIATE")
+                if get_version(db) == version:
+                    db.execute("PRAGMA user_version = {}".format(version + 1))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        version = get_version(db)
+    return version
+
+
+def begin_write(db):
+    """
+    Commits the current transaction, if any, and begins a new one
+    holding the write lock, so that no other connection can change
+    the database until it's committed.
+        :param db: the database connection
+    """
+    if db.in_transaction:
+        db.commit()
+    db.execute("BEGIN IMMEDIATE")
+
+
+def get_columns(db, table):
+    """Returns the names of the table's columns"""
+    curs = db.execute("PRAGMA table_info({})".format(table))
+    columns = [row[1] for row in curs.fetchall()]
+    curs.close()
+    return columns
+
+
+def add_column(db, table, column, column_type="TEXT"):
+    """
+    Adds a column to a table unless it already exists, e.g., it was
+    added by a step that was interrupted.
+        :return: True if the column was added
+    """
+    if column in get_columns(db, table):
+        return False
+    db.execute("ALTER TABLE {} ADD COLUMN {} {}".format(table, column, column_type))
+    return True
+
+
+def backfill(db, table, column, source, convert, batch_size=BACKFILL_BATCH_SIZE):
+    """
+    Fills in a new column from another column, in batches of rows, each
+    committed in its own transaction so that the call attendant and the
+    web app aren't locked out while a large table is updated. The rows
+    that have been filled in are skipped if it's interrupted and rerun,
+    or if another connection is filling them in at the same time.
+        :param db: the database connection
+        :param table: the table
+        :param column: the column to be filled in
+        :param source: the column it's computed from
+        :param convert: a function that computes the value from the source
+        :param batch_size: the number of rows updated per transaction
+        :return: the number of rows updated
+    """
+    select = "SELECT rowid, {} FROM {} WHERE rowid > ? AND {} IS NULL ORDER BY rowid LIMIT ?".format(
+        source, table, column)
+    update = "UPDATE {} SET {}=? WHERE rowid=?".format(table, column)
+    count = 0
+    last_rowid = 0
+    while True:
+        rows = db.execute(select, (last_rowid, batch_size)).fetchall()
+        if not rows:
+            return count
+        db.executemany(update, [(convert(value), rowid) for rowid, value in rows])
+        db.commit()
+        count += len(rows)
+        last_rowid = rows[-1][0]
+
+
+def _create_tables(db, config):
+    """
+    Create the tables.
+    These are the tables of the unversioned schema; the databases created
+    by earlier versions already have them.
+    """
+    db.execute("""CREATE TABLE IF NOT EXISTS CallLog (
+        CallLogID INTEGER PRIMARY KEY AUTOINCREMENT,
+        Name TEXT,
+        Number TEXT,
+        Action TEXT,
+        Reason TEXT,
+        Date TEXT,
+        Time TEXT,
+        SystemDateTime TEXT)""")
+    for table in ("Whitelist", "Blacklist"):
+        db.execute("""CREATE TABLE IF NOT EXISTS {} (
+            PhoneNo TEXT PRIMARY KEY,
+            Name TEXT,
+            Reason TEXT,
+            SystemDateTime TEXT)""".format(table))
+    db.execute("""CREATE TABLE IF NOT EXISTS Message (
+        MessageID INTEGER PRIMARY KEY AUTOINCREMENT,
+        CallLogID INTEGER,
+        Played BOOLEAN DEFAULT 0 NOT NULL CHECK (Played IN (0,1)),
+        Filename TEXT,
+        DateTime TEXT,
+        FOREIGN KEY(CallLogID) REFERENCES CallLog(CallLogID))""")
+
+
+def _add_call_log_action(db, config):
+    """
+    Add the CallLog Action and Reason columns.
+    Early versions of callattendant (<= v0.3.1) do not contain these columns;
+    they're derived from the lists, matching the numbers in any format.
+    """
+    if "Action" in get_columns(db, "CallLog"):
+        return
+    add_column(db, "CallLog", "Action", "TEXT default null")
+    add_column(db, "CallLog", "Reason", "TEXT default null")
+    country_code = str(config.get("PHONE_COUNTRY_CODE", "1"))
+
+    def read_list(table):
+        curs = db.execute("SELECT PhoneNo, Reason FROM {}".format(table))
+        entries = {canonical_number(number, country_code): reason for number, reason in curs.fetchall()}
+        curs.close()
+        return entries
+
+    permitted = read_list("Whitelist")
+    blocked = read_list("Blacklist")
+    updates = []
+    for call_no, number in db.execute("SELECT CallLogID, Number FROM CallLog").fetchall():
+        key = canonical_number(number, country_code)
+        if key in permitted:
+            updates.append(("Permitted", permitted[key], call_no))
+        elif key in blocked:
+            updates.append(("Blocked", blocked[key], call_no))
+        else:
+            updates.append(("Screened", None, call_no))
+    db.executemany("UPDATE CallLog SET Action=?, Reason=? WHERE CallLogID=?", updates)
+
+
+def _create_screening_tables(db, config):
+    """
+    Create the blocked range, name rule, lookup cache and screening trace tables.
+    """
+    db.execute("""CREATE TABLE IF NOT EXISTS BlockedRange (
+        RangeID INTEGER PRIMARY KEY AUTOINCREMENT,
+        LowNo TEXT NOT NULL,
+        HighNo TEXT NOT NULL,
+        Reason TEXT,
+        SystemDateTime TEXT)""")
+    db.execute("""CREATE TABLE IF NOT EXISTS NameRules (
+        RuleID INTEGER PRIMARY KEY AUTOINCREMENT,
+        Keyword TEXT NOT NULL,
+        Reason TEXT,
+        SystemDateTime TEXT)""")
+    db.execute("""CREATE TABLE IF NOT EXISTS LookupCache (
+        Service TEXT,
+        PhoneNo TEXT,
+        Spam BOOLEAN,
+        Score INTEGER,
+        Reason TEXT,
+        Expires INTEGER,
+        PRIMARY KEY(Service, PhoneNo))""")
+    db.execute("""CREATE TABLE IF NOT EXISTS ScreeningTrace (
+        CallLogID INTEGER,
+        Seq INTEGER,
+        Stage TEXT,
+        Matched INTEGER,
+        Reason TEXT,
+        Elapsed INTEGER,
+        PRIMARY KEY (CallLogID, Seq))""")
+
+
+def _add_expires(db, config):
+    """
+    Add the Whitelist and Blacklist Expires columns.
+    """
+    add_column(db, "Whitelist", "Expires")
+    add_column(db, "Blacklist", "Expires")
+
+
+def _add_normalized_numbers(db, config):
+    """
+    Add the indexed NormalizedNo columns to the lists and the call log.
+    The numbers are converted to E.164, e.g., +18055551234, for lookups.
+    """
+    country_code = str(config.get("PHONE_COUNTRY_CODE", "1"))
+
+    def convert(number):
+        return canonical_number(number, country_code)
+
+    for table, source in (("Whitelist", "PhoneNo"), ("Blacklist", "PhoneNo"), ("CallLog", "Number")):
+        begin_write(db)
+        add_column(db, table, "NormalizedNo")
+        db.commit()
+        backfill(db, table, "NormalizedNo", source, convert)
+        db.execute("CREATE INDEX IF NOT EXISTS idx_{0}_NormalizedNo ON {0}(NormalizedNo)".format(table))
+
+
+def _add_indexes(db, config):
+    """
+    Add the indexes used by the web app's pages.
+    The recent calls and the calls per day are read from the SystemDateTime
+    index; the totals and the top callers from the Action index, which
+    covers the columns they use; the messages are joined on the CallLogID.
+    """
+    db.execute("CREATE INDEX IF NOT EXISTS idx_CallLog_SystemDateTime ON CallLog(SystemDateTime, Action)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_CallLog_Action ON CallLog(Action, Number, Name)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_Message_CallLogID ON Message(CallLogID)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_Message_DateTime ON Message(DateTime)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_Message_Played ON Message(Played)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_Whitelist_SystemDateTime ON Whitelist(SystemDateTime)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_Blacklist_SystemDateTime ON Blacklist(SystemDateTime)")
+
+
+def _compact_call_log(db, config):
+    """
+    Rebuild the CallLog with integer times, action codes and numbers.
+    The formatted Date, Time and SystemDateTime columns are replaced by the
+    CallTime in seconds since the epoch; the Action by a code, see
+    screening.calllogger.ACTIONS; and the NormalizedNo by the digits of the
+    E.164 number as an integer. The rows are copied in batches to a new
+    table, which replaces the old one in the last batch's transaction.
+    """
+    # The rows copied by an interrupted run are skipped
+    copy = """INSERT INTO CallLog_new(CallLogID, Name, Number, NormalizedNo, Action, Reason, CallTime)
+        SELECT CallLogID, Name, Number,
+            CASE WHEN NormalizedNo GLOB '+[0-9]*' THEN CAST(substr(NormalizedNo, 2) AS INTEGER)
+                ELSE NormalizedNo END,
+            CASE Action WHEN 'Permitted' THEN 1 WHEN 'Blocked' THEN 2 WHEN 'Screened' THEN 3 END,
+            Reason,
+            CAST(strftime('%s', substr(SystemDateTime, 1, 19), 'utc') AS INTEGER)
+        FROM CallLog
+        WHERE CallLogID > (SELECT IFNULL(MAX(CallLogID), 0) FROM CallLog_new)
+        ORDER BY CallLogID"""
+    while True:
+        # Check under the write lock, as another connection may have finished it
+        begin_write(db)
+        if "CallTime" in get_columns(db, "CallLog"):
+            return
+        db.execute("""CREATE TABLE IF NOT EXISTS CallLog_new (
+            CallLogID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Name TEXT,
+            Number TEXT,
+            NormalizedNo INTEGER,
+            Action INTEGER,
+            Reason TEXT,
+            CallTime INTEGER)""")
+        count = db.execute(copy + " LIMIT ?", (BACKFILL_BATCH_SIZE,)).rowcount
+        if count < BACKFILL_BATCH_SIZE:
+            break
+        db.commit()
+
+    # Swap the tables in the last batch's transaction, keeping the
+    # AUTOINCREMENT sequence, so the IDs of deleted calls aren't reused
+    seq = db.execute("""SELECT MAX(
+        IFNULL((SELECT seq FROM sqlite_sequence WHERE name='CallLog'), 0),
+        IFNULL((SELECT MAX(CallLogID) FROM CallLog_new), 0))""").fetchone()[0]
+    db.execute("DROP TABLE CallLog")
+    db.execute("ALTER TABLE CallLog_new RENAME TO CallLog")
+    db.execute("DELETE FROM sqlite_sequence WHERE name='CallLog'")
+    db.execute("INSERT INTO sqlite_sequence(name, seq) VALUES('CallLog', ?)", (seq,))
+    db.execute("CREATE INDEX IF NOT EXISTS idx_CallLog_NormalizedNo ON CallLog(NormalizedNo)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_CallLog_CallTime ON CallLog(CallTime, Action)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_CallLog_Action ON CallLog(Action, Number, Name)")
+
+
+def _add_call_stats_daily(db, config):
+    """
+    Add the CallStatsDaily rollup of the number of calls per day and action.
+    It's maintained by triggers on the CallLog, whichever connection logs
+    the call, so the dashboard's totals and graph read a row per day and
+    action instead of counting the whole call log. The CallDate is the
+    local date of the CallTime; calls without a time or an action are
+    counted under '' and 0.
+    """
+    db.execute("""CREATE TABLE IF NOT EXISTS CallStatsDaily (
+        CallDate TEXT NOT NULL,
+        Action INTEGER NOT NULL,
+        Count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (CallDate, Action))""")
+    increment = """
+        INSERT OR IGNORE INTO CallStatsDaily(CallDate, Action)
+            VALUES(IFNULL(date(NEW.CallTime, 'unixepoch', 'localtime'), ''), IFNULL(NEW.Action, 0));
+        UPDATE CallStatsDaily SET Count = Count + 1
+            WHERE CallDate = IFNULL(date(NEW.CallTime, 'unixepoch', 'localtime'), '')
+            AND Action = IFNULL(NEW.Action, 0);"""
+    decrement = """
+        UPDATE CallStatsDaily SET Count = Count - 1
+            WHERE CallDate = IFNULL(date(OLD.CallTime, 'unixepoch', 'localtime'), '')
+            AND Action = IFNULL(OLD.Action, 0);"""
+    db.execute("""CREATE TRIGGER IF NOT EXISTS CallStatsDaily_Insert AFTER INSERT ON CallLog
+        BEGIN {} END""".format(increment))
+    db.execute("""CREATE TRIGGER IF NOT EXISTS CallStatsDaily_Delete AFTER DELETE ON CallLog
+        BEGIN {} END""".format(decrement))
+    db.execute("""CREATE TRIGGER IF NOT EXISTS CallStatsDaily_Update AFTER UPDATE OF CallTime, Action ON CallLog
+        BEGIN {} {} END""".format(decrement, increment))
+    db.execute("DELETE FROM CallStatsDaily")
+    db.execute("""INSERT INTO CallStatsDaily(CallDate, Action, Count)
+        SELECT IFNULL(date(CallTime, 'unixepoch', 'localtime'), ''), IFNULL(Action, 0), COUNT(*)
+        FROM CallLog GROUP BY 1, 2""")
+
+
+def _unique_list_numbers(db, config):
+    """
+    Make the Whitelist and Blacklist NormalizedNo the unique key.
+    The duplicate entries of a number, e.g., added as "1-800-555-1212" and
+    "8005551212", are merged, keeping the latest. The lists are also indexed
+    on their CallLog NormalizedNo (see screening.calllogger.list_join),
+    so the call log is joined with the lists on the normalized numbers.
+    """
+    for table in ("Whitelist", "Blacklist"):
+        db.execute("""DELETE FROM {0} WHERE NormalizedNo IS NOT NULL AND rowid NOT IN (
+            SELECT MAX(rowid) FROM {0} GROUP BY NormalizedNo)""".format(table))
+        db.execute("DROP INDEX IF EXISTS idx_{}_NormalizedNo".format(table))
+        db.execute("CREATE UNIQUE INDEX idx_{0}_NormalizedNo ON {0}(NormalizedNo)".format(table))
+        db.execute("""CREATE INDEX IF NOT EXISTS idx_{0}_CallLogNo ON {0}(
+            CASE WHEN ltrim(NormalizedNo, '+') GLOB '[0-9]*' THEN CAST(ltrim(NormalizedNo, '+') AS INTEGER)
+                ELSE NormalizedNo END)""".format(table))
+
+
+def _add_expires_indexes(db, config):
+    """
+    Add the Whitelist and Blacklist Expires indexes.
+    The expiry reaper loads the pending expiries when a list is changed;
+    most entries never expire, so only those with an Expires value are indexed.
+    """
+    for table in ("Whitelist", "Blacklist"):
+        db.execute("CREATE INDEX IF NOT EXISTS idx_{0}_Expires ON {0}(Expires) WHERE Expires IS NOT NULL".format(table))
+
+
+# The migration steps, in order; the schema version is the number of steps applied
+MIGRATIONS = [
+    _create_tables,
+    _add_call_log_action,
+    _create_screening_tables,
+    _add_expires,
+    _add_normalized_numbers,
+    _add_indexes,
+    _compact_call_log,
+    _add_call_stats_daily,
+    _unique_list_numbers,
+    _add_expires_indexes,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
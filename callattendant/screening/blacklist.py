@@ -29,9 +29,15 @@
 # https://iotbytes.wordpress.com/incoming-call-details-logger-with-raspberry-pi/
 # ==============================================================================
 
+import os
 from datetime import datetime
 from pprint import pprint
+from migrations import migrate
+from screening.bloomfilter import BloomFilter
 from screening.query_db import query_db
+from screening.expiry import format_expires, now_string
+from screening.normalize import canonical_number
+from screening.tablechanges import notify_change
 
 
 class Blacklist(object):
@@ -44,16 +50,13 @@ class Blacklist(object):
         if self.config["DEBUG"]:
             print("Initializing Blacklist")
 
-        sql = '''
-            CREATE TABLE IF NOT EXISTS Blacklist (
-                PhoneNo TEXT PRIMARY KEY,
-                Name TEXT,
-                Reason TEXT,
-                SystemDateTime TEXT);
-            '''
-        curs = self.db.cursor()
-        curs.executescript(sql)
-        curs.close()
+        migrate(self.db, self.config)
+        self._country_code = str(self.config.get("PHONE_COUNTRY_CODE", "1"))
+
+        self._filter = None
+        self._filter_file = self._get_filter_filename()
+        if self._filter_file and self.config.get("BLOCK_BLOOM_FILTER"):
+            self._open_filter(rebuild_if_missing=True)
 
         if self.config["TESTING"]:
             # Add a record to the test db;
@@ -70,28 +73,39 @@ class Blacklist(object):
         if self.config["DEBUG"]:
             print("Blacklist initialized")
 
-    def add_caller(self, callerid, reason=""):
+    def add_caller(self, callerid, reason="", expires=None):
         """
         Add a caller to the blocked list.
             :param caller: a dict with caller ID information
             :param reason: an optional string indicating the
                 reason this caller was added
+            :param expires: an optional datetime, or number of hours
+                from now, when the entry is removed
             :return: True if successful
         """
         query = '''INSERT INTO Blacklist(
             PhoneNo,
             Name,
             Reason,
-            SystemDateTime) VALUES(?,?,?,?)'''
+            SystemDateTime,
+            Expires,
+            NormalizedNo) VALUES(?,?,?,?,?,?)'''
         arguments = [
             callerid['NMBR'],
             callerid['NAME'],
             reason,
-            (datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:19])
+            (datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:19]),
+            format_expires(expires),
+            self.normalize(callerid['NMBR'])
         ]
         try:
+            # Replace an expired entry that the reaper hasn't removed yet
+            self.db.execute("DELETE FROM Blacklist WHERE NormalizedNo=? AND Expires<=?", (arguments[5], now_string()))
             self.db.execute(query, arguments)
             self.db.commit()
+            notify_change("Blacklist", arguments[5])
+            if self._filter is not None:
+                self._add_to_filter(arguments[5])
             if self.config["DEBUG"]:
                 print("New blacklist entry added")
                 pprint(arguments)
@@ -110,9 +124,9 @@ class Blacklist(object):
         """
         sql = """UPDATE Blacklist
             SET Name=:name, Reason=:reason, SystemDateTime=:time
-            WHERE PhoneNo=:phone_no"""
+            WHERE NormalizedNo=:number"""
         arguments = {
-            'phone_no': phone_no,
+            'number': self.normalize(phone_no),
             "name": name,
             "reason": reason,
             "time": (datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:19])
@@ -120,6 +134,7 @@ class Blacklist(object):
         try:
             self.db.execute(sql, arguments)
             self.db.commit()
+            notify_change("Blacklist", arguments['number'])
         except Exception as e:
             print("** Failed to update caller in blacklist:")
             pprint(e)
@@ -132,11 +147,12 @@ class Blacklist(object):
 
     def remove_number(self, phone_no):
         '''Removes records for the given number (without dashes or formatting)'''
-        query = 'DELETE FROM Blacklist WHERE PhoneNo=:phone_no'
-        arguments = {'phone_no': phone_no}
+        query = 'DELETE FROM Blacklist WHERE NormalizedNo=:number'
+        arguments = {'number': self.normalize(phone_no)}
         try:
             self.db.execute(query, arguments)
             self.db.commit()
+            notify_change("Blacklist", arguments['number'])
         except Exception as e:
             print("** Failed to delete caller from blacklist:")
             pprint(e)
@@ -146,22 +162,134 @@ class Blacklist(object):
             pprint(arguments)
         return True
 
+    def set_expires(self, phone_no, expires):
+        """
+        Sets or clears the expiry of the entry for the given number
+        :param phone_no: phone number (key) without dashes or formatting
+        :param expires: a datetime, or number of hours from now, when
+            the entry is removed; or None if it never expires
+        """
+        sql = "UPDATE Blacklist SET Expires=:expires WHERE NormalizedNo=:number"
+        arguments = {"number": self.normalize(phone_no), "expires": format_expires(expires)}
+        try:
+            self.db.execute(sql, arguments)
+            self.db.commit()
+            notify_change("Blacklist", arguments["number"])
+        except Exception as e:
+            print("** Failed to set the expiry in blacklist:")
+            pprint(e)
+            return False
+        return True
+
     def check_number(self, number):
         """
         Checks if the number is in the blacklist
             :parma number: the number to look for
             :returns: True if found; and a string containing the reason
         """
-        query = "SELECT Reason FROM Blacklist WHERE PhoneNo=:number"
-        args = {"number": number}
+        if not self.may_contain(number):
+            # Definitely not in the blacklist; skip the query
+            return False, ""
+
+        query = """SELECT Reason FROM Blacklist WHERE NormalizedNo=:number
+            AND (Expires IS NULL OR Expires > :now)"""
+        args = {"number": self.normalize(number), "now": now_string()}
         results = query_db(self.db, query, args, False)
         if len(results) > 0:
             return True, results[0][0]
         else:
             return False, ""
 
+    def normalize(self, number):
+        """Returns the canonical form of the number used as the lookup key"""
+        return canonical_number(number, self._country_code)
+
     def get_number(self, number):
-        query = "SELECT * FROM Blacklist WHERE PhoneNo = ?"
-        args = (number,)
+        query = "SELECT * FROM Blacklist WHERE NormalizedNo = ?"
+        args = (self.normalize(number),)
         results = query_db(self.db, query, args, False)
         return results
+
+    def may_contain(self, number):
+        """
+        Checks the bloom filter, if in use, for the number.
+            :param number: the number to look for
+            :returns: False if the number is definitely not in the blacklist
+        """
+        return self._filter is None or self._filter_contains(self.normalize(number))
+
+    def rebuild_filter(self):
+        """
+        Rebuilds the bloom filter file from the Blacklist table, e.g., after
+        a bulk import. Does nothing if the filter is not in use.
+        """
+        if self._filter is None:
+            return
+        self._filter.close()
+        self._filter = None
+        self._open_filter(rebuild=True)
+
+    def remove_filter(self):
+        """
+        Removes the bloom filter file, e.g., at startup when the filter is
+        disabled, so that a stale filter isn't used if it's enabled again.
+        """
+        if self._filter is not None:
+            self._filter.close()
+            self._filter = None
+        if self._filter_file and os.path.exists(self._filter_file):
+            os.remove(self._filter_file)
+
+    def _get_filter_filename(self):
+        """Returns the filter file next to the database, or None for a memory db"""
+        curs = self.db.execute("PRAGMA database_list")
+        db_file = curs.fetchone()[2]
+        curs.close()
+        return db_file + ".bloom" if db_file else None
+
+    def _open_filter(self, rebuild=False, rebuild_if_missing=False):
+        if not rebuild:
+            try:
+                self._filter = BloomFilter(self._filter_file)
+                return
+            except (OSError, ValueError):
+                if not rebuild_if_missing:
+                    return
+        count = query_db(self.db, "SELECT COUNT(*) FROM Blacklist", (), True)[0]
+        curs = self.db.execute("SELECT NormalizedNo FROM Blacklist")
+        try:
+            self._filter = BloomFilter.create(
+                self._filter_file,
+                capacity=max(2 * count, 100000),
+                error_rate=self.config.get("BLOCK_BLOOM_FILTER_ERROR_RATE", 0.01),
+                numbers=(row[0] for row in curs))
+        finally:
+            curs.close()
+        if self.config["DEBUG"]:
+            print("Blacklist filter built: {} numbers, {} bytes".format(count, self._filter.size))
+
+    def _refresh_filter(self):
+        """Reopens the filter if it was rebuilt by another connection or process"""
+        try:
+            inode = os.stat(self._filter_file).st_ino
+        except OSError:
+            inode = None
+        if inode != self._filter.inode:
+            self._filter.close()
+            self._filter = None
+            if inode is not None:
+                self._open_filter()
+        return self._filter is not None
+
+    def _filter_contains(self, number):
+        if not self._refresh_filter():
+            return True
+        return number in self._filter
+
+    def _add_to_filter(self, number):
+        if not self._refresh_filter():
+            return
+        self._filter.add(number)
+        if self._filter.count > self._filter.capacity:
+            # The false positive rate is growing; resize the filter
+            self.rebuild_filter()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  blockedranges.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+from datetime import datetime
+from pprint import pprint
+from migrations import migrate
+from screening.normalize import national_number
+from screening.query_db import query_db
+from screening.tablechanges import notify_change
+
+
+class BlockedRanges(object):
+    """
+    Blocks ranges of numbers by prefix, e.g., an area code and exchange.
+    A range is a pair of digit strings of equal length, LowNo and HighNo;
+    a number is in the range if the leading digits of its national number,
+    e.g., 8005551212 for 1-800-555-1212, are between the two. For example,
+    800-800 blocks all numbers starting with 800, and 212555-212559 blocks
+    the 212-555 through 212-559 exchanges.
+    """
+
+    def __init__(self, db, config):
+        """Ensures database access to the BlockedRange table"""
+        self.db = db
+        self.config = config
+
+        if self.config["DEBUG"]:
+            print("Initializing BlockedRanges")
+
+        migrate(self.db, self.config)
+        self._country_code = str(self.config.get("PHONE_COUNTRY_CODE", "1"))
+
+        if self.config["DEBUG"]:
+            print("BlockedRanges initialized")
+
+    @staticmethod
+    def validate_range(low, high):
+        """
+        Checks that the range is a pair of digit strings of equal length.
+            :return: True if valid; and a string containing the error, if any
+        """
+        if not low.isdigit() or not high.isdigit():
+            return False, "The range must contain digits only"
+        if len(low) != len(high):
+            return False, "The low and high numbers must be the same length"
+        if low > high:
+            return False, "The low number must not be greater than the high number"
+        return True, ""
+
+    def add_range(self, low, high, reason=""):
+        """
+        Adds a range of numbers to be blocked.
+            :param low: the low prefix, e.g., "212555"
+            :param high: the high prefix, e.g., "212559"
+            :param reason: an optional string indicating the
+                reason the range was added
+            :return: True if successful
+        """
+        valid, error = self.validate_range(low, high)
+        if not valid:
+            print("** Failed to add range to blocked ranges: {}".format(error))
+            return False
+
+        query = '''INSERT INTO BlockedRange(
+            LowNo,
+            HighNo,
+            Reason,
+            SystemDateTime) VALUES(?,?,?,?)'''
+        arguments = [
+            low,
+            high,
+            reason,
+            (datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:19])
+        ]
+        try:
+            self.db.execute(query, arguments)
+            self.db.commit()
+            notify_change("BlockedRange")
+            if self.config["DEBUG"]:
+                print("New blocked range added")
+                pprint(arguments)
+        except Exception as e:
+            print("** Failed to add range to blocked ranges:")
+            pprint(e)
+            return False
+        return True
+
+    def update_range(self, range_id, low, high, reason):
+        """
+        Updates the record for the given range
+        :param range_id: the range ID (key)
+        :param low: new low prefix
+        :param high: new high prefix
+        :param reason: new reason
+        """
+        valid, error = self.validate_range(low, high)
+        if not valid:
+            print("** Failed to update blocked range: {}".format(error))
+            return False
+
+        sql = """UPDATE BlockedRange
+            SET LowNo=:low, HighNo=:high, Reason=:reason, SystemDateTime=:time
+            WHERE RangeID=:range_id"""
+        arguments = {
+            "range_id": range_id,
+            "low": low,
+            "high": high,
+            "reason": reason,
+            "time": (datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:19])
+            }
+        try:
+            self.db.execute(sql, arguments)
+            self.db.commit()
+            notify_change("BlockedRange")
+        except Exception as e:
+            print("** Failed to update blocked range:")
+            pprint(e)
+            return False
+
+        if self.config["DEBUG"]:
+            print("Blocked range updated")
+            pprint(arguments)
+        return True
+
+    def remove_range(self, range_id):
+        '''Removes the record for the given range ID'''
+        query = 'DELETE FROM BlockedRange WHERE RangeID=:range_id'
+        arguments = {'range_id': range_id}
+        try:
+            self.db.execute(query, arguments)
+            self.db.commit()
+            notify_change("BlockedRange")
+        except Exception as e:
+            print("** Failed to delete blocked range:")
+            pprint(e)
+            return False
+        if self.config["DEBUG"]:
+            print("Blocked range removed")
+            pprint(arguments)
+        return True
+
+    def check_number(self, number):
+        """
+        Checks if the number is within a blocked range. Where ranges
+        overlap, the most specific one wins: the longest prefix, then
+        the narrowest range, then the first one added.
+            :param number: the number to look for
+            :returns: True if found; and a string containing the reason
+        """
+        query = """SELECT Reason FROM BlockedRange
+            WHERE length(LowNo) <= length(:number)
+            AND substr(:number, 1, length(LowNo)) BETWEEN LowNo AND HighNo
+            ORDER BY length(LowNo) DESC, CAST(HighNo AS INTEGER) - CAST(LowNo AS INTEGER), RangeID
+            LIMIT 1"""
+        args = {"number": national_number(number, self._country_code)}
+        results = query_db(self.db, query, args, False)
+        if len(results) > 0:
+            return True, results[0][0]
+        else:
+            return False, ""
+
+    def get_ranges(self):
+        """Returns all the ranges: (RangeID, LowNo, HighNo, Reason) tuples"""
+        query = "SELECT RangeID, LowNo, HighNo, Reason FROM BlockedRange ORDER BY LowNo"
+        return query_db(self.db, query, (), False)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  bloomfilter.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import hashlib
+import math
+import mmap
+import os
+import struct
+
+
+class BloomFilter(object):
+    """
+    A Bloom filter stored in a memory-mapped file. A number that is not in
+    the filter is definitely not in the set it was built from; a number that
+    is in the filter probably is, with the false positive rate chosen when
+    the filter was created. The file is shared by all the processes and
+    connections using it, and only the pages that are touched are loaded.
+    """
+
+    # magic, version, number of hashes, number of bits, capacity, count
+    HEADER = struct.Struct("<4sHHQQQ")
+    MAGIC = b"CABF"
+    # Version 2 filters hold the E.164 numbers; older files are rebuilt
+    VERSION = 2
+
+    def __init__(self, filename):
+        """
+        Opens an existing filter file.
+            :param filename: the path to the filter file
+        """
+        self.filename = filename
+        self._file = open(filename, "r+b")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0)
+        except Exception:
+            self._file.close()
+            raise
+        magic, version, self.num_hashes, self.num_bits, self.capacity, count = \
+            self.HEADER.unpack_from(self._map, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            self.close()
+            raise ValueError("Not a bloom filter file: {}".format(filename))
+        self.inode = os.fstat(self._file.fileno()).st_ino
+
+    @classmethod
+    def create(cls, filename, capacity, error_rate=0.01, numbers=()):
+        """
+        Builds a new filter file, atomically replacing an existing one.
+            :param filename: the path to the filter file
+            :param capacity: the number of entries the filter is sized for
+            :param error_rate: the false positive rate at capacity
+            :param numbers: an iterable of the numbers to add
+            :return: the opened BloomFilter
+        """
+        capacity = max(int(capacity), 1000)
+        num_bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        num_bits = (num_bits + 7) // 8 * 8
+        num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+
+        bits = bytearray(num_bits // 8)
+        count = 0
+        for number in numbers:
+            for i in cls._positions(number, num_hashes, num_bits):
+                bits[i >> 3] |= 1 << (i & 7)
+            count += 1
+
+        tmp_filename = filename + ".tmp"
+        with open(tmp_filename, "wb") as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, num_hashes, num_bits, capacity, count))
+            f.write(bits)
+        os.replace(tmp_filename, filename)
+        return cls(filename)
+
+    @property
+    def count(self):
+        """The number of entries added to the filter"""
+        return self.HEADER.unpack_from(self._map, 0)[5]
+
+    @property
+    def size(self):
+        """The size of the filter in bytes"""
+        return self.HEADER.size + self.num_bits // 8
+
+    def add(self, number):
+        """
+        Adds a number to the filter.
+            :param number: the phone number
+        """
+        offset = self.HEADER.size
+        for i in self._positions(number, self.num_hashes, self.num_bits):
+            self._map[offset + (i >> 3)] |= 1 << (i & 7)
+        header = list(self.HEADER.unpack_from(self._map, 0))
+        header[5] += 1
+        self.HEADER.pack_into(self._map, 0, *header)
+
+    def __contains__(self, number):
+        offset = self.HEADER.size
+        for i in self._positions(number, self.num_hashes, self.num_bits):
+            if not self._map[offset + (i >> 3)] & (1 << (i & 7)):
+                return False
+        return True
+
+    def false_positive_rate(self):
+        """Returns the expected false positive rate for the current count"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    @staticmethod
+    def _positions(number, num_hashes, num_bits):
+        # Double hashing: the k positions are derived from two 64-bit hashes
+        digest = hashlib.sha1(number.encode("utf-8")).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        return [(h1 + i * h2) % num_bits for i in range(num_hashes)]
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  bulkimport.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import csv
+import sqlite3
+import time
+from datetime import datetime
+from itertools import chain, islice
+
+from screening.normalize import canonical_number
+from screening.tablechanges import notify_change
+
+
+# The entries are keyed by the normalized number, so an existing entry of
+# the number in another form, e.g., "800-555-1212", is updated.
+# Upsert requires SQLite 3.24; older versions replace the whole row
+if sqlite3.sqlite_version_info >= (3, 24, 0):
+    UPSERT_SQL = """INSERT INTO Blacklist(PhoneNo, Name, Reason, SystemDateTime, NormalizedNo)
+        VALUES(?,?,?,?,?)
+        ON CONFLICT(NormalizedNo) DO UPDATE SET
+            Name=COALESCE(NULLIF(excluded.Name, ''), Name),
+            Reason=excluded.Reason,
+            SystemDateTime=excluded.SystemDateTime,
+            Expires=NULL"""
+else:
+    UPSERT_SQL = """INSERT OR REPLACE INTO Blacklist(PhoneNo, Name, Reason, SystemDateTime, NormalizedNo)
+        VALUES(?,?,?,?,?)"""
+
+
+def normalize_number(text, country_code="1"):
+    """
+    Normalizes a phone number to the E.164 form used as the Blacklist's key,
+    e.g., "(800) 555-1212" becomes "+18005551212", see canonical_number.
+        :param text: the number as found in the dataset
+        :param country_code: the local country calling code
+        :return: the normalized number, or None if it isn't a phone number
+    """
+    number = canonical_number(text, country_code)
+    digits = number.lstrip("+")
+    if not digits.isdigit() or len(digits) < 7:
+        return None
+    return number
+
+
+def read_numbers(f, number_column=0, name_column=None, reason_column=None, country_code="1"):
+    """
+    Reads the numbers from a CSV file, one row at a time. A header row, if
+    present, is skipped, and columns may be given by index or header name.
+        :param f: a text file object
+        :param number_column: the phone number column
+        :param name_column: the optional caller name column
+        :param reason_column: the optional reason column
+        :param country_code: the local country calling code, for the normalized numbers
+        :return: a generator of (number, name, reason) tuples, with the
+            number as found in the file; it's None if it isn't a phone number
+    """
+    reader = csv.reader(f)
+    first = next(reader, None)
+    if first is None:
+        return
+
+    columns = [number_column, name_column, reason_column]
+    by_name = any(isinstance(col, str) for col in columns)
+    if by_name or len(first) <= number_column or normalize_number(first[number_column], country_code) is None:
+        # The first row is a header
+        if by_name:
+            header = [col.strip().lower() for col in first]
+            columns = [header.index(col.lower()) if isinstance(col, str) else col for col in columns]
+        rows = reader
+    else:
+        rows = chain([first], reader)
+
+    number_col, name_col, reason_col = columns
+    for row in rows:
+        if len(row) <= number_col:
+            yield None, "", ""
+            continue
+        name = row[name_col] if name_col is not None and len(row) > name_col else ""
+        reason = row[reason_col] if reason_col is not None and len(row) > reason_col else ""
+        number = row[number_col].strip()
+        yield (number if normalize_number(number, country_code) else None), name, reason
+
+
+def import_blacklist(db, rows, reason="", batch_size=10000, progress=None, country_code="1"):
+    """
+    Imports numbers into the Blacklist in batches inside a single
+    transaction. Existing numbers, in whatever form they were added,
+    are updated with the new reason. Like the numbers added in the web
+    app, the PhoneNo is the number's digits, and the NormalizedNo is its
+    E.164 form.
+        :param db: the database connection
+        :param rows: an iterable of (number, name, reason) tuples, e.g.,
+            from read_numbers; rows without a number are skipped
+        :param reason: the reason used for rows without one
+        :param batch_size: the number of rows inserted per executemany
+        :param progress: an optional callable(count, elapsed) called after each batch
+        :param country_code: the local country calling code, for the normalized numbers
+        :return: a dict with the counts and the elapsed time and rate
+    """
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    counts = {"imported": 0, "skipped": 0}
+
+    def batch_rows():
+        for number, name, row_reason in rows:
+            if number is None:
+                counts["skipped"] += 1
+                continue
+            phone_no = "".join(c for c in number if c.isdigit())
+            yield (phone_no, name, row_reason or reason, now, canonical_number(number, country_code))
+
+    start = time.time()
+    source = batch_rows()
+    try:
+        db.execute("BEGIN")
+        while True:
+            batch = list(islice(source, batch_size))
+            if not batch:
+                break
+            db.executemany(UPSERT_SQL, batch)
+            counts["imported"] += len(batch)
+            if progress:
+                progress(counts["imported"], time.time() - start)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    notify_change("Blacklist")
+
+    elapsed = time.time() - start
+    counts["elapsed"] = elapsed
+    counts["rate"] = counts["imported"] / elapsed if elapsed > 0 else 0
+    return counts
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  bursttracker.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import time
+from collections import OrderedDict, deque
+
+from screening.normalize import canonical_number
+
+
+class BurstTracker(object):
+    """
+    Tracks the recent calls from each number in a sliding window to
+    detect bursts, e.g., a robocaller calling the same line many times
+    in an hour. Each number has a ring of its latest call times, just
+    long enough to tell if the threshold was exceeded, so recording a
+    call and checking a number are O(1). The numbers are kept in LRU
+    order and the least recently seen are evicted beyond the capacity.
+    """
+
+    def __init__(self, max_calls, window, capacity=10000):
+        """
+        Constructor.
+            :param max_calls: the number of calls allowed within the window
+            :param window: the length of the window in seconds
+            :param capacity: the maximum number of numbers tracked
+        """
+        self.max_calls = max_calls
+        self.window = window
+        self.capacity = capacity
+        # Number -> deque of call times, least recently seen first
+        self._calls = OrderedDict()
+
+    def __len__(self):
+        return len(self._calls)
+
+    def record(self, number, when=None):
+        """
+        Records a call from the number.
+            :param number: the caller's number
+            :param when: the time of the call, in seconds since
+                the epoch; defaults to now
+            :return: the number of calls within the window
+        """
+        if when is None:
+            when = time.time()
+        times = self._calls.get(number)
+        if times is None:
+            times = self._calls[number] = deque(maxlen=self.max_calls + 1)
+            if len(self._calls) > self.capacity:
+                self._calls.popitem(last=False)
+        else:
+            self._calls.move_to_end(number)
+        times.append(when)
+        return self._count(times, when)
+
+    def count(self, number, now=None):
+        """
+        Returns the number of calls from the number within the window;
+        at most max_calls + 1.
+        """
+        times = self._calls.get(number)
+        if times is None:
+            return 0
+        return self._count(times, time.time() if now is None else now)
+
+    def is_bursting(self, number, now=None):
+        """Returns True if the number exceeded max_calls within the window"""
+        return self.count(number, now) > self.max_calls
+
+    def seed(self, db, country_code="1"):
+        """
+        Records the calls within the window from the CallLog table,
+        e.g., at startup. The numbers are recorded in their canonical
+        E.164 form, see normalize.canonical_number.
+            :param db: the database connection
+            :param country_code: the local country calling code
+        """
+        since = int(time.time() - self.window)
+        sql = """SELECT Number, CallTime FROM CallLog
+            WHERE CallTime >= ? ORDER BY CallTime"""
+        curs = db.execute(sql, (since,))
+        try:
+            for number, call_time in curs:
+                number = canonical_number(number, country_code)
+                if not number or not number.lstrip("+").isdigit():
+                    continue
+                self.record(number, call_time)
+        finally:
+            curs.close()
+
+    def _count(self, times, now):
+        # Drop the calls that have slid out of the window
+        start = now - self.window
+        while times and times[0] <= start:
+            times.popleft()
+        return len(times)
@@ -4,50 +4,113 @@
 # https://github.com/pradeesi/Incoming_Call_Detail_Logger
 # ==============================================================================
 
-from datetime import datetime
+import itertools
+import queue
+import sqlite3
+import threading
+import time
 from pprint import pprint
+
+from migrations import migrate
+from screening.normalize import call_log_key
 from screening.query_db import query_db
 
+# The codes stored in the CallLog's Action column
+PERMITTED = 1
+BLOCKED = 2
+SCREENED = 3
+ACTIONS = {"Permitted": PERMITTED, "Blocked": BLOCKED, "Screened": SCREENED}
+ACTION_NAMES = {code: name for name, code in ACTIONS.items()}
+
+
+def list_join(table, alias, call_alias="a"):
+    """
+    Returns the LEFT JOIN of the Whitelist or Blacklist with the CallLog on
+    the normalized numbers. The list's NormalizedNo is converted to the
+    CallLog's integer form (see normalize.call_log_key) by the expression
+    the lists are indexed on; the unary plus drops the CallLog column's
+    INTEGER affinity, which would otherwise prevent the index's use.
+        :param table: "Whitelist" or "Blacklist"
+        :param alias: the list's alias in the query
+        :param call_alias: the CallLog's alias in the query
+    """
+    return """LEFT JOIN {0} AS {1} ON
+        CASE WHEN ltrim({1}.NormalizedNo, '+') GLOB '[0-9]*' THEN CAST(ltrim({1}.NormalizedNo, '+') AS INTEGER)
+            ELSE {1}.NormalizedNo END = +{2}.NormalizedNo""".format(table, alias, call_alias)
+
+
+def action_name(code):
+    """Returns the name of a CallLog Action code, e.g., "Blocked"."""
+    return ACTION_NAMES.get(code, "")
+
 
 class CallLogger(object):
 
-    def log_caller(self, callerid, action="Screened", reason=""):
+    INSERT_CALL_SQL = """INSERT INTO CallLog(
+        CallLogID,
+        Name,
+        Number,
+        NormalizedNo,
+        Action,
+        Reason,
+        CallTime)
+        VALUES(?,?,?,?,?,?,?)"""
+
+    INSERT_TRACE_SQL = """INSERT INTO ScreeningTrace(CallLogID, Seq, Stage, Matched, Reason, Elapsed)
+        VALUES(?,?,?,?,?,?)"""
+
+    def log_caller(self, callerid, action="Screened", reason="", trace=None):
         """
         Logs the given caller into the Call Log table.
             :param caller: a dict object containing the caller ID info
+            :param action: "Permitted", "Blocked" or "Screened"
+            :param reason: the reason for the action
+            :param trace: an optional ScreeningTrace, saved with the call
             :return: The CallLogID of the new record
         """
-        # Add a row
-        sql = """INSERT INTO CallLog(
-            Name,
-            Number,
-            Action,
-            Reason,
-            Date,
-            Time,
-            SystemDateTime)
-            VALUES(?,?,?,?,?,?,?)"""
         arguments = [callerid['NAME'],
                      callerid['NMBR'],
-                     action,
+                     call_log_key(callerid['NMBR'], self._country_code),
+                     ACTIONS.get(action),
                      reason,
-                     datetime.strptime(callerid['DATE'], '%m%d'). strftime('%d-%b'),
-                     datetime.strptime(callerid['TIME'], '%H%M'). strftime('%I:%M %p'),
-                     (datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:19])]
+                     int(time.time())]
+        stages = trace.stages if trace is not None else []
+
+        if self._writer is not None:
+            # Queued for the writer thread; the CallLogID is preallocated
+            call_no = self._writer.write(arguments, stages)
+        else:
+            self.db.execute(self.INSERT_CALL_SQL, [None] + arguments)
 
-        self.db.execute(sql, arguments)
-        self.db.commit()
+            # Return the CallLogID
+            query = "select last_insert_rowid()"
+            result = query_db(self.db, query, (), True)
+            call_no = result[0]
 
-        # Return the CallLogID
-        query = "select last_insert_rowid()"
-        result = query_db(self.db, query, (), True)
-        call_no = result[0]
+            # Save the screening stages in the same transaction
+            self.db.executemany(self.INSERT_TRACE_SQL, [(call_no, seq) + stage for seq, stage in enumerate(stages)])
+            self.db.commit()
 
         if self.config["DEBUG"]:
             print("> New call log entry #{}".format(call_no))
             pprint(arguments)
         return call_no
 
+    def flush(self):
+        """
+        Waits until the queued calls have been written to the database.
+        """
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self):
+        """
+        Writes the queued calls to the database and stops the writer thread.
+        """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
     def __init__(self, db, config):
         """ Initializes the CallLogger object and creates the
             CallLog table if it doesn't exist
@@ -58,77 +121,162 @@ class CallLogger(object):
         if self.config["DEBUG"]:
             print("Initializing CallLogger")
 
-        # Create the Call_History table if it does not exist
-        sql = """CREATE TABLE IF NOT EXISTS CallLog (
-            CallLogID INTEGER PRIMARY KEY AUTOINCREMENT,
-            Name TEXT,
-            Number TEXT,
-            Action TEXT,
-            Reason TEXT,
-            Date TEXT,
-            Time TEXT,
-            SystemDateTime TEXT);"""
-        curs = self.db.cursor()
-        curs.executescript(sql)
+        # Create or upgrade the CallLog table
+        migrate(self.db, self.config)
+        self._country_code = str(self.config.get("PHONE_COUNTRY_CODE", "1"))
 
-        try:
-            # Early versions of callattendant (<= v0.3.1) do not contain
-            # an Action column or Reason column. This hack/code attempts
-            # to add the columns if they don't exit.
-            sql = """SELECT COUNT(*) AS CNTREC
-                FROM pragma_table_info('CallLog')
-                WHERE name='Action'"""
-            curs.execute(sql)
-            count = curs.fetchone()[0]
-            if count == 0:
-
-                # Dependencies: ensures tables used in the sql exist
-                from whitelist import Whitelist
-                from blacklist import Blacklist
-                whitelist = Whitelist(db, config)
-                blacklist = Blacklist(db, config)
-
-                print(">> Adding Action column to CallLog table")
-                sql = """ALTER TABLE CallLog ADD COLUMN Action TEXT default null"""
-                curs.executescript(sql)
-
-                print(">> Updating Action column in CallLog table")
-                sql = """UPDATE CallLog
-                    SET `Action`=(select
-                    CASE
-                        WHEN b.PhoneNo is not null then 'Permitted'
-                        WHEN c.PhoneNo is not null then 'Blocked'
-                        ELSE 'Screened'
-                    END actn
-                    FROM CallLog as a
-                    LEFT JOIN Whitelist as b ON a.Number = b.PhoneNo
-                    LEFT JOIN Blacklist as c ON a.Number = c.PhoneNo
-                    WHERE CallLog.CallLogID = a.CallLogID)"""
-                curs.executescript(sql)
-
-                print(">> Adding Reason column to CallLog table")
-                sql = """ALTER TABLE CallLog ADD COLUMN Reason TEXT default null"""
-                curs.executescript(sql)
-
-                print(">> Updating Reason column in CallLog table")
-                sql = """UPDATE CallLog
-                    SET `Reason`=(select
-                    CASE
-                        WHEN b.PhoneNo is not null then b.Reason
-                        WHEN c.PhoneNo is not null then c.Reason
-                        ELSE null
-                    END reason
-                    FROM CallLog as a
-                    LEFT JOIN Whitelist as b ON a.Number = b.PhoneNo
-                    LEFT JOIN Blacklist as c ON a.Number = c.PhoneNo
-                    WHERE CallLog.CallLogID = a.CallLogID)"""
-                curs.executescript(sql)
-
-        except Exception as e:
-            print(e)
-
-        curs.close()
-        self.db.commit()
+        # Calls to a database file are written by a background thread, so
+        # call handling doesn't wait on the INSERT and the commit's fsync
+        self._writer = None
+        db_file = self.db.execute("PRAGMA database_list").fetchone()[2]
+        if db_file:
+            sql = """SELECT MAX(
+                IFNULL((SELECT seq FROM sqlite_sequence WHERE name='CallLog'), 0),
+                IFNULL((SELECT MAX(CallLogID) FROM CallLog), 0))"""
+            last_id = self.db.execute(sql).fetchone()[0]
+            self._writer = CallLogWriter(db_file, last_id + 1)
 
         if self.config["DEBUG"]:
             print("CallLogger initialized")
+
+
+class CallLogWriter(object):
+    """
+    Writes the call log in a background thread with its own connection.
+    The CallLogIDs are allocated up front from a sequence, so the caller
+    gets the ID immediately. The calls that queue up while a commit is
+    in progress, e.g., during a burst of calls, are written together in
+    a single transaction (a group commit).
+    """
+
+    def __init__(self, db_file, next_id, max_batch=100, timeout=5.0, max_retries=5, retry_delay=0.5):
+        """
+        Starts the writer thread.
+            :param db_file: the database file
+            :param next_id: the first CallLogID to allocate
+            :param max_batch: the max number of calls written per commit
+            :param timeout: the seconds to wait for the database lock
+            :param max_retries: the number of times a commit is retried
+                when the database is locked, before its calls are held
+                back to be retried with the next group
+            :param retry_delay: the seconds before the first retry; it's
+                doubled after each one
+        """
+        self.db_file = db_file
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        # The number of transactions committed
+        self.commits = 0
+        self._ids = itertools.count(next_id)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="CallLogWriter", daemon=True)
+        self._thread.start()
+
+    def write(self, arguments, stages):
+        """
+        Queues a call to be written.
+            :param arguments: the CallLog column values, except the CallLogID
+            :param stages: the ScreeningTrace stages
+            :return: the CallLogID allocated for the call
+        """
+        call_no = next(self._ids)
+        self._queue.put((call_no, arguments, stages))
+        return call_no
+
+    def flush(self):
+        """Waits until the queued calls have been committed"""
+        self._queue.join()
+
+    def close(self):
+        """Commits the queued calls and stops the thread"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        db = sqlite3.connect(self.db_file, timeout=self.timeout)
+        try:
+            # The calls held back while the database is locked
+            pending = []
+            stopping = False
+            while not stopping:
+                # Wait for a call, or the time to retry the pending calls,
+                # then take whatever else has been queued
+                try:
+                    batch = [self._queue.get(timeout=self.retry_delay if pending else None)]
+                except queue.Empty:
+                    batch = []
+                while len(batch) < self.max_batch:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stopping = None in batch
+                calls = pending + [item for item in batch if item is not None]
+                try:
+                    pending = self._commit(db, calls) if calls else []
+                except Exception as e:
+                    # E.g., a bad value in a call; don't let it stop the writer
+                    try:
+                        db.rollback()
+                    except sqlite3.Error:
+                        pass
+                    self._lost(calls, e)
+                    pending = []
+                if pending and stopping:
+                    self._lost(pending, "the database is locked")
+                    pending = []
+                # The calls are done once they're written or lost
+                for i in range(len(calls) - len(pending) + batch.count(None)):
+                    self._queue.task_done()
+        finally:
+            db.close()
+
+    def _commit(self, db, calls):
+        """
+        Inserts the calls and their screening stages in one transaction.
+        The transaction is retried with backoff while the database is
+        locked; if it's still locked, the calls are returned to be retried
+        with the next group. If a row can't be written, e.g., a duplicate
+        CallLogID, the calls are written one at a time so the bad row
+        doesn't take the other calls with it.
+            :return: the calls held back because the database is locked
+        """
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            try:
+                db.executemany(CallLogger.INSERT_CALL_SQL, [
+                    [call_no] + arguments for call_no, arguments, stages in calls])
+                db.executemany(CallLogger.INSERT_TRACE_SQL, [
+                    (call_no, seq) + stage for call_no, arguments, stages in calls for seq, stage in enumerate(stages)])
+                db.commit()
+                self.commits += 1
+                return []
+            except sqlite3.OperationalError as e:
+                db.rollback()
+                if attempt < self.max_retries:
+                    time.sleep(delay)
+                    delay *= 2
+                else:
+                    print("** Unable to write {} calls to the call log, will retry: {}".format(len(calls), e))
+                    return calls
+            except sqlite3.IntegrityError as e:
+                db.rollback()
+                if len(calls) == 1:
+                    self._lost(calls, e)
+                    return []
+                for i, call in enumerate(calls):
+                    if self._commit(db, [call]):
+                        # The database is locked again; hold back the rest
+                        return calls[i:]
+                return []
+            except sqlite3.Error as e:
+                db.rollback()
+                self._lost(calls, e)
+                return []
+
+    @staticmethod
+    def _lost(calls, error):
+        for call_no, arguments, stages in calls:
+            print("** Failed to write call #{} to the call log: {}".format(call_no, error))
@@ -24,96 +24,378 @@
 #  SOFTWARE.
 
 
-import re
+import sqlite3
 import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 
 from screening.blacklist import Blacklist
+from screening.blockedranges import BlockedRanges
+from screening.bursttracker import BurstTracker
+from screening.circuitbreaker import CircuitBreaker
 from screening.whitelist import Whitelist
-from screening.nomorobo import NomoroboService
+from screening.lookupcache import LookupCache
+from screening.namerules import NameRules
+from screening.neighborspoof import NeighborSpoofDetector
+from screening.normalize import canonical_number
+from screening.patternmatcher import PatternMatcher
+from screening.reputation import create_services, merge_results, service_timeout
+from screening.screeningindex import ScreeningIndex
+from screening.screeningquery import ScreeningQuery
+from screening.screeningtrace import ScreeningTrace
+from screening.whatif import BatchScreener
 
 
 class CallScreener(object):
     '''The CallScreener provides provides blacklist and whitelist checks'''
 
-    def is_whitelisted(self, callerid):
-        '''Returns true if the number is on a whitelist'''
+    def is_whitelisted(self, callerid, trace=None):
+        '''
+        Returns true if the number is on a whitelist
+            :param callerid: a dict with caller ID information
+            :param trace: an optional ScreeningTrace that records the stages
+        '''
         number = callerid['NMBR']
         name = callerid["NAME"]
-        permit = self.config.get_namespace("PERMIT_")
+        trace = trace if trace is not None else ScreeningTrace()
         try:
-            is_whitelisted, reason = self._whitelist.check_number(callerid['NMBR'])
+            is_whitelisted, reason = trace.call("Whitelist", self._check_whitelist, number)
             if is_whitelisted:
+                if self._neighbors is not None:
+                    self._neighbors.record_permitted(number)
                 return True, reason
             else:
                 print(">> Checking permitted patterns...")
-                for key in permit["name_patterns"].keys():
-                    match = re.search(key, name)
-                    if match:
-                        reason = permit["name_patterns"][key]
-                        print(reason)
-                        return True, reason
-                for key in permit["number_patterns"].keys():
-                    match = re.search(key, number)
-                    if match:
-                        reason = permit["number_patterns"][key]
-                        print(reason)
-                        return True, reason
+                reason = trace.call("Permitted names", self._permit_name_patterns.search, name)
+                if reason is None:
+                    reason = trace.call("Permitted numbers", self._permit_number_patterns.search, number)
+                if reason is not None:
+                    print(reason)
+                    return True, reason
                 return False, "Not found"
         finally:
             sys.stdout.flush()
 
-    def is_blacklisted(self, callerid):
-        '''Returns true if the number is on a blacklist'''
+    def is_blacklisted(self, callerid, check_service=True, trace=None):
+        '''
+        Returns true if the number is on a blacklist
+            :param callerid: a dict with caller ID information
+            :param check_service: if False, the online service is not checked;
+                use start_service_lookup to check it concurrently.
+            :param trace: an optional ScreeningTrace that records the stages
+        '''
         number = callerid['NMBR']
         name = callerid["NAME"]
-        block = self.config.get_namespace("BLOCK_")
+        trace = trace if trace is not None else ScreeningTrace()
         try:
-            is_blacklisted, reason = self._blacklist.check_number(number)
+            is_blacklisted, reason = trace.call("Blacklist", self._check_blacklist, number)
             if is_blacklisted:
                 return True, reason
             else:
-                print(">> Checking blocked patterns...")
-                for key in block["name_patterns"].keys():
-                    match = re.search(key, name)
-                    if match:
-                        reason = block["name_patterns"][key]
-                        print(reason)
+                screened_reason = "Not found"
+                if self._bursts is not None:
+                    is_blacklisted, reason = trace.call("Burst", self._check_burst, callerid)
+                    if is_blacklisted:
                         return True, reason
-                for key in block["number_patterns"].keys():
-                    match = re.search(key, number)
-                    if match:
-                        reason = block["number_patterns"][key]
+                    if reason:
+                        # BLOCK_BURST_ACTION is "screen"
+                        screened_reason = reason
+                print(">> Checking blocked patterns...")
+                reason = trace.call("Blocked names", self._block_name_patterns.search, name)
+                if reason is None:
+                    reason = trace.call("Name rules", self._check_name_rules, name)
+                if reason is None:
+                    reason = trace.call("Blocked numbers", self._block_number_patterns.search, number)
+                if reason is not None:
+                    print(reason)
+                    return True, reason
+                if self._neighbors is not None:
+                    is_blacklisted, reason = trace.call("Neighbor spoof", self._neighbors.check_number, number)
+                    if is_blacklisted:
                         print(reason)
                         return True, reason
-                if block["service"].upper() == "NOMOROBO":
-                    print(">> Checking nomorobo...")
-                    result = self._nomorobo.lookup_number(number)
-                    if result["spam"]:
-                        reason = "{} with score {}".format(result["reason"], result["score"])
-                        if self.config["DEBUG"]:
-                            print(">>> {}".format(reason))
-                        self.blacklist_caller(callerid, reason)
-                        return True, reason
+                if check_service:
+                    lookup = self.start_service_lookup(callerid, trace)
+                    if lookup is not None:
+                        is_blacklisted, reason = self.finish_service_lookup(lookup)
+                        if is_blacklisted:
+                            return True, reason
                 print("Caller has been screened")
-                return False, "Not found"
+                return False, screened_reason
         finally:
             sys.stdout.flush()
 
+    def start_service_lookup(self, callerid, trace=None):
+        '''
+        Starts looking up the caller with the online services (BLOCK_SERVICE).
+        The services are queried concurrently in worker threads, allowing the
+        caller to do other work, e.g., count rings.
+            :param callerid: a dict with caller ID information
+            :param trace: an optional ScreeningTrace that records the lookups
+            :return: a ServiceLookup object to be passed to finish_service_lookup,
+                or None if the online services are not enabled or are unavailable.
+        '''
+        number = callerid['NMBR']
+        lookup = ServiceLookup(callerid, trace)
+        for name, service in self._services.items():
+            print(">> Checking {}...".format(name.lower()))
+            result = self._cache.get(name, number)
+            if result is not None:
+                lookup.trace.add(name, result["spam"], "Cached", 0)
+                lookup.results.append((name, result))
+                continue
+            if not self.breakers[name].allow_request():
+                print(">> Skipping {}, the service is unavailable".format(name.lower()))
+                lookup.trace.add(name, False, "Skipped", 0)
+                continue
+            lookup.futures[name] = self._executor.submit(self._timed_lookup, service, number)
+
+        if not lookup.results and not lookup.futures:
+            return None
+        return lookup
+
+    def finish_service_lookup(self, lookup):
+        '''
+        Waits for the online service lookups to complete, merges the results
+        per the BLOCK_SERVICE_POLICY, and adds spammers to the blacklist.
+        Each service's wait is bounded by its own latency budget, see
+        BLOCK_SERVICE_TIMEOUTS, counted from the start of the lookup, so a slow
+        service doesn't use up the others' time; timeouts and errors are ignored.
+            :param lookup: the ServiceLookup returned by start_service_lookup
+            :return: True if the caller is blacklisted; and a string containing the reason
+        '''
+        if lookup.futures:
+            # The lookups run concurrently, so waiting on each in turn, shortest
+            # budget first, bounds the total wait by the longest budget
+            for name in sorted(lookup.futures, key=self._service_timeouts.get):
+                remaining = self._service_timeouts[name] - (time.time() - lookup.started)
+                wait([lookup.futures[name]], timeout=max(0, remaining))
+            for name, future in lookup.futures.items():
+                breaker = self.breakers[name]
+                if not future.done():
+                    breaker.record_failure(time.time() - lookup.started, "Timed out")
+                    lookup.trace.add(name, False, "Timed out", time.time() - lookup.started)
+                    print(">> {} lookup timed out".format(name))
+                    continue
+                try:
+                    result, elapsed = future.result()
+                except Exception as e:
+                    breaker.record_failure(time.time() - lookup.started, e)
+                    lookup.trace.add(name, False, "Failed: {}".format(e), time.time() - lookup.started)
+                    print(">> {} lookup failed: {}".format(name, e))
+                    continue
+                breaker.record_success(elapsed)
+                lookup.trace.add(name, result["spam"], result.get("reason", ""), elapsed)
+                if getattr(self._services[name], "cacheable", True) and result.get("cacheable", True):
+                    self._cache.put(name, lookup.callerid['NMBR'], result)
+                lookup.results.append((name, result))
+            lookup.futures.clear()
+
+        result = merge_results(lookup.results, self._service_policy)
+        if result is not None and result["spam"]:
+            reason = "{} with score {}".format(result["reason"], result["score"])
+            if self.config["DEBUG"]:
+                print(">>> {}".format(reason))
+            self.blacklist_caller(lookup.callerid, reason)
+            return True, reason
+        return False, "Not found"
+
+    def screen_many(self, callers, rules=None):
+        '''
+        Screens a batch of callers, e.g., the call history, against the
+        current or a candidate set of rules without changing either. Only
+        the lists, blocked ranges, name rules and patterns are checked; the
+        online services and the burst and neighbor spoof detectors are not.
+        Call it from the thread that owns the screener's db connection.
+            :param callers: an iterable of dicts with caller ID information
+            :param rules: an optional dict of candidate rules, see
+                BatchScreener.screen_many
+            :return: a generator of (action, reason) tuples, one per caller,
+                where action is "Permitted", "Blocked" or "Screened"
+        '''
+        if self._batch is None:
+            self._batch = BatchScreener(self._db, self.config, self._name_rules)
+        return self._batch.screen_many(callers, rules)
+
+    def service_status(self):
+        '''
+        Returns the state of the online services' circuit breakers,
+        e.g., for the web app.
+            :return: a list of CircuitBreaker.status dicts
+        '''
+        return [breaker.status() for breaker in self.breakers.values()]
+
     def whitelist_caller(self, callerid, reason):
-        self._whitelist.add_caller(callerid, reason)
+        if self._whitelist.add_caller(callerid, reason) and self._index:
+            self._index.update_entry("Whitelist", callerid['NMBR'], reason)
 
     def blacklist_caller(self, callerid, reason):
-        self._blacklist.add_caller(callerid, reason)
+        if self._blacklist.add_caller(callerid, reason) and self._index:
+            self._index.update_entry("Blacklist", callerid['NMBR'], reason)
+
+    def _warm_up(self):
+        '''
+        Prepares the services at startup, e.g., connects to an online service,
+        ahead of the first lookup. The connection pools replace the connections
+        closed while idle, reusing the address and TLS session primed here.
+        '''
+        for name, service in self._services.items():
+            warm_up = getattr(service, "warm_up", None)
+            if warm_up is None:
+                continue
+            try:
+                warm_up()
+            except Exception as e:
+                print("* Unable to connect to {}: {}".format(name, e))
+
+    @staticmethod
+    def _timed_lookup(service, number):
+        '''Calls the service in a worker thread; returns the result and elapsed time'''
+        start = time.time()
+        result = service.lookup_number(number)
+        return result, time.time() - start
+
+    def _check_burst(self, callerid):
+        '''
+        Records the call and checks if the caller exceeds BLOCK_BURST_CALLS.
+            :return: True if the caller is blocked; and a string containing the
+                reason, which is also returned for a caller to be screened
+        '''
+        number = canonical_number(callerid['NMBR'], self._country_code)
+        if not number or not number.lstrip("+").isdigit():
+            # Don't lump together the private and unknown callers
+            return False, ""
+        count = self._bursts.record(number)
+        if count <= self._bursts.max_calls:
+            return False, ""
+        reason = "Burst of {} calls in {} minutes".format(count, int(self._bursts.window / 60))
+        print(">> {}".format(reason))
+        if self._burst_action == "screen":
+            return False, reason
+        if self._burst_action == "blacklist":
+            self.blacklist_caller(callerid, reason)
+        return True, reason
+
+    def _check_name_rules(self, name):
+        '''Checks the name against the keywords in the NameRules table; returns the reason or None'''
+        is_blocked, reason = self._name_rules.check_name(name)
+        return reason if is_blocked else None
+
+    def _check_whitelist(self, number):
+        '''Checks the whitelist table, via the in-memory index if enabled'''
+        if self._index:
+            return self._index.check_whitelist(number)
+        return self._query.check_whitelist(number)
+
+    def _check_blacklist(self, number):
+        '''Checks the blacklist and blocked ranges, via the in-memory index if enabled'''
+        if self._index:
+            is_blacklisted, reason = self._index.check_blacklist(number)
+            if not is_blacklisted:
+                is_blacklisted, reason = self._index.check_ranges(number)
+            return is_blacklisted, reason
+        return self._query.check_blacklist(number)
 
     def __init__(self, db, config):
         self._db = db
         self.config = config
+        self._country_code = str(config.get("PHONE_COUNTRY_CODE", "1"))
         if self.config["DEBUG"]:
             print("Initializing CallScreener")
 
         self._blacklist = Blacklist(db, config)
         self._whitelist = Whitelist(db, config)
-        self._nomorobo = NomoroboService()
+        self._ranges = BlockedRanges(db, config)
+        self._name_rules = NameRules(db, config)
+        self._cache = LookupCache(db, config)
+        # The BatchScreener for screen_many, created on first use
+        self._batch = None
+
+        # Compile the name and number patterns once, up front
+        block = self.config.get_namespace("BLOCK_")
+        permit = self.config.get_namespace("PERMIT_")
+        self._block_name_patterns = PatternMatcher(block["name_patterns"])
+        self._block_number_patterns = PatternMatcher(block["number_patterns"])
+        self._permit_name_patterns = PatternMatcher(permit["name_patterns"])
+        self._permit_number_patterns = PatternMatcher(permit["number_patterns"])
+
+        # The online services are queried in parallel, each within its own deadline
+        self._services = OrderedDict(create_services(config))
+        self._service_timeouts = {name: service_timeout(config, name) for name in self._services}
+        self._service_policy = block["service_policy"]
+        # A lookup that timed out can't be cancelled and keeps its worker until
+        # the service responds, so there are two workers per service: the next
+        # call's lookups aren't queued behind a hung one.
+        self._executor = ThreadPoolExecutor(max_workers=max(2, 2 * len(self._services)))
+
+        # Skip an online service for a while after consecutive failures
+        self.breakers = OrderedDict()
+        for name in self._services:
+            self.breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=block["service_breaker_threshold"],
+                cooldown=block["service_breaker_cooldown"])
+        if self._services and not self.config["TESTING"]:
+            threading.Thread(target=self._warm_up, daemon=True).start()
+
+        # Block the numbers that call too often within a short period
+        self._bursts = None
+        if block["burst_calls"] > 0:
+            self._bursts = BurstTracker(
+                block["burst_calls"],
+                block["burst_window"] * 60,
+                block["burst_max_numbers"])
+            self._burst_action = block["burst_action"]
+            try:
+                self._bursts.seed(db, self._country_code)
+            except sqlite3.Error as e:
+                print("* Unable to load the recent calls: {}".format(e))
+
+        # Block the calls that appear to spoof a neighbor's number
+        self._neighbors = None
+        if block["neighbor_spoof"]:
+            try:
+                self._neighbors = NeighborSpoofDetector(db, config)
+            except sqlite3.Error as e:
+                print("* Unable to load the neighbor spoof index: {}".format(e))
+
+        # Load the lists into memory so screening doesn't query the db,
+        # otherwise check all the lists with a single query
+        self._index = None
+        self._query = None
+        if self.config["SCREENING_IN_MEMORY"]:
+            self._index = ScreeningIndex(db, config)
+        else:
+            self._query = ScreeningQuery(db, config, self._blacklist)
 
         if self.config["DEBUG"]:
             print("CallScreener initialized")
+
+    def close(self):
+        '''
+        Waits for pending lookups to complete and releases resources.
+        '''
+        self._executor.shutdown(wait=True)
+        for service in self._services.values():
+            close = getattr(service, "close", None)
+            if close is not None:
+                close()
+        if self._query:
+            self._query.close()
+
+
+class ServiceLookup(object):
+    '''A lookup of a caller with the online screening services'''
+
+    def __init__(self, callerid, trace=None):
+        self.callerid = callerid
+        # The ScreeningTrace that records the service lookups
+        self.trace = trace if trace is not None else ScreeningTrace()
+        # The (service name, result dict) tuples of the completed lookups
+        self.results = []
+        # The Futures for the lookups running in worker threads, by service name
+        self.futures = OrderedDict()
+        # The time the lookup was started
+        self.started = time.time()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  callstats.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+from screening.calllogger import BLOCKED
+
+
+def get_call_totals(db):
+    """
+    Returns the total number of calls and the number of blocked calls,
+    from the CallStatsDaily rollup.
+        :param db: the database connection
+        :return: a (total, blocked) tuple
+    """
+    sql = """SELECT IFNULL(SUM(Count), 0), IFNULL(SUM(CASE WHEN Action = ? THEN Count END), 0)
+        FROM CallStatsDaily"""
+    return tuple(db.execute(sql, (BLOCKED,)).fetchone())
+
+
+def get_calls_per_day(db, since):
+    """
+    Returns the number of calls per day and action, from the
+    CallStatsDaily rollup.
+        :param db: the database connection
+        :param since: the first local date, a "YYYY-MM-DD" string
+        :return: a dict of Action code: {date: count}
+    """
+    per_day = {}
+    sql = "SELECT CallDate, Action, Count FROM CallStatsDaily WHERE CallDate >= ?"
+    for call_date, action, count in db.execute(sql, (since,)):
+        per_day.setdefault(action, {})[call_date] = count
+    return per_day
+
+
+def rebuild_call_stats(db):
+    """
+    Recomputes the CallStatsDaily rollup from the CallLog, e.g., after
+    the time zone was changed, in a single transaction.
+        :param db: the database connection
+        :return: the number of calls counted
+    """
+    try:
+        db.execute("DELETE FROM CallStatsDaily")
+        db.execute("""INSERT INTO CallStatsDaily(CallDate, Action, Count)
+            SELECT IFNULL(date(CallTime, 'unixepoch', 'localtime'), ''), IFNULL(Action, 0), COUNT(*)
+            FROM CallLog GROUP BY 1, 2""")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return get_call_totals(db)[0]
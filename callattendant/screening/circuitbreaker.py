@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  circuitbreaker.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import threading
+import time
+
+
+class CircuitBreaker(object):
+    """
+    A circuit breaker for an online screening service. After a number of
+    consecutive failures (errors or timeouts) the breaker "opens" and the
+    service is skipped for a cool-down period. Afterwards, the breaker
+    is "half-open" and a single probe request is allowed through: if it
+    succeeds the breaker closes; if it fails the breaker opens again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, name, failure_threshold=3, cooldown=300.0):
+        """
+        Constructor.
+            :param name:
+                The name of the service, e.g., "NOMOROBO"
+            :param failure_threshold:
+                The number of consecutive failures that opens the breaker
+            :param cooldown:
+                The number of seconds the breaker remains open
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._consecutive_failures = 0
+        self._successes = 0
+        self._failures = 0
+        self._skipped = 0
+        self._last_elapsed = None
+        self._total_elapsed = 0.0
+        self._last_error = ""
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow_request(self):
+        """
+        Determines if a request can be made to the service.
+            :return: True if the service may be called
+        """
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.time() - self._opened_at < self.cooldown:
+                    self._skipped += 1
+                    return False
+                self._state = self.HALF_OPEN
+                self._probing = False
+            if self._state == self.HALF_OPEN:
+                if self._probing:
+                    self._skipped += 1
+                    return False
+                self._probing = True
+            return True
+
+    def record_success(self, elapsed):
+        """
+        Records a successful request; closes the breaker.
+            :param elapsed: the duration of the request in seconds
+        """
+        with self._lock:
+            self._successes += 1
+            self._consecutive_failures = 0
+            self._record_elapsed(elapsed)
+            self._state = self.CLOSED
+            self._probing = False
+
+    def record_failure(self, elapsed, error=""):
+        """
+        Records a failed or timed out request; may open the breaker.
+            :param elapsed: the duration of the request in seconds
+            :param error: a description of the failure
+        """
+        with self._lock:
+            self._failures += 1
+            self._consecutive_failures += 1
+            self._record_elapsed(elapsed)
+            self._last_error = str(error)
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    print("** {} circuit breaker opened: {}".format(self.name, self._last_error))
+                self._state = self.OPEN
+                self._opened_at = time.time()
+                self._probing = False
+
+    def status(self):
+        """
+        Returns the state and timing statistics, e.g., for the web app.
+            :return: a dict
+        """
+        with self._lock:
+            requests = self._successes + self._failures
+            retry_at = None
+            if self._state == self.OPEN:
+                retry_at = self._opened_at + self.cooldown
+            return {
+                "name": self.name,
+                "state": self._state,
+                "successes": self._successes,
+                "failures": self._failures,
+                "consecutive_failures": self._consecutive_failures,
+                "skipped": self._skipped,
+                "last_elapsed": self._last_elapsed,
+                "average_elapsed": (self._total_elapsed / requests) if requests else None,
+                "last_error": self._last_error,
+                "retry_at": retry_at,
+            }
+
+    def _record_elapsed(self, elapsed):
+        self._last_elapsed = elapsed
+        self._total_elapsed += elapsed
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  connectionpool.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import http.client
+import socket
+import ssl
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+class ConnectionPool(object):
+    """
+    A pool of persistent (keep-alive) HTTP connections, reused across
+    requests to avoid a new TCP and TLS handshake for every lookup.
+    A request on a stale connection, i.e., one the server has closed
+    while it was idle, is retried once on a new connection.
+
+    Servers close idle connections, so the pool also remembers each
+    host's address, for address_ttl seconds, and its TLS session: a new
+    connection skips the DNS lookup and resumes the session with an
+    abbreviated handshake.
+    """
+
+    def __init__(self, timeout=5, max_idle=2, max_idle_time=60, address_ttl=300):
+        """
+        Constructor.
+            :param timeout: the connect and read timeout in seconds
+            :param max_idle: the max number of idle connections kept per host
+            :param max_idle_time: the seconds a pooled connection may have
+                been idle and still be reused; the server has likely closed
+                an older one, so a new connection is opened instead
+            :param address_ttl: the seconds a host's address is reused
+                before it's resolved again
+        """
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_idle_time = max_idle_time
+        self.address_ttl = address_ttl
+        self.connections_opened = 0
+        self._idle = {}
+        # (host, port) -> the address of the last resolved connection and the time it was resolved
+        self._addresses = {}
+        # (host, port) -> the TLS session of the last connection
+        self._sessions = {}
+        self._context = ssl.create_default_context()
+        self._lock = threading.Lock()
+
+    def warm_up(self, url, max_idle_time=None, headers={}):
+        """
+        Resolves the URL's host and opens a connection, which is pooled
+        for the next request, so the first request doesn't wait on DNS
+        and TLS. It primes the address and TLS session used by later
+        connections, too. A HEAD request is made on the connection, as a
+        TLS 1.3 server sends the session ticket after the handshake.
+            :param url: an absolute URL
+            :param max_idle_time: the seconds a pooled connection may
+                have been idle and still be used instead of a new one;
+                defaults to the pool's max_idle_time
+            :param headers: a dict of request headers for the HEAD request
+        """
+        if max_idle_time is None:
+            max_idle_time = self.max_idle_time
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        with self._lock:
+            conns = self._idle.pop(key, [])
+        fresh = [conn for conn in conns if time.time() - conn.released < max_idle_time]
+        for conn in conns:
+            if conn not in fresh:
+                conn.close()
+        with self._lock:
+            self._idle.setdefault(key, []).extend(fresh)
+        if fresh:
+            return
+
+        self.request("HEAD", url, headers)
+
+    def request(self, method, url, headers={}):
+        """
+        Performs a request on a pooled connection.
+            :param method: "GET", etc.
+            :param url: the absolute URL
+            :param headers: a dict of request headers
+            :return: the HTTPResponse and the response body
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        for attempt in range(2):
+            conn, reused = self._acquire(key)
+            try:
+                conn.request(method, path, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (ConnectionError, http.client.BadStatusLine, http.client.CannotSendRequest):
+                conn.close()
+                if reused and attempt == 0:
+                    continue    # The server closed the idle connection; reconnect
+                raise
+            except Exception:
+                conn.close()
+                raise
+
+            self._save_session(conn)
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(key, conn)
+            return response, body
+
+    def close(self):
+        """Closes the idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def _acquire(self, key):
+        """Returns an idle connection, or a new one, and True if it is being reused"""
+        expired = []
+        conn = None
+        with self._lock:
+            conns = self._idle.get(key, [])
+            while conns:
+                conn = conns.pop()
+                if time.time() - conn.released < self.max_idle_time:
+                    break
+                expired.append(conn)
+                conn = None
+        for stale in expired:
+            stale.close()
+        if conn is not None:
+            return conn, True
+        return self._open(key), False
+
+    def _release(self, key, conn):
+        conn.released = time.time()
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            if len(conns) < self.max_idle:
+                conns.append(conn)
+                return
+        conn.close()
+
+    def _open(self, key):
+        scheme, netloc = key
+        with self._lock:
+            self.connections_opened += 1
+        if scheme == "https":
+            return _PooledHTTPSConnection(self, netloc, timeout=self.timeout)
+        return _PooledHTTPConnection(self, netloc, timeout=self.timeout)
+
+    def _create_socket(self, host, port):
+        """Connects to the host's remembered address, resolving it if needed"""
+        address, resolved = self._addresses.get((host, port), (None, 0))
+        if address is not None and time.time() - resolved < self.address_ttl:
+            try:
+                return socket.create_connection(address, self.timeout)
+            except OSError:
+                pass    # The host may have moved; resolve it again
+        sock = socket.create_connection((host, port), self.timeout)
+        self._addresses[(host, port)] = (sock.getpeername()[:2], time.time())
+        return sock
+
+    def _wrap_socket(self, sock, host, port):
+        """Performs the TLS handshake, resuming the host's last session if possible"""
+        kwargs = {"server_hostname": host}
+        session = self._sessions.get((host, port))
+        if session is not None:
+            kwargs["session"] = session
+        return self._context.wrap_socket(sock, **kwargs)
+
+    def _save_session(self, conn):
+        # Saved after a response is read, so it has the server's session
+        # ticket, if any; SSLSession requires Python 3.6
+        session = getattr(conn.sock, "session", None)
+        if session is not None:
+            self._sessions[(conn.host, conn.port)] = session
+
+
+class _PooledHTTPConnection(http.client.HTTPConnection):
+    """An HTTP connection that connects via the pool's remembered address"""
+
+    def __init__(self, pool, netloc, timeout):
+        http.client.HTTPConnection.__init__(self, netloc, timeout=timeout)
+        self._pool = pool
+
+    def connect(self):
+        self.sock = self._pool._create_socket(self.host, self.port)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class _PooledHTTPSConnection(_PooledHTTPConnection):
+    """An HTTPS connection that resumes the pool's TLS session"""
+
+    default_port = http.client.HTTPS_PORT
+
+    def connect(self):
+        _PooledHTTPConnection.connect(self)
+        self.sock = self._pool._wrap_socket(self.sock, self.host, self.port)
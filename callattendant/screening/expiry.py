@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  expiry.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import heapq
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from screening.tablechanges import get_change_count, get_total_changes, notify_change, wait_for_change, \
+    wake_waiters
+
+# The format of the Expires column, the same as the SystemDateTime column
+EXPIRES_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# The tables with expiring entries
+EXPIRING_TABLES = ("Whitelist", "Blacklist")
+
+
+def format_expires(expires):
+    """
+    Converts an expiry to the Expires column's format.
+        :param expires: a datetime, the number of hours from now,
+            or None for an entry that never expires
+        :return: a string, or None
+    """
+    if expires is None or expires == "":
+        return None
+    if not isinstance(expires, datetime):
+        expires = datetime.now() + timedelta(hours=float(expires))
+    return expires.strftime(EXPIRES_FORMAT)
+
+
+def now_string():
+    """Returns the current time in the Expires column's format"""
+    return datetime.now().strftime(EXPIRES_FORMAT)
+
+
+class ExpiryReaper(object):
+    """
+    Removes the whitelist and blacklist entries when they expire. The
+    pending expiries are kept in a min-heap, and the reaper thread sleeps
+    until the earliest one is due, or until a table is changed, e.g., a
+    temporary entry is added via the web app, which reloads the entries
+    of the changed table. The reaper's own deletes don't reload the heap.
+    """
+
+    def __init__(self, db_file, config, timeout=5.0, retry_delay=5.0):
+        """
+        Constructor.
+            :param db_file: the database file; the reaper has its own connection
+            :param config: the application-wide config dict
+            :param timeout: the seconds to wait for the database lock
+            :param retry_delay: the seconds to wait before retrying after
+                a database error, e.g., the database is locked
+        """
+        self.db_file = db_file
+        self.config = config
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        # (expires, table, number) tuples, earliest first
+        self._heap = []
+        # The change counts of the tables in the heap, keyed by table name
+        self._loaded_counts = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts the reaper thread"""
+        self._thread = threading.Thread(target=self._run, name="ExpiryReaper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the reaper thread"""
+        self._stop_event.set()
+        wake_waiters()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def load(self, db, tables=EXPIRING_TABLES):
+        """
+        (Re)loads the heap with the pending expiries.
+            :param db: the database connection
+            :param tables: the tables to reload; the other tables'
+                entries are kept
+        """
+        heap = [entry for entry in self._heap if entry[1] not in tables]
+        for table in tables:
+            self._loaded_counts[table] = get_change_count(table)
+            curs = db.execute("SELECT Expires, NormalizedNo FROM {} WHERE Expires IS NOT NULL".format(table))
+            heap.extend((expires, table, number) for expires, number in curs.fetchall())
+            curs.close()
+        heapq.heapify(heap)
+        self._heap = heap
+
+    def reap(self, db):
+        """
+        Removes the entries that have expired.
+            :param db: the database connection
+            :return: the number of seconds until the next expiry, or None if none are pending
+        """
+        now = now_string()
+        reaped = set()
+        while self._heap and self._heap[0][0] <= now:
+            expires, table, number = heapq.heappop(self._heap)
+            # The entry may have been renewed since it was loaded
+            curs = db.execute(
+                "DELETE FROM {} WHERE NormalizedNo=? AND Expires<=?".format(table), (number, now))
+            if curs.rowcount > 0:
+                reaped.add(table)
+                print("Expired {} entry removed: {}".format(table.lower(), number))
+            curs.close()
+        if reaped:
+            db.commit()
+            for table in reaped:
+                count = notify_change(table)
+                # Skip the reload for our own change, unless another was made meanwhile
+                if self._loaded_counts.get(table) == count - 1:
+                    self._loaded_counts[table] = count
+
+        if not self._heap:
+            return None
+        next_expiry = datetime.strptime(self._heap[0][0][:19], EXPIRES_FORMAT)
+        return max(0.0, (next_expiry - datetime.now()).total_seconds())
+
+    def _run(self):
+        db = sqlite3.connect(self.db_file, timeout=self.timeout)
+        try:
+            since = get_total_changes()
+            changed = EXPIRING_TABLES
+            while not self._stop_event.is_set():
+                try:
+                    if changed:
+                        self.load(db, changed)
+                        changed = ()
+                    timeout = self.reap(db)
+                except sqlite3.Error as e:
+                    print("** Expiry reaper failed, retrying in {} seconds: {}".format(self.retry_delay, e))
+                    db.rollback()
+                    # The entries being removed were taken off the heap
+                    changed = EXPIRING_TABLES
+                    self._stop_event.wait(self.retry_delay)
+                    continue
+                changes = wait_for_change(since, timeout)
+                if changes != since:
+                    since = changes
+                    changed = [table for table in EXPIRING_TABLES
+                               if get_change_count(table) != self._loaded_counts.get(table)]
+        finally:
+            db.close()
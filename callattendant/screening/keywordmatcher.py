@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  keywordmatcher.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+from collections import deque
+
+
+class KeywordMatcher(object):
+    """
+    Matches text against a set of keywords with an Aho-Corasick automaton,
+    so that all the keywords are found in a single pass over the text,
+    regardless of the number of keywords. Matching is case insensitive,
+    and a "#" in a keyword matches any digit, e.g., "V###############".
+
+    Keywords can be added and removed as the rules change. An added
+    keyword extends the trie, and the failure links are recomputed
+    before the next search; a removed keyword's output is dropped
+    immediately and its nodes are pruned when the trie is compacted.
+    """
+
+    # Digits are folded into this character before matching
+    DIGIT = "#"
+
+    _FOLD = str.maketrans("0123456789", DIGIT * 10)
+
+    def __init__(self, keywords=()):
+        """
+        Builds the automaton.
+            :param keywords: an iterable of (key, keyword, reason) tuples,
+                where the key identifies the keyword, e.g., a row ID
+        """
+        # Key -> (keyword, reason) of the live keywords
+        self._keywords = {}
+        # The number of keywords removed since the trie was built
+        self._removed = 0
+        self._reset()
+        for key, keyword, reason in keywords:
+            self.add(key, keyword, reason)
+
+    def __len__(self):
+        return len(self._keywords)
+
+    def __contains__(self, key):
+        return key in self._keywords
+
+    def add(self, key, keyword, reason):
+        """
+        Adds a keyword, replacing the keyword with the same key, if any.
+            :param key: the keyword's identifier
+            :param keyword: the word or phrase to match
+            :param reason: the reason returned when the keyword matches
+        """
+        keyword = keyword.strip().upper()
+        if not keyword:
+            return
+        if key in self._keywords:
+            self.remove(key)
+        self._keywords[key] = (keyword, reason)
+        self._insert(key, keyword)
+
+    def remove(self, key):
+        """
+        Removes the keyword with the given key.
+            :param key: the keyword's identifier
+        """
+        entry = self._keywords.pop(key, None)
+        if entry is None:
+            return
+        node = self._find(entry[0].translate(self._FOLD))
+        self._outputs[node].remove(key)
+        self._removed += 1
+        # Prune the dead nodes once they outnumber the live keywords
+        if self._removed > len(self._keywords):
+            self._rebuild()
+
+    def search(self, text):
+        """
+        Finds the first keyword that occurs in the text. Of the keywords
+        ending at the same position, the longest one wins.
+            :param text: the string to search, e.g., a caller's name
+            :return: the reason associated with the matching keyword,
+                or None if no keyword matched
+        """
+        if not text:
+            return None
+        if self._dirty:
+            self._link()
+        goto, fail, outputs, out_link = self._goto, self._fail, self._outputs, self._out_link
+        text = text.upper()
+        state = 0
+        for end, char in enumerate(text.translate(self._FOLD)):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            node = state
+            while node:
+                for key in outputs[node]:
+                    keyword, reason = self._keywords[key]
+                    if self._verify(keyword, text, end):
+                        return reason
+                node = out_link[node]
+        return None
+
+    def _reset(self):
+        # Node -> {char: node}, node 0 is the root
+        self._goto = [{}]
+        # Node -> the node of its longest proper suffix in the trie
+        self._fail = [0]
+        # Node -> the keys of the keywords ending at the node
+        self._outputs = [[]]
+        # Node -> the nearest node on its failure path with outputs
+        self._out_link = [0]
+        self._dirty = False
+
+    def _rebuild(self):
+        self._reset()
+        self._removed = 0
+        for key, (keyword, reason) in self._keywords.items():
+            self._insert(key, keyword)
+
+    def _insert(self, key, keyword):
+        node = 0
+        for char in keyword.translate(self._FOLD):
+            child = self._goto[node].get(char)
+            if child is None:
+                child = len(self._goto)
+                self._goto[node][char] = child
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+                self._out_link.append(0)
+            node = child
+        self._outputs[node].append(key)
+        self._dirty = True
+
+    def _find(self, folded):
+        node = 0
+        for char in folded:
+            node = self._goto[node][char]
+        return node
+
+    def _link(self):
+        # Compute the failure and output links breadth first, so that
+        # a node's suffixes are linked before the node itself.
+        goto, fail, outputs, out_link = self._goto, self._fail, self._outputs, self._out_link
+        queue = deque()
+        for child in goto[0].values():
+            fail[child] = 0
+            out_link[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                suffix = goto[state].get(char, 0)
+                fail[child] = suffix
+                out_link[child] = suffix if outputs[suffix] else out_link[suffix]
+                queue.append(child)
+        self._dirty = False
+
+    @staticmethod
+    def _verify(keyword, text, end):
+        # The automaton matched the folded text; check any literal
+        # digits in the keyword against the original text.
+        start = end - len(keyword) + 1
+        for i, char in enumerate(keyword):
+            if char.isdigit() and text[start + i] != char:
+                return False
+        return True
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  lookupcache.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import time
+from collections import OrderedDict
+from pprint import pprint
+
+from migrations import migrate
+from screening.normalize import canonical_number
+
+
+class LookupCache(object):
+    """
+    A cache of the results from the online screening services, e.g.,
+    nomorobo. Results are persisted in the LookupCache table with an
+    expiration time, and the most recently used results are also held
+    in memory. The results are keyed on the canonical form of the number,
+    so a caller is found in whatever form the number is given.
+    """
+
+    def __init__(self, db, config):
+        """
+        Ensures database access to the LookupCache table
+            :param db:
+                The database connection used by the screening thread
+            :param config:
+                The application-wide config dict
+        """
+        self.db = db
+        self.config = config
+        self.spam_ttl = config.get("BLOCK_SERVICE_CACHE_SPAM_TTL", 0)
+        self.not_spam_ttl = config.get("BLOCK_SERVICE_CACHE_NOT_SPAM_TTL", 0)
+        self.max_size = config.get("BLOCK_SERVICE_CACHE_SIZE", 0)
+        self._country_code = str(config.get("PHONE_COUNTRY_CODE", "1"))
+
+        if self.config["DEBUG"]:
+            print("Initializing LookupCache")
+
+        migrate(self.db, self.config)
+
+        # Discard the stale results
+        self.db.execute("DELETE FROM LookupCache WHERE Expires <= ?", (int(time.time()),))
+        self.db.commit()
+
+        # The in-memory LRU cache: (service, number) -> (result, expires)
+        self._lru = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+        if self.config["DEBUG"]:
+            print("LookupCache initialized")
+
+    def get(self, service, number):
+        """
+        Gets a cached lookup result.
+            :param service: the name of the service, e.g., "NOMOROBO"
+            :param number: the phone number
+            :return: a copy of the result dict, or None if not cached or expired
+        """
+        number = canonical_number(number, self._country_code)
+        key = (service, number)
+        now = time.time()
+        entry = self._lru.get(key)
+        if entry is not None:
+            result, expires = entry
+            if expires > now:
+                self._lru.move_to_end(key)
+                self.memory_hits += 1
+                return dict(result)
+            del self._lru[key]
+
+        sql = """SELECT Spam, Score, Reason, Expires FROM LookupCache
+            WHERE Service=? AND PhoneNo=? AND Expires > ?"""
+        curs = self.db.execute(sql, (service, number, int(now)))
+        row = curs.fetchone()
+        curs.close()
+        if row is None:
+            self.misses += 1
+            return None
+
+        result = {"spam": bool(row[0]), "score": row[1], "reason": row[2]}
+        self._remember(key, result, row[3])
+        self.db_hits += 1
+        return dict(result)
+
+    def put(self, service, number, result):
+        """
+        Caches a lookup result. Spam and non-spam results are kept
+        for different lengths of time.
+            :param service: the name of the service, e.g., "NOMOROBO"
+            :param number: the phone number
+            :param result: a dict with "spam", "score" and "reason" items
+            :return: True if the result was cached
+        """
+        ttl = self.spam_ttl if result["spam"] else self.not_spam_ttl
+        if ttl <= 0:
+            return False
+
+        number = canonical_number(number, self._country_code)
+        expires = int(time.time() + ttl)
+        sql = """INSERT OR REPLACE INTO LookupCache(
+            Service,
+            PhoneNo,
+            Spam,
+            Score,
+            Reason,
+            Expires) VALUES(?,?,?,?,?,?)"""
+        arguments = [
+            service,
+            number,
+            result["spam"],
+            result["score"],
+            result["reason"],
+            expires]
+        try:
+            self.db.execute(sql, arguments)
+            self.db.commit()
+        except Exception as e:
+            print("** Failed to add lookup result to cache:")
+            pprint(e)
+            return False
+
+        self._remember((service, number), dict(result), expires)
+        return True
+
+    def stats(self):
+        """
+        Returns the cache statistics.
+            :return: a dict containing the hit and miss counts
+        """
+        hits = self.memory_hits + self.db_hits
+        total = hits + self.misses
+        return {
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": (hits / total) if total else 0.0,
+            "memory_size": len(self._lru),
+        }
+
+    def _remember(self, key, result, expires):
+        if self.max_size <= 0:
+            return
+        self._lru[key] = (result, expires)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  namerules.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+from datetime import datetime
+from pprint import pprint
+from migrations import migrate
+from screening.keywordmatcher import KeywordMatcher
+from screening.query_db import query_db
+from screening.tablechanges import get_change_count, get_changed_keys, notify_change
+
+
+class NameRules(object):
+    """
+    Blocks callers by keywords or phrases in the caller ID name, e.g.,
+    "CARD SERVICES" or "WIRELESS CALLER". A "#" in a keyword matches
+    any digit, e.g., "V###############" matches a V followed by 15 digits.
+    The rules are kept in the NameRules table and are compiled into an
+    Aho-Corasick automaton that matches all of them in one pass.
+    """
+
+    def __init__(self, db, config):
+        """Ensures database access to the NameRules table"""
+        self.db = db
+        self.config = config
+        # The automaton is built on first use, and is kept in
+        # sync with the table by applying only the changed rows.
+        self._matcher = None
+        self._change_count = None
+
+        if self.config["DEBUG"]:
+            print("Initializing NameRules")
+
+        migrate(self.db, self.config)
+
+        if self.config["DEBUG"]:
+            print("NameRules initialized")
+
+    @staticmethod
+    def validate_keyword(keyword):
+        """
+        Checks that the keyword is not blank.
+            :return: True if valid; and a string containing the error, if any
+        """
+        if not keyword or not keyword.strip():
+            return False, "The keyword must not be blank"
+        return True, ""
+
+    def add_rule(self, keyword, reason=""):
+        """
+        Adds a keyword to be blocked.
+            :param keyword: a word or phrase, e.g., "CARD SERVICES"
+            :param reason: an optional string indicating the
+                reason the rule was added
+            :return: True if successful
+        """
+        valid, error = self.validate_keyword(keyword)
+        if not valid:
+            print("** Failed to add name rule: {}".format(error))
+            return False
+
+        query = '''INSERT INTO NameRules(
+            Keyword,
+            Reason,
+            SystemDateTime) VALUES(?,?,?)'''
+        arguments = [
+            keyword.strip().upper(),
+            reason,
+            (datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:19])
+        ]
+        try:
+            curs = self.db.execute(query, arguments)
+            self.db.commit()
+            notify_change("NameRules", curs.lastrowid)
+            if self.config["DEBUG"]:
+                print("New name rule added")
+                pprint(arguments)
+        except Exception as e:
+            print("** Failed to add name rule:")
+            pprint(e)
+            return False
+        return True
+
+    def update_rule(self, rule_id, keyword, reason):
+        """
+        Updates the record for the given rule
+        :param rule_id: the rule ID (key)
+        :param keyword: new keyword
+        :param reason: new reason
+        """
+        valid, error = self.validate_keyword(keyword)
+        if not valid:
+            print("** Failed to update name rule: {}".format(error))
+            return False
+
+        sql = """UPDATE NameRules
+            SET Keyword=:keyword, Reason=:reason, SystemDateTime=:time
+            WHERE RuleID=:rule_id"""
+        arguments = {
+            "rule_id": rule_id,
+            "keyword": keyword.strip().upper(),
+            "reason": reason,
+            "time": (datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:19])
+            }
+        try:
+            self.db.execute(sql, arguments)
+            self.db.commit()
+            notify_change("NameRules", rule_id)
+        except Exception as e:
+            print("** Failed to update name rule:")
+            pprint(e)
+            return False
+
+        if self.config["DEBUG"]:
+            print("Name rule updated")
+            pprint(arguments)
+        return True
+
+    def remove_rule(self, rule_id):
+        '''Removes the record for the given rule ID'''
+        query = 'DELETE FROM NameRules WHERE RuleID=:rule_id'
+        arguments = {'rule_id': rule_id}
+        try:
+            self.db.execute(query, arguments)
+            self.db.commit()
+            notify_change("NameRules", rule_id)
+        except Exception as e:
+            print("** Failed to delete name rule:")
+            pprint(e)
+            return False
+        if self.config["DEBUG"]:
+            print("Name rule removed")
+            pprint(arguments)
+        return True
+
+    def check_name(self, name):
+        """
+        Checks if the name contains a blocked keyword
+            :param name: the caller ID name
+            :returns: True if found; and a string containing the reason
+        """
+        self.refresh()
+        reason = self.search(name)
+        if reason is None:
+            return False, ""
+        return True, reason
+
+    def search(self, name):
+        """
+        Finds the first keyword in the name without checking the table
+        for changes, e.g., when screening a batch; call refresh first.
+            :param name: the caller ID name
+            :returns: the reason associated with the keyword, or None
+        """
+        return self._matcher.search(name)
+
+    def refresh(self):
+        """
+        Applies the rows changed since the automaton was last
+        synchronized with the table, building it on first use.
+        """
+        change_count = get_change_count("NameRules")
+        if self._matcher is not None and change_count == self._change_count:
+            return
+        rule_ids = None
+        if self._matcher is not None:
+            rule_ids = get_changed_keys("NameRules", self._change_count)
+        self._change_count = change_count
+
+        if rule_ids is None:
+            # First use, or too many or unknown changes: rebuild the automaton
+            self._matcher = KeywordMatcher(
+                (rule_id, keyword, reason if reason is not None else "")
+                for rule_id, keyword, reason in self.get_rules())
+        else:
+            query = "SELECT Keyword, Reason FROM NameRules WHERE RuleID=?"
+            for rule_id in set(rule_ids):
+                row = query_db(self.db, query, (rule_id,), True)
+                if row is not None:
+                    keyword, reason = row
+                    self._matcher.add(rule_id, keyword, reason if reason is not None else "")
+                else:
+                    self._matcher.remove(rule_id)
+
+        if self.config["DEBUG"]:
+            print("Name rules loaded: {} keywords".format(len(self._matcher)))
+
+    def get_rules(self):
+        """Returns all the rules: (RuleID, Keyword, Reason) tuples"""
+        query = "SELECT RuleID, Keyword, Reason FROM NameRules ORDER BY Keyword"
+        return query_db(self.db, query, (), False)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  neighborspoof.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+from collections import Counter
+
+from screening.calllogger import PERMITTED
+from screening.normalize import call_log_key
+from screening.tablechanges import get_change_count, get_changed_keys
+
+
+def split_number(number):
+    """
+    Splits a North American number into its area code (NPA) and exchange (NXX).
+        :param number: the phone number, digits only, with or without a leading 1
+        :return: a (NPA, NXX) tuple, or None if not a 10 digit number
+    """
+    if number is None:
+        return None
+    if len(number) == 11 and number.startswith("1"):
+        number = number[1:]
+    if len(number) != 10 or not number.isdigit():
+        return None
+    return number[:3], number[3:6]
+
+
+class NeighborSpoofDetector(object):
+    """
+    Detects "neighbor spoofing": calls from numbers made up to share the
+    area code and exchange of the number being called. A call is scored
+    by how closely its prefix matches the home number, plus its history:
+
+        +2  same area code and exchange as the home number
+        +1  same area code only
+        +1  never called before
+        +1  never permitted, i.e., not whitelisted or permitted in the call log
+        -1  the exchange has whitelisted or permitted callers
+
+    The prefixes and numbers seen in the whitelist and call log are
+    indexed up front, so scoring a call is O(1). The numbers are indexed
+    by their CallLog NormalizedNo, see screening.normalize.call_log_key.
+    """
+
+    def __init__(self, db, config):
+        """
+        Loads the index from the Whitelist and CallLog tables.
+            :param db:
+                The database connection used by the screening thread
+            :param config:
+                The application-wide config dict
+        """
+        self.db = db
+        self.config = config
+        self.country_code = str(config.get("PHONE_COUNTRY_CODE", "1"))
+        self.home = split_number(config["BLOCK_NEIGHBOR_HOME_NUMBER"])
+        self.threshold = config["BLOCK_NEIGHBOR_THRESHOLD"]
+        # The numbers in the call log
+        self._seen = set()
+        # The numbers permitted in the call log
+        self._permitted = set()
+        # The numbers in the whitelist, without an expiry
+        self._whitelisted = set()
+        # NPA-NXX -> count of the permitted or whitelisted numbers in the exchange
+        self._exchanges = Counter()
+        self._change_count = None
+
+        self.load()
+
+    def load(self):
+        """
+        (Re)loads the index from the database tables.
+        """
+        self._change_count = get_change_count("Whitelist")
+        self._seen = set()
+        self._permitted = set()
+        self._exchanges = Counter()
+
+        queries = (
+            ("SELECT DISTINCT NormalizedNo FROM CallLog", self._seen),
+            ("SELECT DISTINCT NormalizedNo FROM CallLog WHERE Action={}".format(PERMITTED), self._permitted),
+        )
+        for sql, numbers in queries:
+            curs = self.db.execute(sql)
+            numbers.update(row[0] for row in curs)
+            curs.close()
+        self._whitelisted = self._load_whitelisted()
+        for number in self._permitted | self._whitelisted:
+            self._count_exchange(number, 1)
+
+        if self.config["DEBUG"]:
+            print("Neighbor spoof index loaded: {} callers, {} permitted, {} exchanges".format(
+                len(self._seen), len(self._permitted | self._whitelisted), len(self._exchanges)))
+
+    def score(self, number):
+        """
+        Scores the likelihood that the number is spoofed.
+            :param number: the caller's number
+            :return: the score; 0 if not a local number
+        """
+        key = call_log_key(number, self.country_code)
+        prefix = split_number(str(key))
+        if prefix is None or self.home is None or prefix[0] != self.home[0]:
+            return 0
+
+        # Pick up the numbers whitelisted or removed since the index was loaded
+        if get_change_count("Whitelist") != self._change_count:
+            self._update_whitelisted()
+
+        score = 2 if prefix == self.home else 1
+        if key not in self._seen:
+            score += 1
+        if key not in self._permitted and key not in self._whitelisted:
+            score += 1
+        if self._exchanges[prefix]:
+            score -= 1
+        return score
+
+    def check_number(self, number):
+        """
+        Checks if the number is likely spoofed, and records the call.
+            :param number: the caller's number
+            :returns: True if the score meets the threshold; and a string containing the reason
+        """
+        score = self.score(number)
+        self._seen.add(call_log_key(number, self.country_code))
+        if score >= self.threshold:
+            return True, "Neighbor spoofing with score {}".format(score)
+        return False, ""
+
+    def record_permitted(self, number):
+        """Records a permitted call so the number and its exchange are trusted"""
+        key = call_log_key(number, self.country_code)
+        if key not in self._permitted:
+            self._permitted.add(key)
+            if key not in self._whitelisted:
+                self._count_exchange(key, 1)
+
+    def _load_whitelisted(self, numbers=None):
+        """
+        Reads the whitelisted numbers without an expiry.
+            :param numbers: the normalized numbers to read, or None for all
+            :return: a set of CallLog NormalizedNo values
+        """
+        sql = "SELECT NormalizedNo FROM Whitelist WHERE Expires IS NULL"
+        if numbers is None:
+            rows = self.db.execute(sql).fetchall()
+        else:
+            rows = []
+            for number in numbers:
+                rows.extend(self.db.execute(sql + " AND NormalizedNo=?", (number,)).fetchall())
+        return set(call_log_key(row[0], self.country_code) for row in rows)
+
+    def _update_whitelisted(self):
+        """
+        Adds and removes the numbers changed in the Whitelist since
+        the index was loaded, without reading the CallLog.
+        """
+        count = get_change_count("Whitelist")
+        numbers = get_changed_keys("Whitelist", self._change_count)
+        self._change_count = count
+        if numbers is None:
+            # Too many or unknown changes: compare the whole whitelist
+            whitelisted = self._load_whitelisted()
+            changed = whitelisted ^ self._whitelisted
+        else:
+            whitelisted = self._load_whitelisted(set(numbers))
+            changed = set(call_log_key(number, self.country_code) for number in numbers)
+        for key in changed:
+            if key in whitelisted and key not in self._whitelisted:
+                self._whitelisted.add(key)
+                if key not in self._permitted:
+                    self._count_exchange(key, 1)
+            elif key not in whitelisted and key in self._whitelisted:
+                self._whitelisted.discard(key)
+                if key not in self._permitted:
+                    self._count_exchange(key, -1)
+
+    def _count_exchange(self, number, increment):
+        prefix = split_number(str(number))
+        if prefix is not None:
+            self._exchanges[prefix] += increment
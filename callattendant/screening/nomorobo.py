@@ -24,26 +24,113 @@
 #  SOFTWARE.
 
 
+import urllib.error
 import urllib.request
-from bs4 import BeautifulSoup
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+from screening.connectionpool import ConnectionPool
+
+# The User-Agent that urllib sent before the lookups used the connection pool
+USER_AGENT = "Python-urllib/{}".format(urllib.request.__version__)
+
+# The redirect responses that are followed
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+class ProfileParser(HTMLParser):
+    """
+    Extracts the text of the first "profile-position" and "profile-title"
+    elements from a nomorobo lookup page. The page is fed in chunks and
+    parsing stops as soon as both have been found, so a DOM is never built.
+    """
+
+    # Elements that never have an end tag
+    VOID_ELEMENTS = frozenset((
+        "area", "base", "br", "col", "embed", "hr", "img", "input",
+        "link", "meta", "param", "source", "track", "wbr"))
+
+    FIELDS = ("profile-position", "profile-title")
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.found = {}
+        self._field = None
+        self._text = []
+        self._depth = 0
+
+    @property
+    def done(self):
+        return len(self.found) == len(self.FIELDS)
+
+    def parse(self, content, chunk_size=4096):
+        """
+        Parses the page until both fields have been found.
+            :param content: the page as bytes or str
+            :return: a dict containing the text of the fields found
+        """
+        if isinstance(content, bytes):
+            content = content.decode("utf-8", errors="replace")
+        for i in range(0, len(content), chunk_size):
+            self.feed(content[i:i + chunk_size])
+            if self.done:
+                break
+        return self.found
+
+    def handle_starttag(self, tag, attrs):
+        if self._field is not None:
+            if tag not in self.VOID_ELEMENTS:
+                self._depth += 1
+            return
+        for name, value in attrs:
+            if name == "class" and value:
+                classes = value.split()
+                for field in self.FIELDS:
+                    if field in classes and field not in self.found:
+                        if tag in self.VOID_ELEMENTS:
+                            self.found[field] = ""
+                        else:
+                            self._field = field
+                            self._text = []
+                            self._depth = 1
+                        return
+
+    def handle_startendtag(self, tag, attrs):
+        if self._field is None:
+            self.handle_starttag(tag, attrs)
+            if self._field is not None:
+                # An empty element, e.g., <div class="profile-title"/>
+                self.found[self._field] = ""
+                self._field = None
+
+    def handle_endtag(self, tag):
+        if self._field is None or tag in self.VOID_ELEMENTS:
+            return
+        self._depth -= 1
+        if self._depth <= 0:
+            self.found[self._field] = "".join(self._text)
+            self._field = None
+
+    def handle_data(self, data):
+        if self._field is not None:
+            self._text.append(data)
 
 
 class NomoroboService(object):
 
     def lookup_number(self, number):
         number = '{}-{}-{}'.format(number[0:3], number[3:6], number[6:])
-        url = "https://www.nomorobo.com/lookup/%s" % number
+        url = "%s/lookup/%s" % (self.base_url, number)
         # print(url)
         headers = {}
         allowed_codes = [404]  # allow not found response
-        content = self.http_get(url, headers, allowed_codes)
-        soup = BeautifulSoup(content, "lxml")  # lxml HTML parser: fast
+        status, content = self.http_get(url, headers, allowed_codes)
+        profile = ProfileParser().parse(content)
 
         score = 0  # = no spam
 
-        positions = soup.findAll(class_="profile-position")
-        if len(positions) > 0:
-            position = positions[0].get_text()
+        position = profile.get("profile-position")
+        if position is not None:
             if position.upper().find("DO NOT ANSWER") > -1:
                 # print("Spammer!")
                 score = 2  # = is spam
@@ -52,10 +139,9 @@ class NomoroboService(object):
                 score = 1  # = might be spam (caller is "Political", "Charity", or "Debt Collector")
 
         reason = ""
-        titles = soup.findAll(class_="profile-title")
-        if len(titles) > 0:
-            reason = titles[0].get_text()
-            reason = reason.replace("\n", "").strip(" ")
+        title = profile.get("profile-title")
+        if title is not None:
+            reason = title.replace("\n", "").strip(" ")
             # TODO: if score == 1, check for "Political", "Charity", and/or "Debt Collector"
             # in the reason and adjust the score if appropriate
 
@@ -68,19 +154,38 @@ class NomoroboService(object):
         }
         return result
 
-    def http_get(self, url, add_headers={}, allowed_codes=[]):
-        data = ""
-        try:
-            request = urllib.request.Request(url, headers=add_headers)
-            response = urllib.request.urlopen(request, timeout=5)
-            data = response.read()
-        except urllib.error.HTTPError as e:
-            code = e.getcode()
-            if code not in allowed_codes:
-                raise
-            data = e.read()
-        return data
-
-    def __init__(self, spam_threshold=2):
+    def http_get(self, url, add_headers={}, allowed_codes=[], max_redirects=5):
+        """
+        Gets the page on a pooled connection, following redirects.
+            :param url: the absolute URL
+            :param add_headers: a dict of additional request headers
+            :param allowed_codes: the error statuses that return the page
+            :param max_redirects: the max number of redirects followed
+            :return: the response status and the page
+        """
+        headers = {"User-Agent": USER_AGENT}
+        headers.update(add_headers)
+        for redirects in range(max_redirects + 1):
+            response, data = self._pool.request("GET", url, headers)
+            location = response.getheader("Location")
+            if response.status in REDIRECT_CODES and location and redirects < max_redirects:
+                url = urljoin(url, location)
+                continue
+            if response.status >= 300 and response.status not in allowed_codes:
+                raise urllib.error.HTTPError(url, response.status, response.reason, response.msg, None)
+            return response.status, data
+
+    def warm_up(self):
+        """Resolves the host and connects to nomorobo ahead of the next lookup."""
+        self._pool.warm_up(self.base_url, headers={"User-Agent": USER_AGENT})
+
+    def close(self):
+        """Closes the pooled connections."""
+        self._pool.close()
+
+    def __init__(self, spam_threshold=2, timeout=5, base_url="https://www.nomorobo.com"):
 
         self.spam_threshold = spam_threshold
+        self.timeout = timeout
+        self.base_url = base_url
+        self._pool = ConnectionPool(timeout=timeout)
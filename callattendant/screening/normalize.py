@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  normalize.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+from functools import lru_cache
+
+
+@lru_cache(maxsize=10000)
+def canonical_number(number, country_code="1"):
+    """
+    Converts a phone number, in whatever form the carrier or the user
+    supplied it, to the canonical E.164 form used as the lookup key in
+    the Whitelist, Blacklist and CallLog tables. For example, with the
+    default country code, "8055551234", "18055551234", "805-555-1234"
+    and "+1 (805) 555-1234" all become "+18055551234". The results are
+    memoized, as the same numbers are normalized over and over.
+        :param number: the number; an "O" (out of area), "P" (private)
+            or other caller ID without digits is returned as is
+        :param country_code: the local country calling code, e.g., "1"
+        :return: the E.164 number, or the digits of a short number,
+            e.g., an extension
+    """
+    if number is None:
+        return None
+    number = number.strip()
+    digits = "".join(c for c in number if c.isdigit())
+    if not digits:
+        return number.upper()
+    if len(digits) < 7:
+        return digits
+
+    if number.startswith("+"):
+        return "+" + digits
+    if country_code == "1":
+        # North American Numbering Plan: 011 is the international prefix
+        if digits.startswith("011"):
+            return "+" + digits[3:]
+        if len(digits) == 10:
+            return "+1" + digits
+        if len(digits) == 11 and digits.startswith("1"):
+            return "+" + digits
+        return digits
+    # Elsewhere, 00 is the usual international prefix and 0 the trunk prefix
+    if digits.startswith("00"):
+        return "+" + digits[2:]
+    if digits.startswith("0"):
+        return "+" + country_code + digits[1:]
+    if digits.startswith(country_code):
+        return "+" + digits
+    return "+" + country_code + digits
+
+
+def national_number(number, country_code="1"):
+    """
+    Converts a phone number to the national number it's dialed as within
+    the country, which the blocked ranges' prefixes are matched against.
+    For example, with the default country code, "18005551212" and
+    "+1 (800) 555-1212" both become "8005551212".
+        :param number: the number
+        :param country_code: the local country calling code, e.g., "1"
+        :return: the national number digits; or the E.164 number of a
+            foreign number, the digits of a short number, or the caller ID
+            as is if it doesn't contain digits
+    """
+    number = canonical_number(number, country_code)
+    if number and number.startswith("+" + country_code):
+        return number[len(country_code) + 1:]
+    return number
+
+
+def call_log_key(number, country_code="1"):
+    """
+    Converts a phone number to the NormalizedNo stored in the CallLog
+    table: the digits of its E.164 form as an integer, which is smaller
+    than the text and faster to compare. For example, "805-555-1234"
+    becomes 18055551234.
+        :param number: the number
+        :param country_code: the local country calling code, e.g., "1"
+        :return: an int; or the caller ID as is if it doesn't contain
+            digits, e.g., "P" (private)
+    """
+    number = canonical_number(number, country_code)
+    if number and number.lstrip("+").isdigit():
+        return int(number.lstrip("+"))
+    return number
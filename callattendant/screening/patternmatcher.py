@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  patternmatcher.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import re
+
+
+class PatternMatcher(object):
+    """
+    Matches text against a dict of regular expressions, e.g., the
+    BLOCK_NAME_PATTERNS setting: {"regex": "reason", ... }. The
+    patterns are compiled into a single expression when the matcher
+    is created so that a search is done in one pass, and the result
+    is the same as testing each pattern in turn with re.search.
+    """
+
+    # Patterns that cannot be combined with others: those with named
+    # groups, backreferences or conditional group references (group
+    # numbers change when combined) and those starting with global
+    # inline flags, e.g., "(?i)".
+    _STANDALONE = re.compile(r"\\[1-9]|\(\?P[<=]|\(\?\(|^\(\?[aiLmsux]+\)")
+
+    def __init__(self, patterns):
+        """
+        Compiles the patterns.
+            :param patterns:
+                A dict of regular expression strings and their reasons
+        """
+        self._reasons = {}
+        # A list of (regex, reason) tuples tested in order. Consecutive
+        # patterns that can be combined share a single expression and
+        # their reasons are found by the name of the matching group.
+        self._segments = []
+        alternatives = []
+        for index, (pattern, reason) in enumerate(patterns.items()):
+            if self._STANDALONE.search(pattern):
+                if alternatives:
+                    self._segments.append((self._combine(alternatives), None))
+                    alternatives = []
+                self._segments.append((re.compile(pattern), reason))
+            else:
+                group = "_{}".format(index)
+                self._reasons[group] = reason
+                alternatives.append((group, pattern))
+        if alternatives:
+            self._segments.append((self._combine(alternatives), None))
+        self._count = len(patterns)
+
+    def __len__(self):
+        return self._count
+
+    def search(self, text):
+        """
+        Finds the first pattern that matches anywhere in the text.
+            :param text:
+                The string to search, e.g., a caller's name or number
+            :return:
+                The reason associated with the matching pattern,
+                or None if no pattern matched
+        """
+        for regex, reason in self._segments:
+            if reason is None:
+                match = regex.match(text)
+                if match:
+                    return self._reasons[match.lastgroup]
+            elif regex.search(text):
+                return reason
+        return None
+
+    @staticmethod
+    def _combine(alternatives):
+        # Each pattern is wrapped in a lookahead that scans the text from
+        # the start, followed by an empty named group that identifies the
+        # pattern. Alternatives are tried in order, so the first pattern
+        # that matches anywhere in the text wins, just like re.search.
+        expr = "|".join(
+            r"(?=[\s\S]*?(?:{}))(?P<{}>)".format(pattern, group)
+            for group, pattern in alternatives)
+        return re.compile(expr)
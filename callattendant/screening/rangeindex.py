@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  rangeindex.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import heapq
+from bisect import bisect_right
+
+
+class RangeIndex(object):
+    """
+    An interval index of the blocked number ranges. The ranges are grouped
+    by prefix length, and the overlapping ranges in each group are split
+    into a sorted list of disjoint intervals, so checking a number costs a
+    binary search per distinct prefix length, regardless of the number of
+    ranges. Where ranges overlap, the most specific one wins: the longest
+    prefix, then the narrowest range, then the first one given, the same
+    as BlockedRanges.check_number.
+    """
+
+    def __init__(self, ranges=()):
+        """
+        Constructor.
+            :param ranges: an iterable of (low, high, reason) tuples,
+                e.g., in RangeID order
+        """
+        # Prefix length -> (lows, highs, reasons) of the disjoint intervals
+        self._groups = {}
+        self._count = 0
+
+        by_length = {}
+        for low, high, reason in ranges:
+            by_length.setdefault(len(low), []).append(
+                (int(low), int(high), self._count, reason if reason is not None else ""))
+            self._count += 1
+
+        for length, intervals in by_length.items():
+            self._groups[length] = self._split(intervals, length)
+
+        # Check the longest, i.e., most specific, prefixes first
+        self._lengths = sorted(self._groups, reverse=True)
+
+    @staticmethod
+    def _split(intervals, length):
+        """
+        Splits the ranges at their boundaries into disjoint intervals, each
+        with the reason of the narrowest range covering it.
+            :param intervals: a list of (low, high, order, reason) tuples
+            :param length: the prefix length, to format the bounds with
+            :return: the (lows, highs, reasons) lists of the intervals
+        """
+        intervals.sort()
+        bounds = sorted(set([low for low, high, order, reason in intervals] +
+                            [high + 1 for low, high, order, reason in intervals]))
+        # The ranges covering the current interval: (width, order, high, reason)
+        covering = []
+        lows, highs, reasons = [], [], []
+        i = 0
+        for start, end in zip(bounds, bounds[1:]):
+            while i < len(intervals) and intervals[i][0] <= start:
+                low, high, order, reason = intervals[i]
+                heapq.heappush(covering, (high - low, order, high, reason))
+                i += 1
+            while covering and covering[0][2] < start:
+                heapq.heappop(covering)
+            if not covering:
+                continue
+            reason = covering[0][3]
+            if highs and highs[-1] == start - 1 and reasons[-1] == reason:
+                highs[-1] = end - 1
+            else:
+                lows.append(start)
+                highs.append(end - 1)
+                reasons.append(reason)
+
+        def fmt(bound):
+            return "{:0{}d}".format(bound, length)
+
+        return [fmt(low) for low in lows], [fmt(high) for high in highs], reasons
+
+    def __len__(self):
+        return self._count
+
+    def search(self, number):
+        """
+        Finds the range containing the number.
+            :param number: the national number, digits only,
+                see screening.normalize.national_number
+            :return: the reason string if found, otherwise None
+        """
+        for length in self._lengths:
+            if length > len(number):
+                continue
+            prefix = number[:length]
+            lows, highs, reasons = self._groups[length]
+            i = bisect_right(lows, prefix) - 1
+            if i >= 0 and prefix <= highs[i]:
+                return reasons[i]
+        return None
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  reputation.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import abc
+import json
+import os
+import threading
+import urllib.error
+
+from screening.connectionpool import ConnectionPool
+from screening.nomorobo import NomoroboService
+from screening.normalize import canonical_number
+from screening.spamsnapshot import SpamSnapshot, number_key
+
+
+class ReputationService(abc.ABC):
+    """
+    The interface for an online or local caller reputation source, e.g.,
+    nomorobo. Implementations are registered by name with register_service
+    and are selected with the BLOCK_SERVICE setting.
+    """
+
+    # True if the results may be saved in the lookup cache
+    cacheable = True
+
+    @abc.abstractmethod
+    def lookup_number(self, number):
+        """
+        Looks up the reputation of a phone number.
+            :param number: the phone number, digits only
+            :return: a dict containing "spam" (bool), "score" (int) and "reason" (str),
+                and "cacheable": False if the result must not be cached
+        """
+
+    def warm_up(self):
+        """
+        Prepares the service for the first lookup, e.g., opens a connection.
+        Called once, in a background thread at startup.
+        """
+        pass
+
+    def close(self):
+        """Releases the service's resources, e.g., its connections."""
+        pass
+
+
+class SpamListService(ReputationService):
+    """
+    A local spam database: a text file containing one number per line,
+    optionally followed by a comma and a reason. Lines starting with #
+    are ignored. The numbers may be in any format, e.g., "800-555-1212"
+    or "+1 800 555 1212", and are matched by their E.164 form. The file
+    is reloaded when it is modified.
+    """
+
+    cacheable = False
+
+    def __init__(self, filename, country_code="1"):
+        """
+        Constructor.
+            :param filename: the path to the spam list file
+            :param country_code: the local country calling code
+        """
+        self.filename = filename
+        self.country_code = country_code
+        # E.164 number -> reason
+        self._numbers = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def lookup_number(self, number):
+        with self._lock:
+            self._load()
+            reason = self._numbers.get(canonical_number(number, self.country_code))
+        if reason is None:
+            return {"spam": False, "score": 0, "reason": ""}
+        return {"spam": True, "score": 2, "reason": reason}
+
+    def warm_up(self):
+        """Reads the file ahead of the first lookup."""
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        """Loads the file if it has been changed since it was last read"""
+        try:
+            mtime = os.stat(self.filename).st_mtime
+        except OSError:
+            self._numbers = {}
+            self._mtime = None
+            return
+        if mtime == self._mtime:
+            return
+
+        numbers = {}
+        with open(self.filename, mode="r") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                number, _, reason = line.partition(",")
+                if any(c.isdigit() for c in number):
+                    numbers[canonical_number(number, self.country_code)] = reason.strip() or "Spam list"
+        self._numbers = numbers
+        self._mtime = mtime
+
+
+class SnapshotService(ReputationService):
+    """
+    A local snapshot of known spam numbers, built from a file we supply
+    with the admin build-snapshot command, e.g., nightly. The snapshot is
+    memory-mapped and binary searched. When the file is replaced, the new
+    snapshot is opened and swapped in while lookups continue to use the
+    previous one.
+    """
+
+    cacheable = False
+
+    def __init__(self, filename, country_code="1"):
+        """
+        Constructor.
+            :param filename: the path to the snapshot file
+            :param country_code: the local country calling code
+        """
+        self.filename = filename
+        self.country_code = country_code
+        self._snapshot = None
+        self._reloading = threading.Lock()
+
+    def lookup_number(self, number):
+        self._refresh()
+        snapshot = self._snapshot
+        key = number_key(number, self.country_code)
+        if snapshot is None or key is None or key not in snapshot:
+            return {"spam": False, "score": 0, "reason": ""}
+        return {"spam": True, "score": 2, "reason": "Spam snapshot"}
+
+    def warm_up(self):
+        """Opens the snapshot ahead of the first lookup."""
+        self._refresh()
+
+    def _refresh(self):
+        """Opens the snapshot file if it has been replaced since it was opened"""
+        if not self._reloading.acquire(blocking=self._snapshot is None):
+            # Another thread is opening it; use the current snapshot
+            return
+        try:
+            try:
+                mtime = os.stat(self.filename).st_mtime
+            except OSError:
+                self._snapshot = None
+                return
+            if self._snapshot is not None and self._snapshot.mtime == mtime:
+                return
+            try:
+                self._snapshot = SpamSnapshot(self.filename)
+            except (OSError, ValueError) as e:
+                print("* Unable to open the spam snapshot: {}".format(e))
+        finally:
+            self._reloading.release()
+
+
+class HttpReputationService(ReputationService):
+    """
+    A generic HTTP reputation service, e.g., a shop-wide spam database.
+    The URL contains a {} placeholder for the number and the service
+    responds with a JSON object containing "spam", "score" and "reason".
+    """
+
+    def __init__(self, url, timeout=5):
+        """
+        Constructor.
+            :param url: the URL template, e.g., "http://localhost:8080/lookup/{}"
+            :param timeout: the request timeout in seconds
+        """
+        self.url = url
+        self.timeout = timeout
+        self._pool = ConnectionPool(timeout=timeout)
+
+    def warm_up(self):
+        """Resolves the host and connects to the service ahead of the next lookup."""
+        self._pool.warm_up(self.url)
+
+    def lookup_number(self, number):
+        url = self.url.format(number)
+        response, body = self._pool.request("GET", url, {"Accept": "application/json"})
+        if response.status != 200:
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.msg, None)
+        data = json.loads(body.decode("utf-8"))
+        return {
+            "spam": bool(data.get("spam", False)),
+            "score": int(data.get("score", 0)),
+            "reason": data.get("reason", ""),
+        }
+
+    def close(self):
+        """Closes the pooled connections."""
+        self._pool.close()
+
+
+# The registered reputation services: name -> factory(config)
+_services = {}
+
+
+def register_service(name, factory):
+    """
+    Registers a reputation service so that it can be named in BLOCK_SERVICE.
+        :param name: the service name, e.g., "NOMOROBO"
+        :param factory: a callable that takes the config and returns the service
+    """
+    _services[name.upper()] = factory
+
+
+def get_service_names(config):
+    """
+    Returns the names of the services selected by the BLOCK_SERVICE setting,
+    which is either a single name or a list of names.
+        :param config: the application config dict
+        :return: a list of upper case service names; empty if disabled
+    """
+    names = config["BLOCK_SERVICE"]
+    if not names:
+        return []
+    if isinstance(names, str):
+        names = [names]
+    return [name.upper() for name in names if name]
+
+
+def service_timeout(config, name):
+    """
+    Returns the latency budget of a service: its BLOCK_SERVICE_TIMEOUTS
+    entry, or the BLOCK_SERVICE_TIMEOUT if it doesn't have one.
+        :param config: the application config dict
+        :param name: the upper case service name
+        :return: the number of seconds
+    """
+    return config.get("BLOCK_SERVICE_TIMEOUTS", {}).get(name, config["BLOCK_SERVICE_TIMEOUT"])
+
+
+def create_services(config):
+    """
+    Creates the services selected by the BLOCK_SERVICE setting.
+        :param config: the application config dict
+        :return: an ordered list of (name, service) tuples
+    """
+    services = []
+    for name in get_service_names(config):
+        factory = _services.get(name)
+        if factory is None:
+            print("* BLOCK_SERVICE not supported: {}".format(name))
+            continue
+        services.append((name, factory(config)))
+    return services
+
+
+def merge_results(results, policy="any"):
+    """
+    Merges the results from several services into a single verdict.
+        :param results: a list of (name, result) tuples
+        :param policy: "any" if one spam result is sufficient, "majority"
+            if more than half must agree, or "all" if all must agree
+        :return: the merged result dict, or None if there are no results
+    """
+    if not results:
+        return None
+
+    spam = [result for name, result in results if result["spam"]]
+    if policy == "all":
+        is_spam = len(spam) == len(results)
+    elif policy == "majority":
+        is_spam = len(spam) * 2 > len(results)
+    else:
+        is_spam = len(spam) > 0
+
+    if is_spam:
+        # Report the spam result with the highest score
+        return max(spam, key=lambda result: result["score"])
+    # Report the highest score, e.g., a nuisance caller, but not spam
+    best = max((result for name, result in results), key=lambda result: result["score"])
+    return {"spam": False, "score": best["score"], "reason": best["reason"]}
+
+
+register_service("NOMOROBO", lambda config: NomoroboService(timeout=service_timeout(config, "NOMOROBO")))
+register_service("SPAMLIST", lambda config: SpamListService(
+    config["BLOCK_SERVICE_SPAMLIST_FILE"], str(config.get("PHONE_COUNTRY_CODE", "1"))))
+register_service("SNAPSHOT", lambda config: SnapshotService(
+    config["BLOCK_SERVICE_SNAPSHOT_FILE"], str(config.get("PHONE_COUNTRY_CODE", "1"))))
+register_service("HTTP", lambda config: HttpReputationService(
+    config["BLOCK_SERVICE_HTTP_URL"], timeout=service_timeout(config, "HTTP")))
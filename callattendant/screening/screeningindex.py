@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  screeningindex.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import time
+
+from screening.expiry import now_string
+from screening.normalize import canonical_number, national_number
+from screening.rangeindex import RangeIndex
+from screening.tablechanges import get_change_count
+
+
+class ScreeningIndex(object):
+    """
+    An in-memory index of the Whitelist, Blacklist and BlockedRange tables. The
+    CallScreener uses the index so that screening a call does not
+    require a database query.
+    """
+
+    # The tables held in the index
+    TABLES = ("Whitelist", "Blacklist", "BlockedRange")
+
+    # Seconds between checks for changes made outside of this process
+    DATA_VERSION_INTERVAL = 60.0
+
+    def __init__(self, db, config):
+        """
+        Loads the index from the database.
+            :param db:
+                The database connection used by the screening thread
+            :param config:
+                The application-wide config dict
+        """
+        self.db = db
+        self.config = config
+        self._country_code = str(config.get("PHONE_COUNTRY_CODE", "1"))
+        self._entries = {}
+        # Table -> {number: expires} of the entries that expire
+        self._expires = {}
+        self._ranges = RangeIndex()
+        self._change_counts = {}
+        self._data_version = None
+        self._data_version_checked = 0.0
+
+        self.load()
+
+    def load(self):
+        """
+        (Re)loads the index entries from the database tables.
+        """
+        # Get the change counts first so that a change made while
+        # loading is detected by the next refresh.
+        for table in self.TABLES:
+            self._change_counts[table] = get_change_count(table)
+        self._data_version = self._get_data_version()
+        self._data_version_checked = time.time()
+
+        now = now_string()
+        for table in ("Whitelist", "Blacklist"):
+            curs = self.db.execute("""SELECT NormalizedNo, Reason, Expires FROM {}
+                WHERE Expires IS NULL OR Expires > ?""".format(table), (now,))
+            entries = self._entries[table] = {}
+            expires = self._expires[table] = {}
+            for number, reason, expiry in curs:
+                entries[number] = reason
+                if expiry is not None:
+                    expires[number] = expiry
+            curs.close()
+
+        curs = self.db.execute("SELECT LowNo, HighNo, Reason FROM BlockedRange ORDER BY RangeID")
+        self._ranges = RangeIndex(curs.fetchall())
+        curs.close()
+
+        if self.config["DEBUG"]:
+            print("Screening index loaded: {} permitted, {} blocked, {} blocked ranges".format(
+                len(self._entries["Whitelist"]), len(self._entries["Blacklist"]), len(self._ranges)))
+
+    def refresh(self):
+        """
+        Reloads the index if the tables were changed by another
+        connection, e.g., the web app, since the index was loaded.
+        """
+        for table in self.TABLES:
+            if get_change_count(table) != self._change_counts[table]:
+                self.load()
+                return
+
+        # Changes made by another process are only detected via
+        # the database, so limit how often that check is made.
+        now = time.time()
+        if now - self._data_version_checked > self.DATA_VERSION_INTERVAL:
+            self._data_version_checked = now
+            if self._get_data_version() != self._data_version:
+                self.load()
+
+    def check_whitelist(self, number):
+        """
+        Checks if the number is in the whitelist
+            :param number: the number to look for
+            :returns: True if found; and a string containing the reason
+        """
+        return self._check("Whitelist", number)
+
+    def check_blacklist(self, number):
+        """
+        Checks if the number is in the blacklist
+            :param number: the number to look for
+            :returns: True if found; and a string containing the reason
+        """
+        return self._check("Blacklist", number)
+
+    def check_ranges(self, number):
+        """
+        Checks if the number is within a blocked range
+            :param number: the number to look for
+            :returns: True if found; and a string containing the reason
+        """
+        self.refresh()
+        reason = self._ranges.search(national_number(number, self._country_code))
+        if reason is None:
+            return False, ""
+        return True, reason
+
+    def update_entry(self, table, number, reason):
+        """
+        Patches the index after the screener itself added or updated
+        a row so that the whole table need not be reloaded.
+            :param table: "Whitelist" or "Blacklist"
+            :param number: the phone number (key)
+            :param reason: the reason stored with the number
+        """
+        self._patch(table)
+        number = canonical_number(number, self._country_code)
+        self._entries[table][number] = reason
+        self._expires[table].pop(number, None)
+
+    def remove_entry(self, table, number):
+        """
+        Patches the index after the screener itself removed a row.
+            :param table: "Whitelist" or "Blacklist"
+            :param number: the phone number (key)
+        """
+        self._patch(table)
+        number = canonical_number(number, self._country_code)
+        self._entries[table].pop(number, None)
+        self._expires[table].pop(number, None)
+
+    def _check(self, table, number):
+        self.refresh()
+        number = canonical_number(number, self._country_code)
+        reason = self._entries[table].get(number)
+        if reason is None and number not in self._entries[table]:
+            return False, ""
+        # Ignore an expired entry that the reaper hasn't removed yet
+        expires = self._expires[table].get(number)
+        if expires is not None and expires <= now_string():
+            return False, ""
+        return True, reason
+
+    def _patch(self, table):
+        # Accept the change we made ourselves; but if other changes have
+        # occurred since the last load then the index must be reloaded.
+        expected = self._change_counts[table] + 1
+        if get_change_count(table) == expected:
+            self._change_counts[table] = expected
+        else:
+            self.load()
+
+    def _get_data_version(self):
+        curs = self.db.execute("PRAGMA data_version")
+        data_version = curs.fetchone()[0]
+        curs.close()
+        return data_version
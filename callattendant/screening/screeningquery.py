@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  screeningquery.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+from screening.expiry import now_string
+from screening.normalize import canonical_number, national_number
+from screening.tablechanges import get_change_count
+
+
+class ScreeningQuery(object):
+    """
+    Resolves a number's Whitelist, Blacklist and BlockedRange membership
+    with a single query, for when the lists are kept in the database
+    rather than in memory (SCREENING_IN_MEMORY = False). The statement
+    runs on a long-lived cursor, so sqlite3 reuses the prepared statement
+    from the connection's statement cache on each call.
+
+    The CallScreener checks the whitelist and then the blacklist for the
+    same caller, so the result of a lookup is kept for the next check of
+    the same number, unless the tables were changed in the meantime.
+    """
+
+    WHITELIST_SQL = """
+        SELECT 'Whitelist', Reason FROM Whitelist
+        WHERE NormalizedNo=:key AND (Expires IS NULL OR Expires > :now)"""
+    BLACKLIST_SQL = """
+        SELECT 'Blacklist', Reason FROM Blacklist
+        WHERE NormalizedNo=:key AND (Expires IS NULL OR Expires > :now)"""
+    RANGE_SQL = """
+        SELECT 'BlockedRange', Reason FROM (
+            SELECT Reason FROM BlockedRange
+            WHERE length(LowNo) <= length(:national)
+            AND substr(:national, 1, length(LowNo)) BETWEEN LowNo AND HighNo
+            ORDER BY length(LowNo) DESC, CAST(HighNo AS INTEGER) - CAST(LowNo AS INTEGER), RangeID
+            LIMIT 1)"""
+
+    # The combined query, and the query used when the blacklist's
+    # bloom filter shows the number isn't in the Blacklist table
+    SQL = " UNION ALL ".join((WHITELIST_SQL, BLACKLIST_SQL, RANGE_SQL))
+    SQL_NOT_BLACKLISTED = " UNION ALL ".join((WHITELIST_SQL, RANGE_SQL))
+
+    def __init__(self, db, config, blacklist=None):
+        """
+        Constructor.
+            :param db:
+                The database connection used by the screening thread
+            :param config:
+                The application-wide config dict
+            :param blacklist:
+                An optional Blacklist whose bloom filter, if in use,
+                is checked before querying the Blacklist table
+        """
+        self.db = db
+        self.config = config
+        self._blacklist = blacklist
+        self._country_code = str(config.get("PHONE_COUNTRY_CODE", "1"))
+        self._cursor = db.cursor()
+        # The number, result and table change counts of the last lookup
+        self._last = None
+
+    def lookup(self, number):
+        """
+        Finds the tables containing the number.
+            :param number: the number to look for
+            :return: a dict of the reasons keyed by table name, e.g.,
+                {"Blacklist": "Robocaller"}; a table not containing
+                the number is absent
+        """
+        if self._blacklist is None or self._blacklist.may_contain(number):
+            sql = self.SQL
+        else:
+            sql = self.SQL_NOT_BLACKLISTED
+        key = canonical_number(number, self._country_code)
+        national = national_number(number, self._country_code)
+        self._cursor.execute(sql, {"key": key, "national": national, "now": now_string()})
+        result = {}
+        for table, reason in self._cursor.fetchall():
+            result[table] = reason
+        return result
+
+    def check_whitelist(self, number):
+        """
+        Checks if the number is in the whitelist
+            :param number: the number to look for
+            :returns: True if found; and a string containing the reason
+        """
+        result = self.lookup(number)
+        self._last = (number, result, self._change_counts())
+        if "Whitelist" in result:
+            return True, result["Whitelist"]
+        return False, ""
+
+    def check_blacklist(self, number):
+        """
+        Checks if the number is in the blacklist or a blocked range,
+        reusing the result of the preceding whitelist check, if any.
+            :param number: the number to look for
+            :returns: True if found; and a string containing the reason
+        """
+        last, self._last = self._last, None
+        if last is not None and last[0] == number and last[2] == self._change_counts():
+            result = last[1]
+        else:
+            result = self.lookup(number)
+        for table in ("Blacklist", "BlockedRange"):
+            if table in result:
+                return True, result[table]
+        return False, ""
+
+    def close(self):
+        """Closes the cursor"""
+        self._cursor.close()
+
+    @staticmethod
+    def _change_counts():
+        return tuple(get_change_count(table) for table in ("Whitelist", "Blacklist", "BlockedRange"))
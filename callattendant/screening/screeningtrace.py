@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  screeningtrace.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import time
+from collections import OrderedDict
+
+# The pseudo-stage used for the total screening time of the calls
+TOTAL_STAGE = "Total"
+
+
+def get_trace(db, call_no):
+    """
+    Returns the screening stages of a call.
+        :param db: the database connection
+        :param call_no: the CallLogID
+        :return: a list of dicts with stage, matched, reason and
+            elapsed (microseconds) keys, in the order evaluated
+    """
+    curs = db.execute("""SELECT Stage, Matched, Reason, Elapsed FROM ScreeningTrace
+        WHERE CallLogID=? ORDER BY Seq""", (call_no,))
+    rows = curs.fetchall()
+    curs.close()
+    return [dict(stage=row[0], matched=bool(row[1]), reason=row[2], elapsed=row[3]) for row in rows]
+
+
+def stage_percentiles(db, since=None, percentiles=(50, 90, 99)):
+    """
+    Aggregates the elapsed times of each screening stage, for tuning.
+        :param db: the database connection
+        :param since: an optional time, in seconds since the epoch; only
+            the calls logged at or after this time are included
+        :param percentiles: the percentiles to compute
+        :return: a list of dicts with stage, count, max, and "p50" style
+            keys, in microseconds, in the order the stages are evaluated;
+            the last is the total time taken to screen the calls
+    """
+    sql = "SELECT t.CallLogID, t.Stage, t.Elapsed FROM ScreeningTrace AS t"
+    args = ()
+    if since is not None:
+        sql += " JOIN CallLog AS c ON c.CallLogID = t.CallLogID WHERE c.CallTime >= ?"
+        args = (int(since),)
+    curs = db.execute(sql + " ORDER BY t.CallLogID, t.Seq", args)
+    stages = OrderedDict()
+    totals = OrderedDict()
+    for call_no, stage, elapsed in curs:
+        stages.setdefault(stage, []).append(elapsed)
+        totals[call_no] = totals.get(call_no, 0) + elapsed
+    curs.close()
+    if totals:
+        stages[TOTAL_STAGE] = list(totals.values())
+
+    results = []
+    for stage, values in stages.items():
+        values.sort()
+        result = OrderedDict(stage=stage, count=len(values))
+        for pct in percentiles:
+            # Nearest-rank percentile
+            rank = max(1, -(-pct * len(values) // 100))
+            result["p{}".format(pct)] = values[rank - 1]
+        result["max"] = values[-1]
+        results.append(result)
+    return results
+
+
+class ScreeningTrace(object):
+    """
+    Records each stage evaluated while screening a call: the whitelist
+    and blacklist lookups, the patterns, the online services, etc., with
+    the result and the elapsed time, so a slow answer can be explained.
+    """
+
+    def __init__(self):
+        # The (stage, matched, reason, elapsed microseconds) tuples
+        self.stages = []
+
+    def call(self, stage, func, *args):
+        """
+        Calls a screening function and records its result and elapsed time.
+            :param stage: the name of the stage, e.g., "Whitelist"
+            :param func: the function; it returns either a (matched, reason)
+                tuple or a reason string or None
+            :return: the function's result
+        """
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        if isinstance(result, tuple):
+            matched, reason = result
+        else:
+            matched, reason = result is not None, result
+        self.add(stage, matched, reason if matched else "", elapsed)
+        return result
+
+    def add(self, stage, matched, reason, elapsed):
+        """
+        Records a stage.
+            :param stage: the name of the stage
+            :param matched: True if the stage decided the call's outcome
+            :param reason: the reason given by the stage
+            :param elapsed: the elapsed time in seconds
+        """
+        self.stages.append((stage, bool(matched), reason or "", int(elapsed * 1000000)))
+
+    def total(self):
+        """Returns the total elapsed time of the stages in microseconds"""
+        return sum(stage[3] for stage in self.stages)
+
+    def __str__(self):
+        return ", ".join("{} {}us{}".format(stage, elapsed, " (match)" if matched else "")
+                         for stage, matched, reason, elapsed in self.stages)
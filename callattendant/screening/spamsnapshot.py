@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  spamsnapshot.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import heapq
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+
+from screening.normalize import canonical_number
+
+# The file header: a signature and the number of entries
+HEADER = struct.Struct("<8sQ")
+SIGNATURE = b"CASNAP01"
+
+# The number of keys sorted at a time by build_snapshot
+SORT_RUN = 100000
+
+
+def number_key(number, country_code="1"):
+    """
+    Converts a phone number to the integer stored in a snapshot, i.e.,
+    the digits of its E.164 form.
+        :param number: the phone number
+        :param country_code: the local country calling code
+        :return: an int, or None if the number doesn't contain digits
+    """
+    number = canonical_number(number, country_code)
+    if not number:
+        return None
+    digits = number.lstrip("+")
+    if not digits.isdigit():
+        return None
+    return int(digits)
+
+
+def build_snapshot(numbers, filename, country_code="1"):
+    """
+    Writes a snapshot of spam numbers: a sorted array of unsigned 64-bit
+    integers after a short header. The file is written alongside and then
+    renamed over the previous snapshot, so readers see either the old or
+    the new snapshot in full. The keys are collected in an array of 8
+    bytes each, not a set of int objects, so a list of millions of numbers
+    fits in a Pi's memory: the array is sorted in runs, and the runs are
+    merged, dropping the duplicates, as the file is written.
+        :param numbers: an iterable of phone numbers; None values are skipped
+        :param filename: the snapshot file
+        :param country_code: the local country calling code
+        :return: the number of unique numbers written
+    """
+    keys = array("Q")
+    for number in numbers:
+        if number is None:
+            continue
+        key = number_key(number, country_code)
+        if key is not None:
+            keys.append(key)
+    for start in range(0, len(keys), SORT_RUN):
+        keys[start:start + SORT_RUN] = array("Q", sorted(keys[start:start + SORT_RUN]))
+    view = memoryview(keys)
+    runs = [view[start:start + SORT_RUN] for start in range(0, len(keys), SORT_RUN)]
+
+    count = 0
+    temp_file = filename + ".tmp"
+    with open(temp_file, "wb") as f:
+        # The count is written once the duplicates have been dropped
+        f.write(HEADER.pack(SIGNATURE, 0))
+        block = array("Q")
+        previous = None
+        for key in heapq.merge(*runs):
+            if key == previous:
+                continue
+            block.append(key)
+            previous = key
+            if len(block) == SORT_RUN:
+                block.tofile(f)
+                count += len(block)
+                block = array("Q")
+        block.tofile(f)
+        count += len(block)
+        f.seek(0)
+        f.write(HEADER.pack(SIGNATURE, count))
+        f.flush()
+        os.fsync(f.fileno())
+    view.release()
+    os.replace(temp_file, filename)
+    return count
+
+
+class SpamSnapshot(object):
+    """
+    A read-only, memory-mapped snapshot written by build_snapshot. The
+    numbers are searched in place with a binary search, so opening even
+    a large snapshot is immediate and it uses little memory.
+    """
+
+    def __init__(self, filename):
+        """
+        Opens the snapshot.
+            :param filename: the snapshot file
+        """
+        with open(filename, "rb") as f:
+            self.mtime = os.fstat(f.fileno()).st_mtime
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        signature, count = None, 0
+        if len(self._mmap) >= HEADER.size:
+            signature, count = HEADER.unpack_from(self._mmap)
+        if signature != SIGNATURE or len(self._mmap) != HEADER.size + count * 8:
+            self._mmap.close()
+            raise ValueError("Not a spam snapshot file: {}".format(filename))
+        self._keys = memoryview(self._mmap)[HEADER.size:].cast("Q")
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        i = bisect_left(self._keys, key)
+        return i < len(self._keys) and self._keys[i] == key
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  tablechanges.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import threading
+from collections import deque
+
+
+# The change counts for the screening tables, keyed by table name.
+# The web app and the call screener run in the same process but use
+# separate database connections, so changes are signaled through here.
+_change_counts = {}
+_total_changes = 0
+# The (change count, key) of the recent changes, keyed by table name, so a
+# reader can update the rows that changed instead of reloading the table
+_changed_keys = {}
+MAX_CHANGED_KEYS = 1000
+_changed = threading.Condition()
+
+
+def notify_change(table, key=None):
+    """
+    Records a change to the given table and wakes the threads
+    waiting for a change.
+        :param table:
+            The name of the table that was modified, e.g., "Blacklist"
+        :param key:
+            The key of the modified row, e.g., the normalized number,
+            or None if several rows were modified
+        :return:
+            The table's new change count, see get_change_count
+    """
+    global _total_changes
+    with _changed:
+        _change_counts[table] = _change_counts.get(table, 0) + 1
+        _total_changes += 1
+        keys = _changed_keys.setdefault(table, deque(maxlen=MAX_CHANGED_KEYS))
+        keys.append((_change_counts[table], key))
+        _changed.notify_all()
+        return _change_counts[table]
+
+
+def get_change_count(table):
+    """
+    Returns the number of changes made to the given table.
+        :param table:
+            The table name
+        :return:
+            An integer that increases each time the table is modified
+    """
+    with _changed:
+        return _change_counts.get(table, 0)
+
+
+def get_changed_keys(table, since):
+    """
+    Returns the keys of the rows changed in the given table.
+        :param table:
+            The table name
+        :param since:
+            The value of get_change_count to get the changes from
+        :return:
+            A list of keys, or None if they aren't all known, i.e., a
+            change modified several rows or the changes are too old
+    """
+    with _changed:
+        keys = [key for count, key in _changed_keys.get(table, ()) if count > since]
+        if len(keys) != _change_counts.get(table, 0) - since or None in keys:
+            return None
+        return keys
+
+
+def get_total_changes():
+    """
+    Returns the number of changes made to all the tables.
+        :return:
+            An integer that increases each time a table is modified
+    """
+    with _changed:
+        return _total_changes
+
+
+def wait_for_change(since, timeout=None):
+    """
+    Waits until a table is changed.
+        :param since:
+            The value of get_total_changes to wait for a change from
+        :param timeout:
+            The maximum number of seconds to wait, or None to wait
+            until a change or a call to wake_waiters
+        :return:
+            The current value of get_total_changes
+    """
+    with _changed:
+        if _total_changes == since:
+            _changed.wait(timeout)
+        return _total_changes
+
+
+def wake_waiters():
+    """
+    Wakes the threads waiting for a change, e.g., so they can stop.
+    """
+    with _changed:
+        _changed.notify_all()
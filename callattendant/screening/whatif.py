@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  whatif.py
+#
+#  Copyright 2020 Bruce Schubert <bruce@emxsys.com>
+#
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import time
+from datetime import datetime, timedelta
+from itertools import tee
+
+from screening.calllogger import action_name
+from screening.expiry import now_string
+from screening.namerules import NameRules
+from screening.normalize import canonical_number, national_number
+from screening.patternmatcher import PatternMatcher
+from screening.rangeindex import RangeIndex
+
+
+class BatchScreener(object):
+    """
+    Screens the call history against the lists, blocked ranges, name rules
+    and patterns, without the live screener's other stages: the online
+    services, the burst and neighbor spoof detectors, and the in-memory
+    index. Nothing is written, so it can run alongside the call attendant.
+    """
+
+    def __init__(self, db, config, name_rules=None):
+        """
+        Compiles the configured patterns.
+            :param db: the database connection
+            :param config: the application config
+            :param name_rules: an optional NameRules object to share, e.g.,
+                the CallScreener's; otherwise one is created
+        """
+        self.db = db
+        self.config = config
+        self._name_rules = name_rules if name_rules is not None else NameRules(db, config)
+        self._block_name_patterns = PatternMatcher(config["BLOCK_NAME_PATTERNS"])
+        self._block_number_patterns = PatternMatcher(config["BLOCK_NUMBER_PATTERNS"])
+        self._permit_name_patterns = PatternMatcher(config["PERMIT_NAME_PATTERNS"])
+        self._permit_number_patterns = PatternMatcher(config["PERMIT_NUMBER_PATTERNS"])
+
+    def screen_many(self, callers, rules=None):
+        """
+        Screens a batch of callers, e.g., the call history, against the
+        current or a candidate set of rules without changing either. The
+        name stages are only evaluated once per unique name, and the number
+        stages once per unique number.
+            :param callers: an iterable of dicts with caller ID information
+            :param rules: an optional dict of candidate rules that override the
+                config: SCREENING_MODE, BLOCK_NAME_PATTERNS, BLOCK_NUMBER_PATTERNS,
+                PERMIT_NAME_PATTERNS and PERMIT_NUMBER_PATTERNS; plus WHITELIST
+                and BLACKLIST dicts of numbers to add (number: reason) or to
+                remove (number: None) from the lists.
+            :return: a generator of (action, reason) tuples, one per caller,
+                where action is "Permitted", "Blocked" or "Screened"
+        """
+        rules = rules or {}
+
+        def matcher(key, compiled):
+            if key in rules:
+                return PatternMatcher(rules[key])
+            return compiled
+
+        mode = rules.get("SCREENING_MODE", self.config["SCREENING_MODE"])
+        permit = "whitelist" in mode
+        block = "blacklist" in mode
+        block_name_patterns = matcher("BLOCK_NAME_PATTERNS", self._block_name_patterns)
+        block_number_patterns = matcher("BLOCK_NUMBER_PATTERNS", self._block_number_patterns)
+        permit_name_patterns = matcher("PERMIT_NAME_PATTERNS", self._permit_name_patterns)
+        permit_number_patterns = matcher("PERMIT_NUMBER_PATTERNS", self._permit_number_patterns)
+
+        # Load the lists once and apply the candidate changes
+        country_code = str(self.config["PHONE_COUNTRY_CODE"])
+        lists = {}
+        for table in ("Whitelist", "Blacklist"):
+            curs = self.db.execute("""SELECT NormalizedNo, Reason FROM {}
+                WHERE Expires IS NULL OR Expires > ?""".format(table), (now_string(),))
+            lists[table] = dict(curs.fetchall())
+            curs.close()
+            for number, reason in rules.get(table.upper(), {}).items():
+                number = canonical_number(number, country_code)
+                if reason is None:
+                    lists[table].pop(number, None)
+                else:
+                    lists[table][number] = reason
+        curs = self.db.execute("SELECT LowNo, HighNo, Reason FROM BlockedRange ORDER BY RangeID")
+        ranges = RangeIndex(curs.fetchall())
+        curs.close()
+        whitelist = lists["Whitelist"]
+        blacklist = lists["Blacklist"]
+
+        # The rules don't change during the batch, so they're checked for changes once
+        name_rules = self._name_rules
+        name_rules.refresh()
+
+        def screen_name(name):
+            # The (permit, block) reasons of the name stages, or None
+            permitted = permit_name_patterns.search(name) if permit else None
+            blocked = None
+            if block:
+                blocked = block_name_patterns.search(name)
+                if blocked is None:
+                    blocked = name_rules.search(name)
+            return permitted, blocked
+
+        def screen_number(number):
+            # The (list decision, permit reason, list or range decision, block reason)
+            # of the number stages, or None
+            key = canonical_number(number, country_code)
+            listed_permitted = permitted = listed_blocked = blocked = None
+            if permit:
+                if key in whitelist:
+                    listed_permitted = ("Permitted", whitelist[key])
+                else:
+                    permitted = permit_number_patterns.search(number)
+            if block:
+                if key in blacklist:
+                    listed_blocked = ("Blocked", blacklist[key])
+                else:
+                    reason = ranges.search(national_number(number, country_code))
+                    if reason is not None:
+                        listed_blocked = ("Blocked", reason)
+                    else:
+                        blocked = block_number_patterns.search(number)
+            return listed_permitted, permitted, listed_blocked, blocked
+
+        name_verdicts = {}
+        number_verdicts = {}
+        for callerid in callers:
+            name = callerid["NAME"] or ""
+            number = callerid["NMBR"] or ""
+            name_verdict = name_verdicts.get(name)
+            if name_verdict is None:
+                name_verdict = name_verdicts[name] = screen_name(name)
+            number_verdict = number_verdicts.get(number)
+            if number_verdict is None:
+                number_verdict = number_verdicts[number] = screen_number(number)
+            name_permitted, name_blocked = name_verdict
+            listed_permitted, number_permitted, listed_blocked, number_blocked = number_verdict
+
+            # Combine the stages in the order the CallScreener checks them
+            if listed_permitted is not None:
+                yield listed_permitted
+            elif name_permitted is not None:
+                yield "Permitted", name_permitted
+            elif number_permitted is not None:
+                yield "Permitted", number_permitted
+            elif listed_blocked is not None:
+                yield listed_blocked
+            elif name_blocked is not None:
+                yield "Blocked", name_blocked
+            elif number_blocked is not None:
+                yield "Blocked", number_blocked
+            else:
+                yield "Screened", "Not found"
+
+
+def make_screener(db, config):
+    """
+    Creates a screener for replaying the call history.
+        :param db: the database connection
+        :param config: the application config
+        :return: a BatchScreener
+    """
+    return BatchScreener(db, config)
+
+
+def read_call_log(db, since=None, batch_size=5000):
+    """
+    Streams the call log, oldest first.
+        :param db: the database connection
+        :param since: an optional datetime; older calls are skipped
+        :param batch_size: the number of rows fetched at a time
+        :return: a generator of dicts with the CallLogID, NAME, NMBR,
+            Action, Reason and CallTime (epoch seconds) of each call
+    """
+    sql = """SELECT CallLogID, Name, Number, Action, Reason, CallTime
+        FROM CallLog WHERE CallTime >= ? ORDER BY CallLogID"""
+    start = int(time.mktime(since.timetuple())) if since else 0
+    curs = db.execute(sql, (start,))
+    try:
+        while True:
+            rows = curs.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield {
+                    "CallLogID": row[0],
+                    "NAME": row[1],
+                    "NMBR": row[2],
+                    "Action": action_name(row[3]),
+                    "Reason": row[4],
+                    "CallTime": row[5],
+                }
+    finally:
+        curs.close()
+
+
+def compare_decisions(screener, calls, rules, max_changes=1000):
+    """
+    Screens the calls with the current rules and the candidate rules and
+    reports the differences between the two.
+        :param screener: the BatchScreener
+        :param calls: an iterable of call dicts, e.g., from read_call_log
+        :param rules: the candidate rules (see BatchScreener.screen_many)
+        :param max_changes: the max number of changed calls to return
+        :return: a dict with the total number of calls, the elapsed seconds,
+            a dict of (current action, candidate action): count, and a list
+            of (call, current action, candidate action, candidate reason)
+            tuples for the calls whose action would change, where the call
+            dict has its local DateTime string added
+    """
+    start = time.time()
+    # The three streams are consumed in step, so the calls aren't all held in memory
+    calls, current_calls, candidate_calls = tee(calls, 3)
+    current = screener.screen_many(current_calls)
+    candidate = screener.screen_many(candidate_calls, rules)
+
+    total = 0
+    transitions = {}
+    changes = []
+    for call, (old_action, old_reason), (new_action, new_reason) in zip(calls, current, candidate):
+        total += 1
+        key = (old_action, new_action)
+        transitions[key] = transitions.get(key, 0) + 1
+        if old_action != new_action and len(changes) < max_changes:
+            call["DateTime"] = datetime.fromtimestamp(call["CallTime"]).strftime('%Y-%m-%d %H:%M:%S')
+            changes.append((call, old_action, new_action, new_reason))
+
+    return {
+        "total": total,
+        "elapsed": time.time() - start,
+        "transitions": transitions,
+        "changes": changes,
+    }
+
+
+def months_ago(months):
+    """Returns the datetime the given number of (30 day) months ago"""
+    return datetime.now() - timedelta(days=30 * months)
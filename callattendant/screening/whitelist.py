@@ -33,6 +33,10 @@ from datetime import datetime
 from pprint import pprint
 
 from screening.query_db import query_db
+from migrations import migrate
+from screening.expiry import format_expires, now_string
+from screening.normalize import canonical_number
+from screening.tablechanges import notify_change
 
 
 class Whitelist(object):
@@ -45,14 +49,8 @@ class Whitelist(object):
         if self.config["DEBUG"]:
             print("Initializing Whitelist")
 
-        sql = """CREATE TABLE IF NOT EXISTS Whitelist (
-            PhoneNo TEXT PRIMARY KEY,
-            Name TEXT,
-            Reason TEXT,
-            SystemDateTime TEXT)"""
-        curs = self.db.cursor()
-        curs.executescript(sql)
-        curs.close()
+        migrate(self.db, self.config)
+        self._country_code = str(self.config.get("PHONE_COUNTRY_CODE", "1"))
 
         if self.config["TESTING"]:
             # Add a record to the test db;
@@ -68,28 +66,37 @@ class Whitelist(object):
         if self.config["DEBUG"]:
             print("Whitelist initialized")
 
-    def add_caller(self, call_record, reason=""):
+    def add_caller(self, call_record, reason="", expires=None):
         """
         Add a caller to the permitted list.
             :param caller: a dict with caller ID information
             :param reason: an optional string indicating the
                 reason this caller was added
+            :param expires: an optional datetime, or number of hours
+                from now, when the entry is removed
             :return: True if successful
         """
         query = """INSERT INTO Whitelist(
             PhoneNo,
             Name,
             Reason,
-            SystemDateTime) VALUES(?,?,?,?)"""
+            SystemDateTime,
+            Expires,
+            NormalizedNo) VALUES(?,?,?,?,?,?)"""
         arguments = [
             call_record['NMBR'],
             call_record['NAME'],
             reason,
-            (datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:19])
+            (datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:19]),
+            format_expires(expires),
+            self.normalize(call_record['NMBR'])
         ]
         try:
+            # Replace an expired entry that the reaper hasn't removed yet
+            self.db.execute("DELETE FROM Whitelist WHERE NormalizedNo=? AND Expires<=?", (arguments[5], now_string()))
             self.db.execute(query, arguments)
             self.db.commit()
+            notify_change("Whitelist", arguments[5])
             if self.config["DEBUG"]:
                 print("New whitelist entry added")
                 pprint(arguments)
@@ -104,13 +111,14 @@ class Whitelist(object):
         Removes records for the given number
         :param phone_no: phone number without dashes or formatting
         """
-        query = 'DELETE FROM Whitelist WHERE PhoneNo=:phone_no'
-        arguments = {'phone_no': phone_no}
+        query = 'DELETE FROM Whitelist WHERE NormalizedNo=:number'
+        arguments = {'number': self.normalize(phone_no)}
         self.db.execute(query, arguments)
         self.db.commit()
         try:
             self.db.execute(query, arguments)
             self.db.commit()
+            notify_change("Whitelist", arguments['number'])
         except Exception as e:
             print("** Failed to delete caller from whitelist:")
             pprint(e)
@@ -129,9 +137,9 @@ class Whitelist(object):
         """
         sql = """UPDATE Whitelist
             SET Name=:name, Reason=:reason, SystemDateTime=:time
-            WHERE PhoneNo=:phone_no"""
+            WHERE NormalizedNo=:number"""
         arguments = {
-            'phone_no': phone_no,
+            'number': self.normalize(phone_no),
             "name": name,
             "reason": reason,
             "time": (datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:19])
@@ -139,6 +147,7 @@ class Whitelist(object):
         try:
             self.db.execute(sql, arguments)
             self.db.commit()
+            notify_change("Whitelist", arguments['number'])
         except Exception as e:
             print("** Failed to update caller in whitelist:")
             pprint(e)
@@ -148,17 +157,41 @@ class Whitelist(object):
             pprint(arguments)
         return True
 
+    def set_expires(self, phone_no, expires):
+        """
+        Sets or clears the expiry of the entry for the given number
+        :param phone_no: phone number (key) without dashes or formatting
+        :param expires: a datetime, or number of hours from now, when
+            the entry is removed; or None if it never expires
+        """
+        sql = "UPDATE Whitelist SET Expires=:expires WHERE NormalizedNo=:number"
+        arguments = {"number": self.normalize(phone_no), "expires": format_expires(expires)}
+        try:
+            self.db.execute(sql, arguments)
+            self.db.commit()
+            notify_change("Whitelist", arguments["number"])
+        except Exception as e:
+            print("** Failed to set the expiry in whitelist:")
+            pprint(e)
+            return False
+        return True
+
     def check_number(self, number):
-        query = "SELECT Reason FROM Whitelist WHERE PhoneNo=:number"
-        args = {"number": number}
+        query = """SELECT Reason FROM Whitelist WHERE NormalizedNo=:number
+            AND (Expires IS NULL OR Expires > :now)"""
+        args = {"number": self.normalize(number), "now": now_string()}
         results = query_db(self.db, query, args, False)
         if len(results) > 0:
             return True, results[0][0]
         else:
             return False, ""
 
+    def normalize(self, number):
+        """Returns the canonical form of the number used as the lookup key"""
+        return canonical_number(number, self._country_code)
+
     def get_number(self, number):
-        query = "SELECT * FROM Whitelist WHERE PhoneNo = ?"
-        args = (number,)
+        query = "SELECT * FROM Whitelist WHERE NormalizedNo = ?"
+        args = (self.normalize(number),)
         results = query_db(self.db, query, args, False)
         return results
@@ -30,11 +30,15 @@
 # ==============================================================================
 from __future__ import division
 
+import ast
 import logging
 import os
 import random
+import re
 import string
+import time
 import _thread
+import io
 from datetime import datetime, timedelta
 from pprint import pformat
 
@@ -46,8 +50,17 @@ from pygments import highlight
 from pygments.lexers import PythonLexer
 from pygments.formatters import HtmlFormatter
 
+from migrations import migrate
 from screening.query_db import query_db
 from screening.blacklist import Blacklist
+from screening.blockedranges import BlockedRanges
+from screening.namerules import NameRules
+from screening.calllogger import BLOCKED, PERMITTED, SCREENED, action_name, list_join
+from screening.callstats import get_call_totals, get_calls_per_day
+from screening.normalize import call_log_key
+from screening.screeningtrace import get_trace, stage_percentiles
+from screening.bulkimport import read_numbers, import_blacklist
+from screening.whatif import make_screener, read_call_log, compare_decisions, months_ago
 from screening.whitelist import Whitelist
 from messaging.voicemail import Message
 
@@ -63,6 +76,8 @@ def before_request():
     """
     master_config = current_app.config.get("MASTER_CONFIG")
     g.conn = sqlite3.connect(master_config.get("DB_FILE"))
+    # Upgrade the schema if needed; normally a single pragma read
+    migrate(g.conn, master_config)
     g.conn.row_factory = sqlite3.Row
     g.cur = g.conn.cursor()
 
@@ -81,15 +96,8 @@ def dashboard():
     """
     Display the dashboard, i.e,, the home page
     """
-    # Count totals calls
-    sql = "SELECT COUNT(*) FROM CallLog"
-    g.cur.execute(sql)
-    total_calls = g.cur.fetchone()[0]
-
-    # Count blocked calls
-    sql = "SELECT COUNT(*) FROM CallLog WHERE `Action` = 'Blocked'"
-    g.cur.execute(sql)
-    total_blocked = g.cur.fetchone()[0]
+    # Count the total and blocked calls from the daily rollup
+    total_calls, total_blocked = get_call_totals(g.conn)
 
     # Compute percentage blocked
     percent_blocked = 0
@@ -111,8 +119,6 @@ def dashboard():
             ELSE a.Name
         END Name,
         a.Number,
-        a.Date,
-        a.Time,
         a.Action,
         a.Reason,
         CASE WHEN b.PhoneNo is null THEN 'N' ELSE 'Y' END Whitelisted,
@@ -120,13 +126,13 @@ def dashboard():
         d.MessageID,
         d.Played,
         d.Filename,
-        a.SystemDateTime
+        a.CallTime
     FROM CallLog as a
-    LEFT JOIN Whitelist AS b ON a.Number = b.PhoneNo
-    LEFT JOIN Blacklist AS c ON a.Number = c.PhoneNo
+    {}
+    {}
     LEFT JOIN Message AS d ON a.CallLogID = d.CallLogID
-    ORDER BY a.SystemDateTime DESC
-    LIMIT {}""".format(max_num_rows)
+    ORDER BY a.CallTime DESC
+    LIMIT {}""".format(list_join("Whitelist", "b"), list_join("Blacklist", "c"), max_num_rows)
     g.cur.execute(sql)
     result_set = g.cur.fetchall()
     recent_calls = []
@@ -136,13 +142,13 @@ def dashboard():
         # data/messsages folder containing the actual messages.
         # We'll use the static-based path for the wav-file urls
         # in the web app
-        filepath = row[11]
+        filepath = row[9]
         if filepath is not None:
             basename = os.path.basename(filepath)
             filepath = os.path.join("../static/messages", basename)
 
-        # Create a date object from the date time string
-        date_time = datetime.strptime(row[12][:19], '%Y-%m-%d %H:%M:%S')
+        # Create a date object from the call time
+        date_time = get_call_time(row[10])
 
         recent_calls.append(dict(
             call_no=row[0],
@@ -150,21 +156,21 @@ def dashboard():
             phone_no=format_phone_no(row[2]),
             date=date_time.strftime('%d-%b-%y'),
             time=date_time.strftime('%I:%M %p'),
-            action=row[5],
-            reason=row[6],
-            whitelisted=row[7],
-            blacklisted=row[8],
-            msg_no=row[9],
-            msg_played=row[10],
+            action=action_name(row[3]),
+            reason=row[4],
+            whitelisted=row[5],
+            blacklisted=row[6],
+            msg_no=row[7],
+            msg_played=row[8],
             wav_file=filepath))
 
     # Get top permitted callers
     sql = """SELECT COUNT(Number), Number, Name
         FROM CallLog
-        WHERE Action IN ('Permitted', 'Screened')
+        WHERE Action IN (?, ?)
         GROUP BY Number
         ORDER BY COUNT(Number) DESC LIMIT 10"""
-    g.cur.execute(sql)
+    g.cur.execute(sql, (PERMITTED, SCREENED))
     result_set = g.cur.fetchall()
     top_permitted = []
     for row in result_set:
@@ -176,10 +182,10 @@ def dashboard():
     # Get top blocked callers
     sql = """SELECT COUNT(Number), Number, Name
         FROM CallLog
-        WHERE Action = 'Blocked'
+        WHERE Action = ?
         GROUP BY Number
         ORDER BY COUNT(Number) DESC LIMIT 10"""
-    g.cur.execute(sql)
+    g.cur.execute(sql, (BLOCKED,))
     result_set = g.cur.fetchall()
     top_blocked = []
     for row in result_set:
@@ -191,47 +197,15 @@ def dashboard():
     # Get num calls per day for graphing
     num_days = current_app.config.get("GRAPH_NUM_DAYS", 30)
 
-    # Query num blocked calls
-    sql = """SELECT COUNT(DATE(SystemDateTime)) Count, DATE(SystemDateTime) CallDate
-        FROM CallLog
-        WHERE SystemDateTime > DATETIME('now','-{} day') AND Action = 'Blocked'
-        GROUP BY CallDate
-        ORDER BY CallDate""".format(num_days)
-    g.cur.execute(sql)
-    result_set = g.cur.fetchall()
-    blocked_per_day = {}
-    for row in result_set:
-        # key value = date, count
-        blocked_per_day[row[1]] = row[0]
-
-    # Query number of allowed calls
-    sql = """SELECT COUNT(DATE(SystemDateTime)) Count, DATE(SystemDateTime) CallDate
-        FROM CallLog
-        WHERE SystemDateTime > DATETIME('now','-{} day') AND Action = 'Permitted'
-        GROUP BY CallDate
-        ORDER BY CallDate""".format(num_days)
-    g.cur.execute(sql)
-    result_set = g.cur.fetchall()
-    allowed_per_day = {}
-    for row in result_set:
-        # key value = date, count
-        allowed_per_day[row[1]] = row[0]
-
-    # Query number of screened calls
-    sql = """SELECT COUNT(DATE(SystemDateTime)) Count, DATE(SystemDateTime) CallDate
-        FROM CallLog
-        WHERE SystemDateTime > DATETIME('now','-{} day') AND Action = 'Screened'
-        GROUP BY CallDate
-        ORDER BY CallDate""".format(num_days)
-    g.cur.execute(sql)
-    result_set = g.cur.fetchall()
-    screened_per_day = {}
-    for row in result_set:
-        # key value = date, count
-        screened_per_day[row[1]] = row[0]
+    # Get the number of calls per day by action from the daily rollup
+    base_date = datetime.today()
+    since = (base_date - timedelta(days=num_days - 1)).strftime("%Y-%m-%d")
+    per_day = get_calls_per_day(g.conn, since)
+    blocked_per_day = per_day.get(BLOCKED, {})
+    allowed_per_day = per_day.get(PERMITTED, {})
+    screened_per_day = per_day.get(SCREENED, {})
 
     # Conflate the results
-    base_date = datetime.today()
     date_list = [base_date - timedelta(days=x) for x in range(num_days)]
     date_list.reverse()
     calls_per_day = []
@@ -272,16 +246,22 @@ def calls():
 
     # Get search criteria, if applicable
     search_criteria = ""
+    search_args = ()
     if search_text:
         if search_type == "phone":
             number = transform_number(search_text)  # override GET arg if we're searching
-            search_criteria = "WHERE Number='{}'".format(number)
+            # Find the calls from any form of the number, via the index
+            country_code = str(current_app.config.get("PHONE_COUNTRY_CODE", "1"))
+            key = call_log_key(number, country_code)
+            search_criteria = "WHERE a.NormalizedNo=?"
+            search_args = (key,)
         else:
-            search_criteria = "WHERE Caller LIKE '%{}%'".format(search_text)
+            search_criteria = "WHERE Caller LIKE ?"
+            search_args = ("%{}%".format(search_text),)
 
     # Get values used for pagination of the call log
-    sql = "SELECT COUNT(*), Number, Name Caller FROM CallLog {}".format(search_criteria)
-    g.cur.execute(sql)
+    sql = "SELECT COUNT(*), Number, Name Caller FROM CallLog AS a {}".format(search_criteria)
+    g.cur.execute(sql, search_args)
     total = g.cur.fetchone()[0]
     page, per_page, offset = get_page_args(
         page_parameter="page",
@@ -296,8 +276,6 @@ def calls():
             ELSE a.Name
         END Caller,
         a.Number Number,
-        a.Date,
-        a.Time,
         a.Action,
         a.Reason,
         CASE WHEN b.PhoneNo is null THEN 'N' ELSE 'Y' END Whitelisted,
@@ -305,15 +283,15 @@ def calls():
         d.MessageID,
         d.Played,
         d.Filename,
-        a.SystemDateTime
+        a.CallTime
     FROM CallLog as a
-    LEFT JOIN Whitelist AS b ON a.Number = b.PhoneNo
-    LEFT JOIN Blacklist AS c ON a.Number = c.PhoneNo
+    {}
+    {}
     LEFT JOIN Message AS d ON a.CallLogID = d.CallLogID
     {}
-    ORDER BY a.SystemDateTime DESC
-    LIMIT {}, {}""".format(search_criteria, offset, per_page)
-    g.cur.execute(sql)
+    ORDER BY a.CallTime DESC
+    LIMIT ?, ?""".format(list_join("Whitelist", "b"), list_join("Blacklist", "c"), search_criteria)
+    g.cur.execute(sql, search_args + (offset, per_page))
     result_set = g.cur.fetchall()
 
     # Create a formatted list of records including some derived values
@@ -325,13 +303,13 @@ def calls():
         # In the static folder we have created a soft-link to the
         # data/messsages folder containing the actual messages.
         # We'll use the static-based path for the wav-file urls
-        filepath = row[11]
+        filepath = row[9]
         if filepath is not None:
             basename = os.path.basename(filepath)
             filepath = os.path.join("../static/messages", basename)
 
-        # Create a date object from the date time string
-        date_time = datetime.strptime(row[12][:19], '%Y-%m-%d %H:%M:%S')
+        # Create a date object from the call time
+        date_time = get_call_time(row[10])
 
         calls.append(dict(
             call_no=row[0],
@@ -339,12 +317,12 @@ def calls():
             name=row[1],
             date=date_time.strftime('%d-%b-%y'),
             time=date_time.strftime('%I:%M %p'),
-            action=row[5],
-            reason=row[6],
-            whitelisted=row[7],
-            blacklisted=row[8],
-            msg_no=row[9],
-            msg_played=row[10],
+            action=action_name(row[3]),
+            reason=row[4],
+            whitelisted=row[5],
+            blacklisted=row[6],
+            msg_no=row[7],
+            msg_played=row[8],
             wav_file=filepath))
 
     # Create a pagination object for the page
@@ -382,8 +360,6 @@ def calls_view(call_no):
             ELSE a.Name
         END Name,
         a.Number Number,
-        a.Date,
-        a.Time,
         a.Action,
         a.Reason,
         CASE WHEN b.PhoneNo is null THEN 'N' ELSE 'Y' END Whitelisted,
@@ -391,12 +367,12 @@ def calls_view(call_no):
         d.MessageID,
         d.Played,
         d.Filename,
-        a.SystemDateTime
+        a.CallTime
     FROM CallLog as a
-    LEFT JOIN Whitelist AS b ON a.Number = b.PhoneNo
-    LEFT JOIN Blacklist AS c ON a.Number = c.PhoneNo
+    {}
+    {}
     LEFT JOIN Message AS d ON a.CallLogID = d.CallLogID
-    WHERE a.CallLogID={}""".format(call_no)
+    WHERE a.CallLogID={}""".format(list_join("Whitelist", "b"), list_join("Blacklist", "c"), call_no)
     g.cur.execute(sql)
     row = g.cur.fetchone()
 
@@ -408,13 +384,13 @@ def calls_view(call_no):
         # In the static folder we have created a soft-link to the
         # data/messsages folder containing the actual messages.
         # We'll use the static-based path for the wav-file urls
-        filepath = row[11]
+        filepath = row[9]
         if filepath is not None:
             basename = os.path.basename(filepath)
             filepath = os.path.join("../../static/messages", basename)
 
-        # Create a date object from the date time string
-        date_time = datetime.strptime(row[12][:19], '%Y-%m-%d %H:%M:%S')
+        # Create a date object from the call time
+        date_time = get_call_time(row[10])
 
         caller.update(dict(
             call_no=row[0],
@@ -422,20 +398,24 @@ def calls_view(call_no):
             name=row[1],
             date=date_time.strftime('%d-%b-%y'),
             time=date_time.strftime('%I:%M %p'),
-            action=row[5],
-            reason=row[6],
-            whitelisted=row[7],
-            blacklisted=row[8],
-            msg_no=row[9],
-            msg_played=row[10],
+            action=action_name(row[3]),
+            reason=row[4],
+            whitelisted=row[5],
+            blacklisted=row[6],
+            msg_no=row[7],
+            msg_played=row[8],
             wav_file=filepath))
     else:
         # ~ Flash and return to referer
         pass
 
+    # Get the stages evaluated when the call was screened
+    trace = get_trace(get_db(), call_no)
+
     return render_template(
         'calls_view.html',
-        caller=caller)
+        caller=caller,
+        trace=trace)
 
 
 @app.route('/callers/manage/<int:call_no>', methods=['GET', 'POST'])
@@ -491,9 +471,9 @@ def callers_manage(call_no):
       CASE WHEN b.PhoneNo IS NOT NULL THEN b.Reason ELSE '' END WhitelistReason,
       CASE WHEN c.PhoneNo IS NOT NULL THEN c.Reason ELSE '' END BlacklistReason
     FROM calllog AS a
-    LEFT JOIN whitelist AS b ON a.Number = b.PhoneNo
-    LEFT JOIN blacklist AS c ON a.Number = c.PhoneNo
-    WHERE a.CallLogID=:call_log_id"""
+    {}
+    {}
+    WHERE a.CallLogID=:call_log_id""".format(list_join("Whitelist", "b"), list_join("Blacklist", "c"))
     arguments = {"call_log_id": call_no}
     result_set = query_db(get_db(), query, arguments)
     # Prepare a caller dictionary object for the form
@@ -538,7 +518,8 @@ def callers_blocked():
     )
 
     # Get the blacklist subset, limited to the pagination settings
-    sql = 'SELECT * FROM Blacklist ORDER BY datetime(SystemDateTime) DESC LIMIT {}, {}'.format(offset, per_page)
+    sql = '''SELECT PhoneNo, Name, Reason, SystemDateTime, Expires FROM Blacklist
+        ORDER BY SystemDateTime DESC LIMIT {}, {}'''.format(offset, per_page)
     g.cur.execute(sql)
     result_set = g.cur.fetchall()
     records = []
@@ -549,7 +530,8 @@ def callers_blocked():
             Phone_Number=phone_no,
             Name=record[1],
             Reason=record[2],
-            System_Date_Time=record[3][:19]))
+            System_Date_Time=record[3][:19],
+            Expires=record[4] or ""))
 
     # Create a pagination object for the page
     pagination = get_pagination(
@@ -583,7 +565,11 @@ def callers_blocked_add():
     caller['NAME'] = request.form["name"]
     print("Adding " + number + " to blacklist")
     blacklist = Blacklist(get_db(), current_app.config)
-    success = blacklist.add_caller(caller, request.form["reason"])
+    expires, error = get_expires_hours()
+    if error:
+        flash(error)
+        return redirect("/callers/blocked", code=303)
+    success = blacklist.add_caller(caller, request.form["reason"], expires)
     if success:
         return redirect("/callers/blocked", code=303)
     else:
@@ -591,6 +577,33 @@ def callers_blocked_add():
         return redirect('/callers/blocked/update/{}'.format(number), code=307)
 
 
+@app.route('/callers/blocked/import', methods=['POST'])
+def callers_blocked_import():
+    """
+    Import an uploaded CSV file of numbers into the blacklist
+    """
+    upload = request.files.get("file")
+    if not upload or not upload.filename:
+        flash("Select a CSV file to import")
+        return redirect("/callers/blocked", code=303)
+
+    print("Importing " + upload.filename + " into blacklist")
+    blacklist = Blacklist(get_db(), current_app.config)    # Ensure the table exists
+    f = io.TextIOWrapper(upload.stream, encoding="utf-8", errors="replace", newline="")
+    try:
+        country_code = str(current_app.config.get("PHONE_COUNTRY_CODE", "1"))
+        stats = import_blacklist(get_db(), read_numbers(f, country_code=country_code),
+                                 request.form.get("reason", "Imported"), country_code=country_code)
+        blacklist.rebuild_filter()
+        flash("Imported {:,} numbers ({:,} skipped) in {:.1f} seconds: {:,.0f} numbers/sec".format(
+            stats["imported"], stats["skipped"], stats["elapsed"], stats["rate"]))
+    except Exception as e:
+        print("** Failed to import {}: {}".format(upload.filename, e))
+        flash("Import failed: {}".format(e))
+
+    return redirect("/callers/blocked", code=303)
+
+
 @app.route('/callers/blocked/update/<string:phone_no>', methods=['POST'])
 def callers_blocked_update(phone_no):
     """
@@ -600,6 +613,13 @@ def callers_blocked_update(phone_no):
     print("Updating " + number + " in blacklist")
     blacklist = Blacklist(get_db(), current_app.config)
     blacklist.update_number(number, request.form['name'], request.form['reason'])
+    if request.form.get("expires", "").strip():
+        # Renew, e.g., when re-adding a temporary entry
+        expires, error = get_expires_hours()
+        if error:
+            flash(error)
+        else:
+            blacklist.set_expires(number, expires)
 
     return redirect("/callers/blocked", code=303)
 
@@ -618,6 +638,187 @@ def callers_blocked_delete(phone_no):
     return redirect("/callers/blocked", code=301)  # (re)moved permamently
 
 
+@app.route('/callers/blocked/ranges')
+def callers_blocked_ranges():
+    """
+    Display the blocked number ranges from the BlockedRange table
+    """
+    # Ensure the table exists
+    BlockedRanges(get_db(), current_app.config)
+
+    # Get values used for pagination of the ranges
+    total = get_row_count('BlockedRange')
+    page, per_page, offset = get_page_args(
+        page_parameter="page", per_page_parameter="per_page"
+    )
+
+    # Get the ranges subset, limited to the pagination settings
+    sql = 'SELECT RangeID, LowNo, HighNo, Reason FROM BlockedRange ORDER BY LowNo LIMIT {}, {}'.format(offset, per_page)
+    g.cur.execute(sql)
+    result_set = g.cur.fetchall()
+    records = []
+    for record in result_set:
+        records.append(dict(
+            Range_ID=record[0],
+            Low=record[1],
+            High=record[2],
+            Reason=record[3]))
+
+    # Create a pagination object for the page
+    pagination = get_pagination(
+        page=page,
+        per_page=per_page,
+        total=total,
+        record_name="blocked ranges",
+        format_total=True,
+        format_number=True,
+    )
+    # Render the resullts with pagination
+    return render_template(
+        'callers_blocked_ranges.html',
+        active_nav_item='blocked',
+        ranges=records,
+        page=page,
+        per_page=per_page,
+        pagination=pagination,
+    )
+
+
+@app.route('/callers/blocked/ranges/add', methods=['POST'])
+def callers_blocked_ranges_add():
+    """
+    Add a new blocked range entry
+    """
+    low = transform_number(request.form["low"])
+    high = transform_number(request.form["high"]) or low
+    print("Adding " + low + "-" + high + " to blocked ranges")
+    ranges = BlockedRanges(get_db(), current_app.config)
+    valid, error = ranges.validate_range(low, high)
+    if not valid:
+        flash(error)
+    elif not ranges.add_range(low, high, request.form["reason"]):
+        flash("Failed to add the range")
+    return redirect("/callers/blocked/ranges", code=303)
+
+
+@app.route('/callers/blocked/ranges/update/<int:range_id>', methods=['POST'])
+def callers_blocked_ranges_update(range_id):
+    """
+    Update the blocked range entry associated with the range ID.
+    """
+    low = transform_number(request.form["low"])
+    high = transform_number(request.form["high"]) or low
+    print("Updating range {} in blocked ranges".format(range_id))
+    ranges = BlockedRanges(get_db(), current_app.config)
+    valid, error = ranges.validate_range(low, high)
+    if not valid:
+        flash(error)
+    else:
+        ranges.update_range(range_id, low, high, request.form["reason"])
+    return redirect("/callers/blocked/ranges", code=303)
+
+
+@app.route('/callers/blocked/ranges/delete/<int:range_id>', methods=['GET'])
+def callers_blocked_ranges_delete(range_id):
+    """
+    Delete the blocked range entry associated with the range ID.
+    """
+    print("Removing range {} from blocked ranges".format(range_id))
+    ranges = BlockedRanges(get_db(), current_app.config)
+    ranges.remove_range(range_id)
+
+    return redirect("/callers/blocked/ranges", code=301)  # (re)moved permamently
+
+
+@app.route('/callers/blocked/names')
+def callers_blocked_names():
+    """
+    Display the blocked name keywords from the NameRules table
+    """
+    # Ensure the table exists
+    NameRules(get_db(), current_app.config)
+
+    # Get values used for pagination of the rules
+    total = get_row_count('NameRules')
+    page, per_page, offset = get_page_args(
+        page_parameter="page", per_page_parameter="per_page"
+    )
+
+    # Get the rules subset, limited to the pagination settings
+    sql = 'SELECT RuleID, Keyword, Reason FROM NameRules ORDER BY Keyword LIMIT {}, {}'.format(offset, per_page)
+    g.cur.execute(sql)
+    result_set = g.cur.fetchall()
+    records = []
+    for record in result_set:
+        records.append(dict(
+            Rule_ID=record[0],
+            Keyword=record[1],
+            Reason=record[2]))
+
+    # Create a pagination object for the page
+    pagination = get_pagination(
+        page=page,
+        per_page=per_page,
+        total=total,
+        record_name="blocked names",
+        format_total=True,
+        format_number=True,
+    )
+    # Render the resullts with pagination
+    return render_template(
+        'callers_blocked_names.html',
+        active_nav_item='blocked',
+        rules=records,
+        page=page,
+        per_page=per_page,
+        pagination=pagination,
+    )
+
+
+@app.route('/callers/blocked/names/add', methods=['POST'])
+def callers_blocked_names_add():
+    """
+    Add a new blocked name keyword
+    """
+    keyword = request.form["keyword"]
+    print("Adding " + keyword + " to blocked names")
+    rules = NameRules(get_db(), current_app.config)
+    valid, error = rules.validate_keyword(keyword)
+    if not valid:
+        flash(error)
+    elif not rules.add_rule(keyword, request.form["reason"]):
+        flash("Failed to add the keyword")
+    return redirect("/callers/blocked/names", code=303)
+
+
+@app.route('/callers/blocked/names/update/<int:rule_id>', methods=['POST'])
+def callers_blocked_names_update(rule_id):
+    """
+    Update the blocked name keyword associated with the rule ID.
+    """
+    keyword = request.form["keyword"]
+    print("Updating rule {} in blocked names".format(rule_id))
+    rules = NameRules(get_db(), current_app.config)
+    valid, error = rules.validate_keyword(keyword)
+    if not valid:
+        flash(error)
+    else:
+        rules.update_rule(rule_id, keyword, request.form["reason"])
+    return redirect("/callers/blocked/names", code=303)
+
+
+@app.route('/callers/blocked/names/delete/<int:rule_id>', methods=['GET'])
+def callers_blocked_names_delete(rule_id):
+    """
+    Delete the blocked name keyword associated with the rule ID.
+    """
+    print("Removing rule {} from blocked names".format(rule_id))
+    rules = NameRules(get_db(), current_app.config)
+    rules.remove_rule(rule_id)
+
+    return redirect("/callers/blocked/names", code=301)  # (re)moved permamently
+
+
 @app.route('/callers/permitted')
 def callers_permitted():
     """
@@ -629,7 +830,8 @@ def callers_permitted():
         page_parameter="page", per_page_parameter="per_page"
     )
     # Get the whitelist subset, limited to the pagination settings
-    sql = 'SELECT * FROM Whitelist ORDER BY datetime(SystemDateTime) DESC LIMIT {}, {}'.format(offset, per_page)
+    sql = '''SELECT PhoneNo, Name, Reason, SystemDateTime, Expires FROM Whitelist
+        ORDER BY SystemDateTime DESC LIMIT {}, {}'''.format(offset, per_page)
     g.cur.execute(sql)
     result_set = g.cur.fetchall()
     # Build a list of formatted dict items
@@ -641,7 +843,8 @@ def callers_permitted():
             Phone_Number=phone_no,
             Name=record[1],
             Reason=record[2],
-            System_Date_Time=record[3][:19]))  # Strip the decimal secs
+            System_Date_Time=record[3][:19],  # Strip the decimal secs
+            Expires=record[4] or ""))
     # Create a pagination object for the page
     pagination = get_pagination(
         page=page,
@@ -675,7 +878,11 @@ def callers_permitted_add():
     caller['NAME'] = request.form['name']
     print("Adding " + number + " to whitelist")
     whitelist = Whitelist(get_db(), current_app.config)
-    success = whitelist.add_caller(caller, request.form['reason'])
+    expires, error = get_expires_hours()
+    if error:
+        flash(error)
+        return redirect("/callers/permitted", code=303)
+    success = whitelist.add_caller(caller, request.form['reason'], expires)
     if success:
         return redirect("/callers/permitted", code=303)
     else:
@@ -693,6 +900,13 @@ def callers_permitted_update(phone_no):
     print("Updating " + number + " in whitelist")
     whitelist = Whitelist(get_db(), current_app.config)
     whitelist.update_number(number, request.form['name'], request.form['reason'])
+    if request.form.get("expires", "").strip():
+        # Renew, e.g., when re-adding a temporary entry
+        expires, error = get_expires_hours()
+        if error:
+            flash(error)
+        else:
+            whitelist.set_expires(number, expires)
 
     return redirect("/callers/permitted", code=303)
 
@@ -739,10 +953,10 @@ def messages():
         CASE WHEN d.PhoneNo is null THEN 'N' ELSE 'Y' END Blacklisted
     FROM Message AS a
     INNER JOIN CallLog AS b ON a.CallLogID = b.CallLogID
-    LEFT JOIN Whitelist AS c ON b.Number = c.PhoneNo
-    LEFT JOIN Blacklist AS d ON b.Number = d.PhoneNo
+    {}
+    {}
     ORDER BY a.DateTime DESC
-    LIMIT {}, {}""".format(offset, per_page)
+    LIMIT {}, {}""".format(list_join("Whitelist", "c", "b"), list_join("Blacklist", "d", "b"), offset, per_page)
     g.cur.execute(sql)
     result_set = g.cur.fetchall()
 
@@ -857,12 +1071,66 @@ def settings():
     curr_settings = highlight(config_contents, PythonLexer(), HtmlFormatter())
     file_settings = highlight(file_contents, PythonLexer(), HtmlFormatter())
 
+    # Get the state of the online screening services' circuit breakers
+    services = []
+    service_status = current_app.config.get("SERVICE_STATUS")
+    for status in (service_status() if service_status else []):
+        if status["retry_at"] is not None:
+            status["retry_at"] = datetime.fromtimestamp(status["retry_at"]).strftime("%I:%M:%S %p")
+        services.append(status)
+
+    # Get the time taken by each screening stage over the last 30 days
+    since = time.time() - 30 * 24 * 60 * 60
+    stages = stage_percentiles(get_db(), since)
+
     return render_template(
         "settings.html",
         active_nav_item='settings',
         config_file=file_path,
         curr_settings=curr_settings,
-        file_settings=file_settings)
+        file_settings=file_settings,
+        services=services,
+        stages=stages)
+
+
+@app.route('/settings/whatif', methods=['GET', 'POST'])
+def settings_whatif():
+    """
+    Compare how the call history would be screened with candidate
+    name and number patterns versus the current settings.
+    """
+    config = current_app.config.get("MASTER_CONFIG")
+    keys = ("BLOCK_NAME_PATTERNS", "BLOCK_NUMBER_PATTERNS", "PERMIT_NAME_PATTERNS", "PERMIT_NUMBER_PATTERNS")
+
+    report = None
+    months = 3
+    form = {key: pformat(config[key]) for key in keys}
+    if request.method == "POST":
+        form = {key: request.form.get(key, "{}") for key in keys}
+        try:
+            months = int(request.form.get("months", months))
+            rules = {}
+            for key in keys:
+                rules[key] = ast.literal_eval(form[key])
+                if not isinstance(rules[key], dict):
+                    raise ValueError("{} must be a dict".format(key))
+                for pattern in rules[key]:
+                    re.compile(pattern)
+        except (ValueError, SyntaxError, re.error) as e:
+            flash("Invalid rules: {}".format(e))
+        else:
+            screener = make_screener(get_db(), config)
+            calls = read_call_log(get_db(), since=months_ago(months))
+            report = compare_decisions(screener, calls, rules, max_changes=500)
+            for call, old_action, new_action, reason in report["changes"]:
+                call["Phone_Number"] = format_phone_no(call["NMBR"])
+
+    return render_template(
+        "whatif.html",
+        active_nav_item='settings',
+        form=form,
+        months=months,
+        report=report)
 
 
 def format_phone_no(number):
@@ -903,6 +1171,16 @@ def format_phone_no(number):
     return separator.join(phone_parts)
 
 
+def get_call_time(call_time):
+    """
+    Returns the local datetime of a CallLog CallTime.
+        :param call_time: seconds since the epoch
+    """
+    if call_time is None:
+        return datetime.fromtimestamp(0)
+    return datetime.fromtimestamp(call_time)
+
+
 def transform_number(phone_no):
     '''
     Returns the phone no stripped of all non-alphanumeric characters and makes uppercase.
@@ -910,6 +1188,23 @@ def transform_number(phone_no):
     return "".join(filter(str.isalnum, phone_no)).upper()
 
 
+def get_expires_hours():
+    """
+    Returns the number of hours in the form's optional "expires" field,
+    and an error message, if any. The hours are None if the field is blank.
+    """
+    value = request.form.get("expires", "").strip()
+    if not value:
+        return None, ""
+    try:
+        hours = float(value)
+    except ValueError:
+        return None, "The expiry must be a number of hours"
+    if hours <= 0:
+        return None, "The expiry must be a number of hours"
+    return hours, ""
+
+
 def get_db():
     '''
     Get a connection to the database
@@ -983,18 +1278,25 @@ def get_pagination(**kwargs):
     )
 
 
-def run_flask(config):
+def run_flask(config, service_status=None):
     '''
     Runs the Flask webapp.
         :param config: the application-wide master config object
+        :param service_status: an optional callable that returns the state
+            of the online screening services, see CallScreener.service_status
     '''
     app.secret_key = get_random_string()
     with app.app_context():
         # Application-wide config dict
         app.config["MASTER_CONFIG"] = config
+        # Kept apart from the master config, which is displayed on the settings page
+        app.config["SERVICE_STATUS"] = service_status
         # Override Flask settings with CallAttendant config settings
         app.config["DEBUG"] = config["DEBUG"]
         app.config["TESTING"] = config["TESTING"]
+        app.config["PHONE_COUNTRY_CODE"] = config["PHONE_COUNTRY_CODE"]
+        app.config["BLOCK_BLOOM_FILTER"] = config["BLOCK_BLOOM_FILTER"]
+        app.config["BLOCK_BLOOM_FILTER_ERROR_RATE"] = config["BLOCK_BLOOM_FILTER_ERROR_RATE"]
 
     # Turn off the HTML GET/POST logging
     if not app.config["DEBUG"]:
@@ -1006,9 +1308,11 @@ def run_flask(config):
     app.run(host='0.0.0.0', debug=False)
 
 
-def start(config):
+def start(config, service_status=None):
     '''
     Starts the Flask webapp in a separate thread.
         :param config: the application-wide master config object
+        :param service_status: an optional callable that returns the state
+            of the online screening services, see CallScreener.service_status
     '''
-    _thread.start_new_thread(run_flask, (config,))
+    _thread.start_new_thread(run_flask, (config, service_status))
@@ -24,8 +24,6 @@ setuptools.setup(
     include_package_data=True,      # Includes files from MANIFEST.in
     install_requires=[
         "backports.functools-lru-cache>=1.6.1",
-        "beautifulsoup4>=4.9.1",
-        "bs4>=0.0.1",
         "click>=7.1.2",
         "colorzero>=1.1",
         "Flask>=1.1.2",
@@ -35,7 +33,6 @@ setuptools.setup(
         "iso8601>=0.1.12",
         "itsdangerous>=1.1.0",
         "Jinja2>=2.11.2",
-        "lxml>=4.5.2",
         "MarkupSafe>=1.1.1",
         "pigpio>=1.46",
         "pygments",
@@ -45,12 +42,12 @@ setuptools.setup(
         "PyYAML>=5.3.1",
         "RPi.GPIO>=0.7.0",
         "RPIO>=0.10.0",
-        "soupsieve>=1.9.6",
         "Werkzeug>=1.0.1",
     ],
     entry_points={
         "console_scripts": [
             "callattendant = callattendant.__main__:main",
+            "callattendant-admin = callattendant.__main__:admin",
         ]
     },
     scripts=[
@@ -85,19 +85,19 @@ def app(mocker):
     mocker.patch("hardware.indicators.RingIndicator.blink")
     mocker.patch("hardware.indicators.RingIndicator.close")
 
-    def mock_is_whitelisted(caller):
+    def mock_is_whitelisted(caller, trace=None):
         if caller["NAME"] in ["CALLER1", "CALLER3"]:
             return (True, "whitelisted")
         else:
             return (False, None)
 
-    def mock_is_blacklisted(caller):
+    def mock_is_blacklisted(caller, trace=None):
         if caller["NAME"] in ["CALLER2", "CALLER3"]:
             return True, "blacklisted"
         else:
             return False, None
 
-    def assert_log_caller_action(caller, action, reason):
+    def assert_log_caller_action(caller, action, reason, trace=None):
         name = caller["NAME"]
         print("{} {}".format(name, action))
         # Assertions
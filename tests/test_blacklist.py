@@ -24,6 +24,7 @@
 #  SOFTWARE.
 
 import sqlite3
+from datetime import datetime, timedelta
 from pprint import pprint
 
 import pytest
@@ -113,3 +114,12 @@ def test_multiple(blacklist):
 
     caller = blacklist.get_number(number)
     pprint(caller)
+
+
+def test_expires(blacklist):
+    callerid = {"NAME": "Spammer", "NMBR": "8055550002", "DATE": "1012", "TIME": "0600"}
+    assert blacklist.add_caller(callerid, "Temporary", datetime.now() - timedelta(seconds=1))
+    assert blacklist.check_number("8055550002") == (False, "")
+
+    assert blacklist.set_expires("8055550002", None)
+    assert blacklist.check_number("8055550002") == (True, "Temporary")
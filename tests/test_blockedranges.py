@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_blockedranges.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sqlite3
+
+import pytest
+
+from callattendant.screening.blockedranges import BlockedRanges
+from callattendant.screening.rangeindex import RangeIndex
+
+
+@pytest.fixture(scope='module')
+def ranges():
+
+    # Create the test db in RAM
+    db = sqlite3.connect(":memory:")
+
+    # Mock the application config, which is a dict-based object
+    config = {}
+    config['DEBUG'] = True
+    config['TESTING'] = True
+
+    # Create the blocked ranges to be tested
+    ranges = BlockedRanges(db, config)
+
+    return ranges
+
+
+def test_add_range(ranges):
+    assert ranges.add_range("800", "800", "Toll free")
+    assert ranges.add_range("212555", "212559", "Exchanges")
+
+    # Invalid ranges are rejected
+    assert not ranges.add_range("212", "2125", "Mismatched lengths")
+    assert not ranges.add_range("300", "200", "Backwards")
+    assert not ranges.add_range("8OO", "8OO", "Not digits")
+
+
+def test_check_number(ranges):
+    assert ranges.check_number("8005551212") == (True, "Toll free")
+    assert ranges.check_number("2125551234") == (True, "Exchanges")
+    assert ranges.check_number("2125591234") == (True, "Exchanges")
+    # The national number is matched, with or without the country code
+    assert ranges.check_number("18005551212") == (True, "Toll free")
+    assert ranges.check_number("+1 212 555 1234") == (True, "Exchanges")
+
+    assert ranges.check_number("2125601234") == (False, "")
+    assert ranges.check_number("8015551212") == (False, "")
+    assert ranges.check_number("80") == (False, "")
+
+
+def test_update_remove_range(ranges):
+    range_id = [row[0] for row in ranges.get_ranges() if row[1] == "800"][0]
+
+    assert ranges.update_range(range_id, "800", "899", "Eight hundreds")
+    assert ranges.check_number("8885551212") == (True, "Eight hundreds")
+    assert not ranges.update_range(range_id, "899", "800", "Backwards")
+
+    assert ranges.remove_range(range_id)
+    assert ranges.check_number("8885551212") == (False, "")
+
+
+def test_nested_ranges_match_the_index():
+    ranges = BlockedRanges(sqlite3.connect(":memory:"), {"DEBUG": False, "TESTING": False})
+    assert ranges.add_range("212000", "212999", "Area block")
+    assert ranges.add_range("212555", "212555", "Known scammer")
+    assert ranges.add_range("212550", "212559", "Exchanges")
+    assert ranges.add_range("212", "212", "Area code")
+
+    index = RangeIndex([(low, high, reason) for range_id, low, high, reason in ranges.get_ranges()])
+    for number in ("2125551212", "2125541212", "2125601212", "2120001212", "2131234567"):
+        is_blocked, reason = ranges.check_number(number)
+        assert (reason if is_blocked else None) == index.search(number)
+    assert ranges.check_number("2125551212") == (True, "Known scammer")
+    assert ranges.check_number("2125541212") == (True, "Exchanges")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_bloomfilter.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import random
+import sqlite3
+import time
+import tracemalloc
+
+from callattendant.screening.blacklist import Blacklist
+from callattendant.screening.bloomfilter import BloomFilter
+from callattendant.screening.bulkimport import import_blacklist
+
+
+def test_no_false_negatives(tmp_path):
+    filename = str(tmp_path / "test.bloom")
+    numbers = [str(8000000000 + i * 13) for i in range(10000)]
+    bloom = BloomFilter.create(filename, capacity=20000, error_rate=0.01, numbers=numbers)
+
+    assert bloom.count == 10000
+    assert all(number in bloom for number in numbers)
+
+    bloom.add("5551234567")
+    assert "5551234567" in bloom
+    assert bloom.count == 10001
+    bloom.close()
+
+    # The filter is persistent
+    bloom = BloomFilter(filename)
+    assert "5551234567" in bloom
+    assert bloom.count == 10001
+    bloom.close()
+
+
+def test_false_positive_rate_and_memory(tmp_path):
+    filename = str(tmp_path / "test.bloom")
+    count = 200000
+    random.seed(1)
+    numbers = set(str(n) for n in random.sample(range(2000000000, 9999999999), 2 * count))
+    members = list(numbers)[:count]
+    others = list(numbers)[count:]
+
+    start = time.perf_counter()
+    bloom = BloomFilter.create(filename, capacity=count, error_rate=0.01, numbers=members)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    false_positives = sum(1 for number in others[:50000] if number in bloom)
+    probe_time = (time.perf_counter() - start) / 50000
+    rate = false_positives / 50000
+
+    # Compare with the memory used by a set of the same numbers
+    tracemalloc.start()
+    members_set = set(str(n) for n in members)
+    set_size = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert len(members_set) == count
+
+    print("{:,} numbers: built in {:.1f} s, {:.1f} usec per probe".format(count, build_time, probe_time * 1e6))
+    print("False positive rate: {:.4f} (expected {:.4f})".format(rate, bloom.false_positive_rate()))
+    print("Filter: {:,} bytes; set: {:,} bytes".format(bloom.size, set_size))
+    assert rate < 0.02
+    assert bloom.size < set_size / 10
+    bloom.close()
+
+
+def test_rebuild_is_atomic(tmp_path):
+    filename = str(tmp_path / "test.bloom")
+    old = BloomFilter.create(filename, capacity=1000, numbers=["8005551212"])
+    new = BloomFilter.create(filename, capacity=1000, numbers=["8885551212"])
+
+    # The old mapping is still valid, and the file has been replaced
+    assert "8005551212" in old
+    assert old.inode != new.inode
+    assert "8885551212" in new
+    old.close()
+    new.close()
+
+
+def test_blacklist_filter(tmp_path):
+    db_file = str(tmp_path / "test.db")
+    db = sqlite3.connect(db_file)
+    config = {"DEBUG": False, "TESTING": False, "BLOCK_BLOOM_FILTER": True}
+
+    blacklist = Blacklist(db, config)
+    assert os.path.exists(db_file + ".bloom")
+    assert blacklist.add_caller({"NAME": "Spammer", "NMBR": "8005551212"}, "Spam")
+    assert blacklist.check_number("8005551212") == (True, "Spam")
+
+    # Another connection, e.g., the web app, keeps the filter up to date
+    other = Blacklist(sqlite3.connect(db_file), config)
+    assert other.add_caller({"NAME": "Robocaller", "NMBR": "8885551212"}, "Robocall")
+    assert blacklist.check_number("8885551212") == (True, "Robocall")
+
+    # Numbers added in bulk are found after the filter is rebuilt
+    import_blacklist(db, [("8775551212", "", "")], "Imported")
+    other.rebuild_filter()
+    assert blacklist.check_number("8775551212") == (True, "Imported")
+    assert blacklist.check_number("8665551212") == (False, "")
+
+    # A connection with the filter disabled neither opens nor removes it
+    disabled = Blacklist(db, {"DEBUG": False, "TESTING": False, "BLOCK_BLOOM_FILTER": False})
+    assert disabled.may_contain("8665551212")
+    assert os.path.exists(db_file + ".bloom")
+
+    # The filter is removed explicitly, e.g., at startup when it's disabled
+    disabled.remove_filter()
+    assert not os.path.exists(db_file + ".bloom")
+    assert blacklist.check_number("8775551212") == (True, "Imported")
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_bulkimport.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import io
+import sqlite3
+
+import pytest
+
+from callattendant.admin import import_blacklist_file, build_snapshot_file
+from callattendant.screening.blacklist import Blacklist
+from callattendant.screening.bulkimport import normalize_number, read_numbers, import_blacklist
+from callattendant.screening.spamsnapshot import SpamSnapshot
+
+
+@pytest.fixture
+def db():
+    # Create the test db in RAM
+    db = sqlite3.connect(":memory:")
+    Blacklist(db, {"DEBUG": False, "TESTING": False})
+    return db
+
+
+def test_normalize_number():
+    assert normalize_number("+1 (800) 555-1212") == "+18005551212"
+    assert normalize_number("800.555.1212") == "+18005551212"
+    assert normalize_number("5551212") == "5551212"
+    assert normalize_number("+44 1234 567890") == "+441234567890"
+    assert normalize_number("Company_Phone_Number") is None
+    assert normalize_number("911") is None
+
+    # Outside North America
+    assert normalize_number("01234 567890", "44") == "+441234567890"
+    assert normalize_number("0044 1234 567890", "44") == "+441234567890"
+
+
+def test_read_numbers():
+    f = io.StringIO("Number,Name,Reason\n800-555-1212,Spammer,Robocall\nbogus\n18885551212\n")
+    rows = list(read_numbers(f, number_column=0, name_column=1, reason_column=2))
+    assert rows == [("800-555-1212", "Spammer", "Robocall"), (None, "", ""), ("18885551212", "", "")]
+
+    # No header, and columns by name
+    f = io.StringIO("8005551212\n8885551212\n")
+    assert [row[0] for row in read_numbers(f)] == ["8005551212", "8885551212"]
+
+    f = io.StringIO("Date,Phone\n2020-10-01,800-555-1212\n")
+    assert list(read_numbers(f, number_column="phone")) == [("800-555-1212", "", "")]
+
+    f = io.StringIO("020 7946 0000\n")
+    assert list(read_numbers(f, country_code="44")) == [("020 7946 0000", "", "")]
+
+
+def test_import_upsert(db):
+    db.execute("""INSERT INTO Blacklist(PhoneNo, Name, Reason, SystemDateTime, NormalizedNo)
+        VALUES('800-555-1212', 'Existing', 'Old', '2020-01-01 00:00:00', '+18005551212')""")
+    db.commit()
+
+    # The existing entry is updated, whichever form the numbers are in
+    rows = read_numbers(io.StringIO("18005551212\n8885551212,Spammer\nbogus\n(888) 555-1212\n"), name_column=1)
+    stats = import_blacklist(db, rows, "Imported", batch_size=2)
+    assert stats["imported"] == 3
+    assert stats["skipped"] == 1
+
+    # The new entries are stored like those added in the web app
+    rows = db.execute("SELECT PhoneNo, Name, Reason, NormalizedNo FROM Blacklist ORDER BY PhoneNo").fetchall()
+    assert rows == [("800-555-1212", "Existing", "Imported", "+18005551212"),
+                    ("8885551212", "Spammer", "Imported", "+18885551212")]
+
+
+def test_import_rollback(db):
+    def rows():
+        yield ("8005551212", "", "")
+        raise IOError("Read failed")
+
+    with pytest.raises(IOError):
+        import_blacklist(db, rows(), "Imported", batch_size=1)
+    assert db.execute("SELECT COUNT(*) FROM Blacklist").fetchone()[0] == 0
+
+
+def test_import_throughput(db):
+    count = 200000
+    f = io.StringIO("".join("{}\n".format(2000000000 + i * 7) for i in range(count)))
+
+    stats = import_blacklist(db, read_numbers(f), "Imported", batch_size=10000)
+    print("Imported {:,} numbers in {:.2f} seconds: {:,.0f} numbers/sec".format(
+        stats["imported"], stats["elapsed"], stats["rate"]))
+    assert stats["imported"] == count
+    assert db.execute("SELECT COUNT(*) FROM Blacklist").fetchone()[0] == count
+
+
+def test_import_blacklist_file(tmp_path):
+    filename = str(tmp_path / "spam.csv")
+    with open(filename, "w") as f:
+        f.write("Phone Number\n800-555-1212\n888-555-1212\n")
+    config = {"DEBUG": False, "TESTING": False, "DB_FILE": str(tmp_path / "test.db")}
+
+    stats = import_blacklist_file(config, filename, "Complaints")
+    assert stats["imported"] == 2
+
+    db = sqlite3.connect(config["DB_FILE"])
+    assert db.execute("SELECT COUNT(*) FROM Blacklist WHERE Reason='Complaints'").fetchone()[0] == 2
+
+
+def test_build_snapshot_file(tmp_path):
+    filename = str(tmp_path / "spam.csv")
+    with open(filename, "w") as f:
+        f.write("Phone Number\n800-555-1212\n888-555-1212\n800-555-1212\n")
+    config = {"BLOCK_SERVICE_SNAPSHOT_FILE": str(tmp_path / "spam.bin")}
+
+    assert build_snapshot_file(config, filename) == 2
+    assert 18885551212 in SpamSnapshot(config["BLOCK_SERVICE_SNAPSHOT_FILE"])
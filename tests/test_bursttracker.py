@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_bursttracker.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sqlite3
+import time
+
+from callattendant.screening.bursttracker import BurstTracker
+from callattendant.screening.calllogger import CallLogger
+
+
+def test_record():
+    tracker = BurstTracker(max_calls=3, window=3600)
+    now = 1000000.0
+    assert tracker.record("8005551212", now) == 1
+    assert tracker.record("8005551212", now + 60) == 2
+    assert tracker.record("8005551212", now + 120) == 3
+    assert not tracker.is_bursting("8005551212", now + 120)
+    assert tracker.record("8005551212", now + 180) == 4
+    assert tracker.is_bursting("8005551212", now + 180)
+
+    # The calls slide out of the window
+    assert tracker.count("8005551212", now + 3630) == 3
+    assert not tracker.is_bursting("8005551212", now + 3630)
+    assert tracker.count("8005551212", now + 7200) == 0
+    assert tracker.count("8885551212", now) == 0
+
+
+def test_ring_is_bounded():
+    tracker = BurstTracker(max_calls=2, window=3600)
+    for i in range(100):
+        count = tracker.record("8005551212", 1000000.0 + i)
+    assert count == 3
+
+
+def test_lru_eviction():
+    tracker = BurstTracker(max_calls=2, window=3600, capacity=2)
+    now = 1000000.0
+    tracker.record("1111111111", now)
+    tracker.record("2222222222", now)
+    tracker.record("1111111111", now)
+    tracker.record("3333333333", now)
+    assert len(tracker) == 2
+    # The least recently seen number was evicted
+    assert tracker.count("2222222222", now) == 0
+    assert tracker.count("1111111111", now) == 2
+
+
+def test_seed():
+    db = sqlite3.connect(":memory:")
+    logger = CallLogger(db, {"DEBUG": False, "TESTING": False})
+    caller = {"NAME": "ROBOCALLER", "NMBR": "8005551212", "DATE": "1012", "TIME": "0600"}
+    for i in range(3):
+        logger.log_caller(caller, "Screened", "")
+    db.execute("INSERT INTO CallLog(Number, CallTime) VALUES('8885551212', ?)", (int(time.time() - 7200),))
+
+    tracker = BurstTracker(max_calls=2, window=3600)
+    tracker.seed(db)
+    assert tracker.is_bursting("+18005551212")
+    assert tracker.count("+18885551212") == 0
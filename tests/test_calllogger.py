@@ -24,9 +24,12 @@
 #  SOFTWARE.
 
 import sqlite3
+import threading
+import time
 import pytest
 
-from callattendant.screening.calllogger import CallLogger
+from callattendant.screening.calllogger import CallLogger, CallLogWriter, BLOCKED, SCREENED, action_name
+from callattendant.screening.screeningtrace import ScreeningTrace, get_trace
 
 
 @pytest.fixture(scope='module')
@@ -59,3 +62,141 @@ def test_add_caller(calllogger):
     assert calllogger.log_caller(callerid, "Permitted", "Test1") == 1
 
     assert calllogger.log_caller(callerid) == 2
+
+
+def test_log_caller_columns(calllogger):
+    callerid = {"NAME": "Bruce", "NMBR": "805-555-1234", "DATE": "1012", "TIME": "0600"}
+    start = int(time.time())
+
+    call_no = calllogger.log_caller(callerid, "Blocked", "Spammer")
+
+    row = calllogger.db.execute("""SELECT Number, NormalizedNo, Action, Reason, CallTime
+        FROM CallLog WHERE CallLogID=?""", (call_no,)).fetchone()
+    assert row[:4] == ("805-555-1234", 18055551234, BLOCKED, "Spammer")
+    assert start <= row[4] <= time.time()
+    assert action_name(row[2]) == "Blocked"
+
+
+def test_log_trace(calllogger):
+    callerid = {"NAME": "Bruce", "NMBR": "1234567890", "DATE": "1012", "TIME": "0600"}
+    trace = ScreeningTrace()
+    trace.add("Whitelist", False, "", 0.000120)
+    trace.add("Blacklist", True, "Spammer", 0.000045)
+
+    call_no = calllogger.log_caller(callerid, "Blocked", "Spammer", trace)
+
+    assert get_trace(calllogger.db, call_no) == [
+        dict(stage="Whitelist", matched=False, reason="", elapsed=120),
+        dict(stage="Blacklist", matched=True, reason="Spammer", elapsed=45),
+    ]
+
+
+def test_log_caller_async(tmp_path):
+    db_file = str(tmp_path / "test.db")
+    config = {"DEBUG": False, "TESTING": False}
+    callerid = {"NAME": "Bruce", "NMBR": "1234567890", "DATE": "1012", "TIME": "0600"}
+    calllogger = CallLogger(sqlite3.connect(db_file), config)
+    assert calllogger.log_caller(callerid) == 1
+    calllogger.close()
+
+    # The IDs continue from the existing calls
+    calllogger = CallLogger(sqlite3.connect(db_file), config)
+
+    # Calls are logged while another connection holds the database lock
+    other = sqlite3.connect(db_file)
+    other.execute("BEGIN EXCLUSIVE")
+    start = time.time()
+    trace = ScreeningTrace()
+    trace.add("Blacklist", True, "Spammer", 0.000045)
+    call_nos = [calllogger.log_caller(callerid, "Blocked", "Spammer", trace) for i in range(50)]
+    assert time.time() - start < 0.5
+    assert call_nos == list(range(2, 52))
+    other.rollback()
+
+    # The queued calls are written in a few group commits
+    calllogger.flush()
+    assert calllogger._writer.commits < 50
+    assert other.execute("SELECT COUNT(*) FROM CallLog").fetchone()[0] == 51
+    assert get_trace(other, 51) == [dict(stage="Blacklist", matched=True, reason="Spammer", elapsed=45)]
+
+    # The queue is written on close
+    call_no = calllogger.log_caller(callerid)
+    calllogger.close()
+    assert other.execute("SELECT Action FROM CallLog WHERE CallLogID=?", (call_no,)).fetchone() == (SCREENED,)
+
+
+def test_writer_retries_locked_database(tmp_path):
+    db_file = str(tmp_path / "test.db")
+    db = sqlite3.connect(db_file)
+    CallLogger(db, {"DEBUG": False, "TESTING": False}).close()
+    arguments = ["Bruce", "1234567890", 1234567890, SCREENED, "", int(time.time())]
+
+    # The database stays locked past the connection's timeout
+    other = sqlite3.connect(db_file)
+    other.execute("BEGIN EXCLUSIVE")
+    writer = CallLogWriter(db_file, 1, timeout=0.05, retry_delay=0.05)
+    call_nos = [writer.write(arguments, []) for i in range(10)]
+    time.sleep(0.3)
+    other.rollback()
+    writer.flush()
+
+    # A duplicate CallLogID only loses its own call
+    db.execute("INSERT INTO CallLog(CallLogID) VALUES(12)")
+    db.commit()
+    call_nos += [writer.write(arguments, []) for i in range(3)]
+    writer.close()
+
+    rows = db.execute("SELECT CallLogID FROM CallLog WHERE Name='Bruce' ORDER BY CallLogID").fetchall()
+    assert [row[0] for row in rows] == [no for no in call_nos if no != 12]
+
+
+def test_writer_holds_back_calls_while_locked(tmp_path):
+    db_file = str(tmp_path / "test.db")
+    db = sqlite3.connect(db_file)
+    CallLogger(db, {"DEBUG": False, "TESTING": False}).close()
+    arguments = ["Bruce", "1234567890", 1234567890, SCREENED, "", int(time.time())]
+
+    # The group is held back, not written row by row, until the lock is released
+    other = sqlite3.connect(db_file)
+    other.execute("BEGIN EXCLUSIVE")
+    writer = CallLogWriter(db_file, 1, timeout=0.02, max_retries=0, retry_delay=0.02)
+    call_nos = [writer.write(arguments, []) for i in range(5)]
+    time.sleep(0.3)
+    assert writer.commits == 0
+    other.rollback()
+    writer.flush()
+    assert writer.commits == 1
+    writer.close()
+
+    rows = db.execute("SELECT CallLogID FROM CallLog WHERE Name='Bruce' ORDER BY CallLogID").fetchall()
+    assert [row[0] for row in rows] == call_nos
+
+
+def test_writer_survives_bad_calls(tmp_path):
+    db_file = str(tmp_path / "test.db")
+    db = sqlite3.connect(db_file)
+    CallLogger(db, {"DEBUG": False, "TESTING": False}).close()
+    arguments = ["Bruce", "1234567890", 1234567890, SCREENED, "", int(time.time())]
+
+    # A call that fails with a non-sqlite error is reported as lost,
+    # and flush() and close() still return
+    writer = CallLogWriter(db_file, 1)
+    writer.write(("Bad", "arguments"), [])
+    done = threading.Event()
+
+    def flush():
+        writer.flush()
+        done.set()
+
+    threading.Thread(target=flush, daemon=True).start()
+    assert done.wait(5)
+
+    call_no = writer.write(arguments, [])
+    writer.flush()
+    closer = threading.Thread(target=writer.close, daemon=True)
+    closer.start()
+    closer.join(5)
+    assert not closer.is_alive()
+
+    rows = db.execute("SELECT CallLogID FROM CallLog WHERE Name='Bruce'").fetchall()
+    assert rows == [(call_no,)]
@@ -23,11 +23,18 @@
 #  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 #  SOFTWARE.
 
+import os
 import sqlite3
+import threading
+import time
+
 import pytest
 
 from callattendant.config import Config
+from callattendant.screening.calllogger import CallLogger
 from callattendant.screening.callscreener import CallScreener
+from callattendant.screening.circuitbreaker import CircuitBreaker
+from callattendant.screening.screeningtrace import ScreeningTrace
 
 
 # Create a blocked caller
@@ -121,3 +128,287 @@ def test_permitted_name_pattern(screener):
 def test_permitted_number_pattern(screener):
     is_whitelisted, reason = screener.is_whitelisted(caller7)
     assert is_whitelisted, "caller7 should be permiteed by number pattern"
+
+
+def test_nomorobo_result_cached(screener, mocker):
+    caller = {"NAME": "CALLER8", "NMBR": "8885551212", "DATE": "1012", "TIME": "0600"}
+    screener._cache.put("NOMOROBO", caller["NMBR"], {"spam": False, "score": 0, "reason": ""})
+
+    lookup = mocker.patch.object(screener._services["NOMOROBO"], "lookup_number")
+
+    is_blacklisted, reason = screener.is_blacklisted(caller)
+    assert not is_blacklisted, "caller8 should be screened by the cached result"
+    assert not lookup.called
+
+
+def test_not_found_result_not_cached(screener, mocker):
+    caller = {"NAME": "CALLER10", "NMBR": "8885550404", "DATE": "1012", "TIME": "0600"}
+    mocker.patch.object(screener._services["NOMOROBO"], "lookup_number",
+                        return_value={"spam": False, "score": 0, "reason": "", "cacheable": False})
+
+    is_blacklisted, reason = screener.is_blacklisted(caller)
+    assert not is_blacklisted
+    assert screener._cache.get("NOMOROBO", caller["NMBR"]) is None
+
+
+def test_not_spam_result_cached(screener, mocker):
+    # Nomorobo responds with a 404 page for a number that isn't spam
+    caller = {"NAME": "CALLER11", "NMBR": "8885551404", "DATE": "1012", "TIME": "0600"}
+    with open(os.path.join(os.path.dirname(__file__), "pages", "nomorobo_not_found.html"), "rb") as f:
+        page = f.read()
+    http_get = mocker.patch.object(screener._services["NOMOROBO"], "http_get", return_value=(404, page))
+
+    for i in range(2):
+        is_blacklisted, reason = screener.is_blacklisted(caller)
+        assert not is_blacklisted
+    assert http_get.call_count == 1
+    assert screener._cache.get("NOMOROBO", caller["NMBR"])["spam"] is False
+
+
+def test_service_lookup_concurrent(screener, mocker):
+    caller = {"NAME": "CALLER9", "NMBR": "8885559999", "DATE": "1012", "TIME": "0600"}
+    started = threading.Event()
+    proceed = threading.Event()
+
+    def slow_lookup(number):
+        started.set()
+        proceed.wait(5)
+        return {"spam": True, "score": 2, "reason": "Robocaller"}
+
+    mocker.patch.object(screener._services["NOMOROBO"], "lookup_number", slow_lookup)
+
+    # The local lists are checked without waiting on the online service
+    is_blacklisted, reason = screener.is_blacklisted(caller, check_service=False)
+    assert not is_blacklisted
+
+    # The lookup runs in the background until it is finished
+    lookup = screener.start_service_lookup(caller)
+    assert started.wait(5)
+    assert not lookup.results
+    proceed.set()
+
+    is_blacklisted, reason = screener.finish_service_lookup(lookup)
+    assert is_blacklisted, "caller9 should be blocked by the online service"
+
+    # The spammer was added to the blacklist
+    is_blacklisted, reason = screener.is_blacklisted(caller, check_service=False)
+    assert is_blacklisted
+
+
+def test_service_lookup_timeout_opens_breaker(screener, mocker):
+    caller = {"NAME": "CALLER10", "NMBR": "8885550000", "DATE": "1012", "TIME": "0600"}
+    proceed = threading.Event()
+
+    def hung_lookup(number):
+        proceed.wait(5)
+        return {"spam": True, "score": 2, "reason": "Robocaller"}
+
+    lookup_number = mocker.patch.object(screener._services["NOMOROBO"], "lookup_number", side_effect=hung_lookup)
+    mocker.patch.dict(screener._service_timeouts, {"NOMOROBO": 0.1})
+    mocker.patch.dict(screener.breakers, {"NOMOROBO": CircuitBreaker("NOMOROBO", 2, 60)})
+
+    # Each lookup is bounded by the latency budget
+    for i in range(2):
+        start = time.time()
+        is_blacklisted, reason = screener.is_blacklisted(caller)
+        assert time.time() - start < 1.0
+        assert not is_blacklisted
+    assert screener.breakers["NOMOROBO"].state == CircuitBreaker.OPEN
+
+    # The service is skipped while the breaker is open
+    assert screener.start_service_lookup(caller) is None
+    assert lookup_number.call_count == 2
+    proceed.set()
+
+
+def test_service_lookup_error(screener, mocker):
+    caller = {"NAME": "CALLER11", "NMBR": "8885551111", "DATE": "1012", "TIME": "0600"}
+    mocker.patch.object(screener._services["NOMOROBO"], "lookup_number", side_effect=OSError("Network is unreachable"))
+    mocker.patch.dict(screener.breakers, {"NOMOROBO": CircuitBreaker("NOMOROBO", 3, 60)})
+
+    is_blacklisted, reason = screener.is_blacklisted(caller)
+    assert not is_blacklisted
+    status = screener.service_status()[0]
+    assert status["name"] == "NOMOROBO"
+    assert status["failures"] == 1
+    assert status["state"] == CircuitBreaker.CLOSED
+
+
+def test_service_lookup_fan_out(mocker):
+    caller = {"NAME": "CALLER12", "NMBR": "8885552222", "DATE": "1012", "TIME": "0600"}
+
+    config = Config()
+    config['TESTING'] = True
+    config['BLOCK_SERVICE'] = ["NOMOROBO", "HTTP"]
+    config['BLOCK_SERVICE_HTTP_URL'] = "http://localhost/{}"
+    config['BLOCK_SERVICE_POLICY'] = "majority"
+    screener = CallScreener(sqlite3.connect(":memory:"), config)
+
+    def slow_spam(number):
+        time.sleep(0.5)
+        return {"spam": True, "score": 2, "reason": "Robocaller"}
+
+    def slow_not_spam(number):
+        time.sleep(0.5)
+        return {"spam": False, "score": 0, "reason": ""}
+
+    mocker.patch.object(screener._services["NOMOROBO"], "lookup_number", slow_spam)
+    mocker.patch.object(screener._services["HTTP"], "lookup_number", slow_not_spam)
+
+    # The services are queried concurrently, and one of two isn't a majority
+    start = time.time()
+    is_blacklisted, reason = screener.is_blacklisted(caller)
+    assert time.time() - start < 0.9
+    assert not is_blacklisted
+
+    screener.close()
+
+
+def test_service_lookup_timeouts_per_service(mocker):
+    caller = {"NAME": "CALLER16", "NMBR": "8885556666", "DATE": "1012", "TIME": "0600"}
+
+    config = Config()
+    config['TESTING'] = True
+    config['BLOCK_SERVICE'] = ["NOMOROBO", "HTTP"]
+    config['BLOCK_SERVICE_HTTP_URL'] = "http://localhost/{}"
+    config['BLOCK_SERVICE_TIMEOUT'] = 0.1
+    config['BLOCK_SERVICE_TIMEOUTS'] = {"HTTP": 2.0}
+    screener = CallScreener(sqlite3.connect(":memory:"), config)
+    proceed = threading.Event()
+
+    def hung_lookup(number):
+        proceed.wait(5)
+        return {"spam": False, "score": 0, "reason": ""}
+
+    def slow_spam(number):
+        time.sleep(0.5)
+        return {"spam": True, "score": 2, "reason": "Robocaller"}
+
+    mocker.patch.object(screener._services["NOMOROBO"], "lookup_number", hung_lookup)
+    mocker.patch.object(screener._services["HTTP"], "lookup_number", slow_spam)
+
+    # The slower service gets its own, longer budget
+    trace = ScreeningTrace()
+    start = time.time()
+    is_blacklisted, reason = screener.is_blacklisted(caller, trace=trace)
+    assert time.time() - start < 1.5
+    assert is_blacklisted
+    stages = {stage: reason for stage, matched, reason, elapsed in trace.stages}
+    assert stages["NOMOROBO"] == "Timed out"
+    assert stages["HTTP"] == "Robocaller"
+
+    proceed.set()
+    screener.close()
+
+
+def test_blocked_range(screener):
+    caller = {"NAME": "CALLER13", "NMBR": "9005551212", "DATE": "1012", "TIME": "0600"}
+    assert screener._ranges.add_range("900", "900", "Premium rate")
+
+    is_blacklisted, reason = screener.is_blacklisted(caller, check_service=False)
+    assert is_blacklisted, "caller13 should be blocked by range"
+    assert reason == "Premium rate"
+
+
+def test_blocked_name_rule(screener):
+    caller = {"NAME": "CARD SERVICES", "NMBR": "8885553333", "DATE": "1012", "TIME": "0600"}
+    assert screener._name_rules.add_rule("CARD SERVICES", "Scam")
+
+    is_blacklisted, reason = screener.is_blacklisted(caller, check_service=False)
+    assert is_blacklisted, "caller14 should be blocked by name rule"
+    assert reason == "Scam"
+
+
+def test_screen_many(screener):
+    range_caller = {"NAME": "CALLER13", "NMBR": "9005551212"}
+    rule_caller = {"NAME": "CARD SERVICES", "NMBR": "8885553333"}
+    callers = [caller1, caller2, caller3, caller5, caller6, caller7, range_caller, rule_caller, caller1]
+    changes = screener._db.total_changes
+
+    decisions = list(screener.screen_many(callers))
+    assert [action for action, reason in decisions] == [
+        "Blocked", "Permitted", "Blocked", "Blocked", "Permitted", "Permitted", "Blocked", "Blocked", "Blocked"]
+    assert decisions[2] == ("Blocked", "Telemarketer Caller ID")
+    assert decisions[6] == ("Blocked", "Premium rate")
+    assert decisions[7] == ("Blocked", "Scam")
+
+    # Candidate rules are applied to the batch only
+    rules = {"BLOCK_NAME_PATTERNS": {}, "BLACKLIST": {caller1["NMBR"]: None}}
+    decisions = list(screener.screen_many(callers, rules))
+    assert decisions[0] == ("Screened", "Not found")
+    assert decisions[2] == ("Screened", "Not found")
+    assert screener._db.total_changes == changes
+    assert screener.is_blacklisted(caller1, check_service=False)[0]
+
+
+def test_screening_trace(screener, mocker):
+    caller = {"NAME": "CALLER15", "NMBR": "8885555555", "DATE": "1012", "TIME": "0600"}
+    mocker.patch.object(screener._services["NOMOROBO"], "lookup_number",
+                        return_value={"spam": True, "score": 2, "reason": "Robocaller"})
+    mocker.patch.dict(screener.breakers, {"NOMOROBO": CircuitBreaker("NOMOROBO", 3, 60)})
+
+    trace = ScreeningTrace()
+    assert not screener.is_whitelisted(caller, trace=trace)[0]
+    assert screener.is_blacklisted(caller, trace=trace)[0]
+
+    stages = [(stage, matched) for stage, matched, reason, elapsed in trace.stages]
+    assert stages[:2] == [("Whitelist", False), ("Permitted names", False)]
+    assert ("Blacklist", False) in stages
+    assert ("Blocked numbers", False) in stages
+    assert stages[-1] == ("NOMOROBO", True)
+    assert trace.stages[-1][2] == "Robocaller"
+    assert all(elapsed >= 0 for stage, matched, reason, elapsed in trace.stages)
+
+
+def test_burst_blocked():
+    caller = {"NAME": "ROBOCALLER", "NMBR": "8885554444", "DATE": "1012", "TIME": "0600"}
+
+    config = Config()
+    config['TESTING'] = True
+    config['BLOCK_BURST_CALLS'] = 2
+    screener = CallScreener(sqlite3.connect(":memory:"), config)
+
+    for i in range(2):
+        is_blacklisted, reason = screener.is_blacklisted(caller, check_service=False)
+        assert not is_blacklisted
+    is_blacklisted, reason = screener.is_blacklisted(caller, check_service=False)
+    assert is_blacklisted, "the third call within the window should be blocked"
+    assert reason == "Burst of 3 calls in 60 minutes"
+
+    # The caller was added to the blacklist
+    assert screener._blacklist.check_number(caller["NMBR"]) == (True, reason)
+    screener.close()
+
+
+def test_burst_screened():
+    config = Config()
+    config['TESTING'] = True
+    config['BLOCK_BURST_CALLS'] = 2
+    config['BLOCK_BURST_ACTION'] = "screen"
+    screener = CallScreener(sqlite3.connect(":memory:"), config)
+
+    # The calls are counted by the canonical number, however it's presented
+    for number in ("8885554444", "18885554444"):
+        is_blacklisted, reason = screener.is_blacklisted({"NAME": "CALLER", "NMBR": number}, check_service=False)
+        assert (is_blacklisted, reason) == (False, "Not found")
+    is_blacklisted, reason = screener.is_blacklisted({"NAME": "CALLER", "NMBR": "888-555-4444"}, check_service=False)
+    assert not is_blacklisted, "the third call within the window should be screened"
+    assert reason == "Burst of 3 calls in 60 minutes"
+    assert screener._blacklist.check_number("8885554444") == (False, "")
+    screener.close()
+
+
+def test_neighbor_spoof_blocked():
+    db = sqlite3.connect(":memory:")
+    config = Config()
+    config['TESTING'] = True
+    config['BLOCK_NEIGHBOR_SPOOF'] = True
+    config['BLOCK_NEIGHBOR_HOME_NUMBER'] = "8885551234"
+    CallLogger(db, config)
+    screener = CallScreener(db, config)
+
+    caller = {"NAME": "NEIGHBOR", "NMBR": "8885556666", "DATE": "1012", "TIME": "0600"}
+    is_blacklisted, reason = screener.is_blacklisted(caller, check_service=False)
+    assert is_blacklisted, "the neighbor spoofer should be blocked"
+    assert reason == "Neighbor spoofing with score 4"
+    screener.close()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_callstats.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sqlite3
+import time
+from datetime import datetime
+
+import pytest
+
+from callattendant.admin import rebuild_stats
+from callattendant.screening.calllogger import CallLogger, BLOCKED, PERMITTED, SCREENED
+from callattendant.screening.callstats import get_call_totals, get_calls_per_day, rebuild_call_stats
+
+
+@pytest.fixture
+def db():
+    db = sqlite3.connect(":memory:")
+    CallLogger(db, {"DEBUG": False, "TESTING": False})
+    return db
+
+
+def test_rollup_is_maintained(db):
+    logger = CallLogger(db, {"DEBUG": False, "TESTING": False})
+    caller = {"NAME": "ROBOCALLER", "NMBR": "8005551212", "DATE": "1012", "TIME": "0600"}
+    for action in ("Blocked", "Blocked", "Permitted", "Screened"):
+        logger.log_caller(caller, action, "")
+    today = datetime.now().strftime("%Y-%m-%d")
+
+    assert get_call_totals(db) == (4, 2)
+    assert get_calls_per_day(db, today) == {BLOCKED: {today: 2}, PERMITTED: {today: 1}, SCREENED: {today: 1}}
+
+    # Deleted and edited calls are counted again
+    db.execute("DELETE FROM CallLog WHERE Action=?", (PERMITTED,))
+    db.execute("UPDATE CallLog SET Action=? WHERE Action=?", (BLOCKED, SCREENED))
+    db.commit()
+    assert get_call_totals(db) == (3, 3)
+
+
+def test_calls_per_day(db):
+    start = time.mktime(datetime(2020, 3, 1, 12).timetuple())
+    calls = [(BLOCKED, start), (BLOCKED, start + 60), (SCREENED, start + 86400), (PERMITTED, start - 86400)]
+    db.executemany("INSERT INTO CallLog(Action, CallTime) VALUES(?,?)", calls)
+    db.commit()
+
+    assert get_calls_per_day(db, "2020-03-01") == {
+        BLOCKED: {"2020-03-01": 2},
+        SCREENED: {"2020-03-02": 1},
+    }
+
+
+def test_rebuild(db, tmp_path):
+    db.executemany("INSERT INTO CallLog(Action, CallTime) VALUES(?,?)", [(BLOCKED, time.time())] * 3)
+    db.execute("DELETE FROM CallStatsDaily")
+    db.commit()
+    assert get_call_totals(db) == (0, 0)
+
+    assert rebuild_call_stats(db) == 3
+    assert get_call_totals(db) == (3, 3)
+
+    config = {"DB_FILE": str(tmp_path / "test.db")}
+    file_db = sqlite3.connect(config["DB_FILE"])
+    CallLogger(file_db, {"DEBUG": False, "TESTING": False}).close()
+    file_db.execute("INSERT INTO CallLog(Action, CallTime) VALUES(?,?)", (SCREENED, time.time()))
+    file_db.commit()
+    assert rebuild_stats(config) == 1
+
+
+def test_totals_dont_scan_the_call_log(db):
+    rows = [(BLOCKED if i % 3 else SCREENED, 1577880000 + i * 60) for i in range(200000)]
+    db.executemany("INSERT INTO CallLog(Action, CallTime) VALUES(?,?)", rows)
+    db.commit()
+
+    start = time.perf_counter()
+    totals = get_call_totals(db)
+    per_day = get_calls_per_day(db, "2020-01-01")
+    elapsed = time.perf_counter() - start
+    scan_start = time.perf_counter()
+    scanned = db.execute("SELECT COUNT(*), SUM(Action = ?) FROM CallLog", (BLOCKED,)).fetchone()
+    scan_elapsed = time.perf_counter() - scan_start
+
+    print("Totals of 200,000 calls: {:.4f} sec from the rollup, {:.4f} sec counted".format(elapsed, scan_elapsed))
+    assert totals == tuple(scanned)
+    assert sum(sum(counts.values()) for counts in per_day.values()) == 200000
+    plan = str(db.execute("EXPLAIN QUERY PLAN SELECT CallDate, Action, Count FROM CallStatsDaily "
+                          "WHERE CallDate >= ?", ("2020-01-01",)).fetchall())
+    assert "CallLog" not in plan
+    assert elapsed < scan_elapsed
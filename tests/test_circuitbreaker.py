@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_circuitbreaker.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import time
+
+from callattendant.screening.circuitbreaker import CircuitBreaker
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("TEST", failure_threshold=2, cooldown=60)
+
+    assert breaker.allow_request()
+    breaker.record_failure(0.5, "Timed out")
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_success(0.1)
+    breaker.record_failure(0.5, "Timed out")
+    assert breaker.state == CircuitBreaker.CLOSED, "failures must be consecutive"
+    breaker.record_failure(0.5, "Timed out")
+    assert breaker.state == CircuitBreaker.OPEN
+
+    assert not breaker.allow_request()
+    status = breaker.status()
+    assert status["skipped"] == 1
+    assert status["failures"] == 3
+    assert status["last_error"] == "Timed out"
+    assert status["retry_at"] is not None
+
+
+def test_half_open_probe():
+    breaker = CircuitBreaker("TEST", failure_threshold=1, cooldown=0.1)
+    breaker.record_failure(0.5, "Timed out")
+    assert not breaker.allow_request()
+
+    time.sleep(0.2)
+
+    # Only a single probe is allowed after the cool-down
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow_request()
+
+    # A failed probe opens the breaker again
+    breaker.record_failure(0.5, "Timed out")
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.2)
+
+    # A successful probe closes the breaker
+    assert breaker.allow_request()
+    breaker.record_success(0.1)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+    assert breaker.allow_request()
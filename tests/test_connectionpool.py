@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_connectionpool.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+import pytest
+
+from callattendant.screening import connectionpool
+from callattendant.screening.connectionpool import ConnectionPool
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # Keep-alive
+
+    def do_GET(self, head=False):
+        body = self.path.encode("utf-8")
+        self.send_response(404 if "missing" in self.path else 200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+        if "drop" in self.path:
+            # Close the connection without telling the client, like an idle timeout
+            self.close_connection = True
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.start()
+    yield "http://127.0.0.1:{}".format(httpd.server_port)
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_connection_reused(server):
+    pool = ConnectionPool(timeout=2)
+
+    for i in range(3):
+        response, body = pool.request("GET", server + "/lookup/{}".format(i))
+        assert response.status == 200
+        assert body == "/lookup/{}".format(i).encode("utf-8")
+
+    response, body = pool.request("GET", server + "/missing?q=1")
+    assert response.status == 404
+    assert body == b"/missing?q=1"
+    assert pool.connections_opened == 1
+
+    pool.close()
+
+
+def test_reconnect_on_failure(server):
+    pool = ConnectionPool(timeout=2)
+
+    response, body = pool.request("GET", server + "/drop")
+    assert response.status == 200
+
+    # The pooled connection was closed by the server; a new one is opened
+    response, body = pool.request("GET", server + "/lookup")
+    assert response.status == 200
+    assert body == b"/lookup"
+    assert pool.connections_opened == 2
+
+    pool.close()
+
+
+def test_warm_up(server):
+    pool = ConnectionPool(timeout=2)
+
+    pool.warm_up(server)
+    assert pool.connections_opened == 1
+    response, body = pool.request("GET", server + "/lookup")
+    assert response.status == 200
+    assert pool.connections_opened == 1
+
+    # A recently used connection is kept; an idle one is replaced
+    pool.warm_up(server)
+    assert pool.connections_opened == 1
+    pool.warm_up(server, max_idle_time=0)
+    assert pool.connections_opened == 2
+    pool.close()
+
+
+def test_idle_connection_expired(server):
+    pool = ConnectionPool(timeout=2, max_idle_time=60)
+    response, body = pool.request("GET", server + "/lookup")
+    response, body = pool.request("GET", server + "/lookup")
+    assert pool.connections_opened == 1
+
+    # A connection idle for longer than max_idle_time is closed, not reused
+    pool.max_idle_time = 0
+    response, body = pool.request("GET", server + "/lookup")
+    assert response.status == 200
+    assert pool.connections_opened == 2
+    pool.close()
+
+
+def test_address_remembered(server, mocker):
+    url = server.replace("127.0.0.1", "localhost")
+    create_connection = mocker.spy(connectionpool.socket, "create_connection")
+    pool = ConnectionPool(timeout=2)
+
+    pool.warm_up(url)
+    response, body = pool.request("GET", url + "/drop")
+    assert response.status == 200
+
+    # The connection that replaces the one closed by the server isn't resolved again
+    response, body = pool.request("GET", url + "/lookup")
+    assert response.status == 200
+    hosts = [call[0][0][0] for call in create_connection.call_args_list]
+    assert hosts == ["localhost", "127.0.0.1"]
+    pool.close()
+
+
+def test_address_expired(server, mocker):
+    url = server.replace("127.0.0.1", "localhost")
+    create_connection = mocker.spy(connectionpool.socket, "create_connection")
+    pool = ConnectionPool(timeout=2, address_ttl=0)
+
+    # The address is resolved again once its TTL has passed
+    pool.warm_up(url)
+    response, body = pool.request("GET", url + "/drop")
+    response, body = pool.request("GET", url + "/lookup")
+    assert response.status == 200
+    hosts = [call[0][0][0] for call in create_connection.call_args_list]
+    assert hosts == ["localhost", "localhost"]
+    pool.close()
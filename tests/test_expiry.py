@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_expiry.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from callattendant.screening.blacklist import Blacklist
+from callattendant.screening import expiry
+from callattendant.screening.expiry import ExpiryReaper, format_expires
+from callattendant.screening.tablechanges import get_change_count, get_changed_keys, get_total_changes, notify_change, \
+    wait_for_change
+from callattendant.screening.whitelist import Whitelist
+
+
+@pytest.fixture
+def config():
+    # Mock the application config, which is a dict-based object
+    config = {}
+    config['DEBUG'] = False
+    config['TESTING'] = False
+    return config
+
+
+@pytest.fixture
+def db_file(tmpdir, config):
+    db_file = os.path.join(str(tmpdir), "test.db")
+    db = sqlite3.connect(db_file)
+    Whitelist(db, config)
+    Blacklist(db, config)
+    db.close()
+    return db_file
+
+
+def test_format_expires():
+    assert format_expires(None) is None
+    assert format_expires(datetime(2020, 10, 12, 6, 0, 0, 500)) == "2020-10-12 06:00:00"
+    expires = datetime.strptime(format_expires(48), '%Y-%m-%d %H:%M:%S')
+    assert timedelta(hours=47) < expires - datetime.now() <= timedelta(hours=48)
+
+
+def test_wait_for_change():
+    since = get_total_changes()
+    assert wait_for_change(since, 0.01) == since
+
+    timer = threading.Timer(0.1, notify_change, ("Whitelist",))
+    timer.start()
+    start = time.time()
+    assert wait_for_change(since, 5) == since + 1
+    assert time.time() - start < 1
+    timer.join()
+
+
+def test_get_changed_keys():
+    since = get_change_count("Whitelist")
+    assert get_changed_keys("Whitelist", since) == []
+    notify_change("Whitelist", "+18055550001")
+    notify_change("Whitelist", "+18055550002")
+    assert get_changed_keys("Whitelist", since) == ["+18055550001", "+18055550002"]
+    assert get_changed_keys("Whitelist", since + 1) == ["+18055550002"]
+
+    # Unknown when a change modified several rows
+    notify_change("Whitelist")
+    assert get_changed_keys("Whitelist", since) is None
+
+
+def test_reap(db_file, config):
+    db = sqlite3.connect(db_file)
+    whitelist = Whitelist(db, config)
+    blacklist = Blacklist(db, config)
+    past = datetime.now() - timedelta(seconds=1)
+    whitelist.add_caller({"NAME": "Expired", "NMBR": "8055550001"}, "Contractor", past)
+    whitelist.add_caller({"NAME": "Pending", "NMBR": "8055550002"}, "Contractor", 1)
+    whitelist.add_caller({"NAME": "Friend", "NMBR": "8055550003"}, "Friend")
+    blacklist.add_caller({"NAME": "Spammer", "NMBR": "8055550004"}, "Spam", past)
+
+    reaper = ExpiryReaper(db_file, config)
+    reaper.load(db)
+    timeout = reaper.reap(db)
+    assert 3500 < timeout <= 3600
+
+    numbers = [row[0] for row in db.execute("SELECT PhoneNo FROM Whitelist UNION ALL SELECT PhoneNo FROM Blacklist")]
+    assert sorted(numbers) == ["8055550002", "8055550003"]
+
+    # An entry renewed after the heap was loaded isn't removed
+    whitelist.set_expires("8055550002", 48)
+    reaper._heap[0] = (format_expires(past), "Whitelist", "8055550002")
+    assert reaper.reap(db) is None
+    assert whitelist.check_number("8055550002") == (True, "Contractor")
+    db.close()
+
+
+def test_load_changed_table(db_file, config):
+    db = sqlite3.connect(db_file)
+    whitelist = Whitelist(db, config)
+    blacklist = Blacklist(db, config)
+    past = datetime.now() - timedelta(seconds=1)
+    whitelist.add_caller({"NAME": "Pending", "NMBR": "8055550001"}, "Contractor", 1)
+    blacklist.add_caller({"NAME": "Spammer", "NMBR": "8055550002"}, "Spam", past)
+
+    # The lists signal their changes via the reaper's tablechanges module
+    reaper = ExpiryReaper(db_file, config)
+    reaper.load(db)
+    assert len(reaper._heap) == 2
+
+    # Only the changed table is reloaded; the other table's entries are kept
+    whitelist.add_caller({"NAME": "Plumber", "NMBR": "8055550003"}, "Contractor", 2)
+    db.execute("DELETE FROM Blacklist")
+    reaper.load(db, ["Whitelist"])
+    assert sorted(entry[2] for entry in reaper._heap) == ["+18055550001", "+18055550002", "+18055550003"]
+    assert reaper._loaded_counts["Whitelist"] == expiry.get_change_count("Whitelist")
+
+    # The reaper's own deletes don't require a reload
+    blacklist.add_caller({"NAME": "Spammer", "NMBR": "8055550002"}, "Spam", past)
+    reaper.load(db, ["Blacklist"])
+    reaper.reap(db)
+    assert reaper._loaded_counts["Blacklist"] == expiry.get_change_count("Blacklist")
+
+    # Unless another change was made meanwhile
+    blacklist.add_caller({"NAME": "Spammer", "NMBR": "8055550002"}, "Spam", past)
+    reaper.load(db, ["Blacklist"])
+    expiry.notify_change("Blacklist")
+    reaper.reap(db)
+    assert reaper._loaded_counts["Blacklist"] == expiry.get_change_count("Blacklist") - 2
+    db.close()
+
+
+def test_reaper_thread(db_file, config):
+    reaper = ExpiryReaper(db_file, config)
+    reaper.start()
+    try:
+        # The reaper is woken by the new entry, then removes it when it expires
+        time.sleep(0.1)
+        db = sqlite3.connect(db_file)
+        whitelist = Whitelist(db, config)
+        whitelist.add_caller({"NAME": "Plumber", "NMBR": "8055550001"}, "Contractor",
+                             datetime.now() + timedelta(seconds=1))
+        deadline = time.time() + 5
+        while time.time() < deadline and whitelist.get_number("8055550001"):
+            time.sleep(0.1)
+        assert not whitelist.get_number("8055550001")
+        db.close()
+    finally:
+        reaper.stop()
+
+
+def test_reaper_thread_retries(db_file, config, mocker):
+    reaper = ExpiryReaper(db_file, config, retry_delay=0.1)
+    reap = reaper.reap
+    calls = []
+
+    def locked_once(db):
+        calls.append(db)
+        if len(calls) == 2:
+            raise sqlite3.OperationalError("database is locked")
+        return reap(db)
+
+    mocker.patch.object(reaper, "reap", side_effect=locked_once)
+    reaper.start()
+    try:
+        # The reaper keeps running after the error and removes the entry
+        time.sleep(0.1)
+        db = sqlite3.connect(db_file)
+        whitelist = Whitelist(db, config)
+        whitelist.add_caller({"NAME": "Plumber", "NMBR": "8055550001"}, "Contractor",
+                             datetime.now() + timedelta(seconds=1))
+        deadline = time.time() + 5
+        while time.time() < deadline and whitelist.get_number("8055550001"):
+            time.sleep(0.1)
+        assert not whitelist.get_number("8055550001")
+        assert len(calls) > 2
+        assert reaper._thread.is_alive()
+        db.close()
+    finally:
+        reaper.stop()
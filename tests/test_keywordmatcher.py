@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_keywordmatcher.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import random
+import re
+import time
+
+from callattendant.screening.keywordmatcher import KeywordMatcher
+
+
+def test_search():
+    matcher = KeywordMatcher([
+        (1, "CARD SERVICES", "Scam"),
+        (2, "wireless caller", "Unknown"),
+        (3, "V###############", "Telemarketer Caller ID"),
+        (4, "SERVICES", "Services"),
+    ])
+    assert len(matcher) == 4
+    assert matcher.search("CARD SERVICES") == "Scam"
+    assert matcher.search("Wireless Caller") == "Unknown"
+    assert matcher.search("V123456789012345") == "Telemarketer Caller ID"
+    assert matcher.search("V12345") is None
+    assert matcher.search("LAWN SERVICES") == "Services"
+    assert matcher.search("JOHN DOE") is None
+    assert matcher.search("") is None
+
+
+def test_overlapping_keywords():
+    matcher = KeywordMatcher([(1, "HE", "he"), (2, "SHE", "she"), (3, "HERS", "hers"), (4, "HIS", "his")])
+    # The first keyword to end wins; the longest of those ending together
+    assert matcher.search("USHERS") == "she"
+    assert matcher.search("AHISHERS") == "his"
+    assert matcher.search("XHERSX") == "he"
+
+
+def test_literal_digits():
+    matcher = KeywordMatcher([(1, "800 #", "Toll free"), (2, "V#5", "Five")])
+    assert matcher.search("CALL 800 1") == "Toll free"
+    assert matcher.search("CALL 900 1") is None
+    assert matcher.search("V15") == "Five"
+    assert matcher.search("V16") is None
+
+
+def test_add_and_remove():
+    matcher = KeywordMatcher()
+    assert matcher.search("CARD SERVICES") is None
+
+    matcher.add(1, "SERVICES", "Services")
+    matcher.add(2, "CARD SERVICES", "Scam")
+    assert matcher.search("CARD SERVICES") == "Scam"
+
+    matcher.remove(2)
+    assert 2 not in matcher
+    assert matcher.search("CARD SERVICES") == "Services"
+
+    # Replacing a keyword
+    matcher.add(1, "CARD", "Card")
+    assert matcher.search("CARD SERVICES") == "Card"
+    assert matcher.search("LAWN SERVICES") is None
+
+    matcher.remove(1)
+    matcher.remove(99)
+    assert len(matcher) == 0
+    assert matcher.search("CARD SERVICES") is None
+
+
+def test_matches_regex_search():
+    random.seed(13)
+    alphabet = "AB1 "
+    keywords = ["".join(random.choice(alphabet + "#") for i in range(random.randint(1, 4))) for i in range(30)]
+    matcher = KeywordMatcher((i, keyword, keyword) for i, keyword in enumerate(keywords))
+    for key in range(0, 30, 3):
+        matcher.remove(key)
+    live = [keyword.strip() for i, keyword in enumerate(keywords) if i % 3 and keyword.strip()]
+    regex = re.compile("|".join(re.escape(k).replace("\\#", "#").replace("#", "[0-9]") for k in live))
+    for i in range(500):
+        text = "".join(random.choice(alphabet + "2") for i in range(12))
+        assert (matcher.search(text) is not None) == (regex.search(text) is not None), text
+
+
+def test_performance():
+    random.seed(1)
+    words = ["".join(random.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for i in range(8)) for i in range(5000)]
+    matcher = KeywordMatcher((i, word, "Keyword") for i, word in enumerate(words))
+    names = ["".join(random.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ ") for i in range(15)) for i in range(10000)]
+
+    start = time.time()
+    for name in names:
+        matcher.search(name)
+    elapsed = time.time() - start
+    print("Searched {} names for {} keywords in {:.3f} seconds".format(len(names), len(words), elapsed))
+    assert elapsed < 5.0
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_lookupcache.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sqlite3
+import time
+
+import pytest
+
+from callattendant.screening.lookupcache import LookupCache
+
+
+spam = {"spam": True, "score": 2, "reason": "Robocaller"}
+not_spam = {"spam": False, "score": 0, "reason": ""}
+
+
+@pytest.fixture
+def db():
+    # Create the test db in RAM
+    return sqlite3.connect(":memory:")
+
+
+@pytest.fixture
+def config():
+    # Mock the application config, which is a dict-based object
+    config = {}
+    config['DEBUG'] = True
+    config['TESTING'] = True
+    config['BLOCK_SERVICE_CACHE_SIZE'] = 2
+    config['BLOCK_SERVICE_CACHE_SPAM_TTL'] = 60
+    config['BLOCK_SERVICE_CACHE_NOT_SPAM_TTL'] = 10
+    return config
+
+
+def test_get_put(db, config):
+    cache = LookupCache(db, config)
+
+    assert cache.get("NOMOROBO", "5551234567") is None
+    assert cache.put("NOMOROBO", "5551234567", spam)
+    assert cache.get("NOMOROBO", "5551234567") == spam
+
+    # Results are cached per service
+    assert cache.get("OTHER", "5551234567") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_any_form_of_number(db, config):
+    cache = LookupCache(db, config)
+    assert cache.put("NOMOROBO", "800-555-1212", spam)
+
+    # The same caller is found in another form, in memory and in the db
+    assert cache.get("NOMOROBO", "18005551212") == spam
+    cache = LookupCache(db, config)
+    assert cache.get("NOMOROBO", "+1 (800) 555-1212") == spam
+    assert cache.stats()["db_hits"] == 1
+
+
+def test_persisted(db, config):
+    cache = LookupCache(db, config)
+    assert cache.put("NOMOROBO", "5551234567", not_spam)
+
+    # A new cache (e.g., after a restart) reads the results from the db
+    cache = LookupCache(db, config)
+    assert cache.get("NOMOROBO", "5551234567") == not_spam
+    assert cache.get("NOMOROBO", "5551234567") == not_spam
+
+    stats = cache.stats()
+    assert stats["db_hits"] == 1
+    assert stats["memory_hits"] == 1
+
+
+def test_ttl(db, config, mocker):
+    cache = LookupCache(db, config)
+    now = time.time()
+    assert cache.put("NOMOROBO", "1111111111", spam)
+    assert cache.put("NOMOROBO", "2222222222", not_spam)
+
+    # The not-spam result expires first
+    mocker.patch("time.time", return_value=now + 30)
+    assert cache.get("NOMOROBO", "1111111111") == spam
+    assert cache.get("NOMOROBO", "2222222222") is None
+
+    mocker.patch("time.time", return_value=now + 90)
+    assert cache.get("NOMOROBO", "1111111111") is None
+
+
+def test_ttl_disabled(db, config):
+    config['BLOCK_SERVICE_CACHE_NOT_SPAM_TTL'] = 0
+    cache = LookupCache(db, config)
+
+    assert not cache.put("NOMOROBO", "5551234567", not_spam)
+    assert cache.get("NOMOROBO", "5551234567") is None
+
+
+def test_lru_eviction(db, config):
+    cache = LookupCache(db, config)
+    cache.put("NOMOROBO", "1111111111", spam)
+    cache.put("NOMOROBO", "2222222222", spam)
+    cache.get("NOMOROBO", "1111111111")
+    cache.put("NOMOROBO", "3333333333", spam)
+
+    # The least recently used entry was evicted from memory, but not from the db
+    assert cache.stats()["memory_size"] == 2
+    assert cache.get("NOMOROBO", "2222222222") == spam
+    assert cache.stats()["db_hits"] == 1
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_migrations.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+import pytest
+
+from callattendant import migrations
+from callattendant.migrations import SCHEMA_VERSION, MIGRATIONS, backfill, get_columns, get_version, migrate
+from callattendant.screening.calllogger import BLOCKED, PERMITTED, SCREENED, list_join
+from callattendant.screening.whitelist import Whitelist
+
+
+# Read in SQL for a database created by an earlier version
+with open(os.path.join(os.path.dirname(__file__), "callattendant.db.sql"), "rb") as f:
+    _data_sql = f.read().decode("utf8")
+
+
+def test_migrate_new_database():
+    db = sqlite3.connect(":memory:")
+    assert get_version(db) == 0
+
+    assert migrate(db, {}) == SCHEMA_VERSION
+    assert get_version(db) == SCHEMA_VERSION
+    tables = [row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+    for table in ("CallLog", "Whitelist", "Blacklist", "Message", "BlockedRange", "NameRules",
+                  "LookupCache", "ScreeningTrace", "CallStatsDaily"):
+        assert table in tables
+    assert "Expires" in get_columns(db, "Whitelist")
+    assert "NormalizedNo" in get_columns(db, "CallLog")
+
+    # Once current, nothing is changed
+    changes = db.total_changes
+    assert migrate(db, {}) == SCHEMA_VERSION
+    assert db.total_changes == changes
+
+
+def test_migrate_unversioned_database():
+    db = sqlite3.connect(":memory:")
+    db.executescript(_data_sql)
+    calls = db.execute("SELECT COUNT(*) FROM CallLog").fetchone()[0]
+
+    migrate(db, {})
+
+    assert get_version(db) == SCHEMA_VERSION
+    assert db.execute("SELECT COUNT(*) FROM CallLog").fetchone()[0] == calls
+    assert db.execute("SELECT COUNT(*) FROM CallLog WHERE NormalizedNo IS NULL").fetchone()[0] == 0
+    assert db.execute("SELECT NormalizedNo FROM Whitelist WHERE PhoneNo='8055551081'").fetchone() == \
+        ("+18055551081",)
+    plan = db.execute("EXPLAIN QUERY PLAN SELECT * FROM Whitelist WHERE NormalizedNo=?",
+                      ("+18055551081",)).fetchall()
+    assert "idx_Whitelist_NormalizedNo" in str(plan)
+
+    # The call log's formatted columns are converted
+    call_time = int(time.mktime(datetime(2018, 10, 13, 12, 13, 11).timetuple()))
+    assert db.execute("SELECT Name, Number, NormalizedNo, Action, CallTime FROM CallLog WHERE CallLogID=1").fetchone() == \
+        ("Bruce", "8055551080", 18055551080, PERMITTED, call_time)
+
+
+def test_migrate_legacy_call_log():
+    # Early versions didn't have the Action or Reason columns
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE CallLog (CallLogID INTEGER PRIMARY KEY AUTOINCREMENT, Name TEXT, "
+               "Number TEXT, Date TEXT, Time TEXT, SystemDateTime TEXT)")
+    db.execute("CREATE TABLE Whitelist (PhoneNo TEXT PRIMARY KEY, Name TEXT, Reason TEXT, SystemDateTime TEXT)")
+    db.execute("INSERT INTO CallLog(Name, Number) VALUES('Bruce', '8055551234')")
+    db.execute("INSERT INTO CallLog(Name, Number) VALUES('Spam', '8005551212')")
+    db.execute("INSERT INTO Whitelist VALUES('(805) 555-1234', 'Bruce', 'Family', '')")
+    db.commit()
+
+    migrate(db, {})
+
+    rows = db.execute("SELECT Action, Reason FROM CallLog ORDER BY CallLogID").fetchall()
+    assert rows == [(PERMITTED, "Family"), (SCREENED, None)]
+
+
+def test_failed_step_is_rolled_back(monkeypatch):
+    db = sqlite3.connect(":memory:")
+
+    def broken(db, config):
+        """Break the database."""
+        db.execute("CREATE TABLE Broken (ID INTEGER)")
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", [MIGRATIONS[0], broken] + MIGRATIONS[2:])
+    with pytest.raises(sqlite3.OperationalError):
+        migrate(db, {})
+    assert get_version(db) == 1
+    assert db.execute("SELECT name FROM sqlite_master WHERE name='Broken'").fetchone() is None
+
+    monkeypatch.undo()
+    assert migrate(db, {}) == SCHEMA_VERSION
+
+
+def test_concurrent_migration(monkeypatch, tmp_path):
+    db_file = str(tmp_path / "test.db")
+    db = sqlite3.connect(db_file)
+    db.executescript(_data_sql)
+    other = sqlite3.connect(db_file)
+    monkeypatch.setattr(migrations, "BACKFILL_BATCH_SIZE", 2)
+
+    # Another connection finishes the migration while the first is between batches
+    original = migrations.backfill
+    overtaken = []
+
+    def backfill(db, table, column, source, convert, batch_size=2):
+        count = original(db, table, column, source, convert, batch_size)
+        if db is not other and not overtaken:
+            overtaken.append(migrate(other, {}))
+        return count
+
+    monkeypatch.setattr(migrations, "backfill", backfill)
+    assert migrate(db, {}) == SCHEMA_VERSION
+    assert overtaken == [SCHEMA_VERSION]
+    assert "CallTime" in get_columns(db, "CallLog")
+    expected = sqlite3.connect(":memory:")
+    expected.executescript(_data_sql)
+    migrate(expected, {})
+    sql = "SELECT * FROM CallLog ORDER BY CallLogID"
+    assert db.execute(sql).fetchall() == expected.execute(sql).fetchall()
+
+    # A rebuild of the call log that was overtaken returns without changing it
+    changes = db.total_changes
+    migrations._compact_call_log(db, {})
+    db.commit()
+    assert db.total_changes == changes
+
+
+def test_backfill_in_batches():
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE T (Number TEXT, Normalized TEXT)")
+    db.executemany("INSERT INTO T(Number) VALUES(?)", [(str(i),) for i in range(25)])
+    db.execute("UPDATE T SET Normalized='done' WHERE Number='3'")
+    db.commit()
+
+    commits = []
+    db.set_trace_callback(lambda sql: commits.append(sql) if sql == "COMMIT" else None)
+    assert backfill(db, "T", "Normalized", "Number", lambda number: "#" + number, batch_size=10) == 24
+    assert len(commits) == 3
+    assert db.execute("SELECT Normalized FROM T WHERE Number='3'").fetchone() == ("done",)
+    assert db.execute("SELECT Normalized FROM T WHERE Number='24'").fetchone() == ("#24",)
+
+
+def test_backfill_doesnt_lock_out_writers(tmp_path):
+    # Other connections can write between the batches of a large backfill
+    db_file = str(tmp_path / "test.db")
+    db = sqlite3.connect(db_file)
+    db.execute("CREATE TABLE T (Number TEXT, Normalized TEXT)")
+    db.executemany("INSERT INTO T(Number) VALUES(?)", [(str(i),) for i in range(100000)])
+    db.commit()
+
+    other = sqlite3.connect(db_file, timeout=0)
+    writes = []
+
+    def convert(number):
+        if number.endswith("0000"):
+            other.execute("INSERT INTO T(Number, Normalized) VALUES('x', 'x')")
+            other.commit()
+            writes.append(number)
+        return "+" + number
+
+    backfill(db, "T", "Normalized", "Number", convert)
+    assert len(writes) == 9
+    assert db.execute("SELECT COUNT(*) FROM T WHERE Normalized IS NULL").fetchone()[0] == 0
+
+
+def test_list_startup_reads_version_only():
+    db = sqlite3.connect(":memory:")
+    config = {"DEBUG": False, "TESTING": False}
+    Whitelist(db, config)
+
+    statements = []
+    db.set_trace_callback(statements.append)
+    Whitelist(db, config)
+    assert statements == ["PRAGMA user_version"]
+
+
+def query_plan(db, sql, args=()):
+    return " ".join(row[-1] for row in db.execute("EXPLAIN QUERY PLAN " + sql, args))
+
+
+def test_indexed_query_plans():
+    db = sqlite3.connect(":memory:")
+    migrate(db, {})
+
+    # The web app's dashboard, calls and messages queries
+    plan = query_plan(db, """SELECT date(CallTime, 'unixepoch', 'localtime') CallDate, Action, COUNT(*) Count
+        FROM CallLog WHERE CallTime >= ? GROUP BY CallDate, Action""", (1577836800,))
+    assert "SEARCH CallLog USING COVERING INDEX idx_CallLog_CallTime (CallTime>?)" in plan
+
+    plan = query_plan(db, "SELECT COUNT(*) FROM CallLog WHERE Action = ?", (BLOCKED,))
+    assert "USING COVERING INDEX idx_CallLog_Action (Action=?)" in plan
+
+    plan = query_plan(db, """SELECT COUNT(Number), Number, Name FROM CallLog WHERE Action = ?
+        GROUP BY Number ORDER BY COUNT(Number) DESC LIMIT 10""", (BLOCKED,))
+    assert "USING COVERING INDEX idx_CallLog_Action (Action=?)" in plan
+    assert "GROUP BY" not in plan
+
+    plan = query_plan(db, """SELECT a.CallLogID, b.Name, c.Name, d.MessageID FROM CallLog as a
+        LEFT JOIN Whitelist AS b ON a.Number = b.PhoneNo
+        LEFT JOIN Blacklist AS c ON a.Number = c.PhoneNo
+        LEFT JOIN Message AS d ON a.CallLogID = d.CallLogID
+        ORDER BY a.CallTime DESC LIMIT 10""")
+    assert "SCAN a USING INDEX idx_CallLog_CallTime" in plan
+    assert "idx_Message_CallLogID (CallLogID=?)" in plan
+    assert "TEMP B-TREE" not in plan
+
+    plan = query_plan(db, "SELECT COUNT(*) FROM Message WHERE Played = 0")
+    assert "USING COVERING INDEX idx_Message_Played (Played=?)" in plan
+
+    plan = query_plan(db, "SELECT * FROM Message ORDER BY DateTime DESC LIMIT 10")
+    assert "USING INDEX idx_Message_DateTime" in plan
+
+    for table in ("Whitelist", "Blacklist"):
+        plan = query_plan(db, "SELECT * FROM {} ORDER BY SystemDateTime DESC LIMIT 0, 20".format(table))
+        assert "USING INDEX idx_{}_SystemDateTime".format(table) in plan
+
+
+def test_compact_call_log(monkeypatch, tmp_path):
+    # Create a call log in the formatted text schema of version 6
+    db_file = str(tmp_path / "test.db")
+    db = sqlite3.connect(db_file)
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS[:6])
+    monkeypatch.setattr(migrations, "SCHEMA_VERSION", 6)
+    migrate(db, {})
+    monkeypatch.undo()
+
+    start = time.mktime(datetime(2020, 1, 1).timetuple())
+    rows = []
+    for i in range(200000):
+        date_time = datetime.fromtimestamp(start + i * 600)
+        number = "80055{:05d}".format(i % 5000) if i % 100 else "P"
+        rows.append((i + 1, "CALLER{}".format(i % 1000), number, ("Permitted", "Blocked", "Screened")[i % 3], "",
+                     date_time.strftime("%d-%b"), date_time.strftime("%I:%M %p"),
+                     date_time.strftime("%Y-%m-%d %H:%M:%S"), "+1" + number if i % 100 else "P"))
+    db.executemany("""INSERT INTO CallLog(CallLogID, Name, Number, Action, Reason, Date, Time,
+        SystemDateTime, NormalizedNo) VALUES(?,?,?,?,?,?,?,?,?)""", rows)
+    # The IDs of the deleted calls aren't reused
+    db.execute("DELETE FROM CallLog WHERE CallLogID > 199990")
+    db.commit()
+
+    def file_size():
+        db.commit()
+        db.execute("VACUUM")
+        return os.path.getsize(db_file)
+
+    def range_query(sql, since):
+        start = time.perf_counter()
+        for i in range(20):
+            count = db.execute(sql, (since,)).fetchone()[0]
+        return count, time.perf_counter() - start
+
+    text_size = file_size()
+    text_count, text_elapsed = range_query("""SELECT COUNT(*) FROM CallLog
+        WHERE SystemDateTime >= ? AND Action = 'Blocked'""", "2022-01-01")
+
+    migrate(db, {})
+
+    assert get_version(db) == SCHEMA_VERSION
+    assert get_columns(db, "CallLog") == ["CallLogID", "Name", "Number", "NormalizedNo", "Action", "Reason",
+                                          "CallTime"]
+    assert db.execute("SELECT name FROM sqlite_master WHERE name='CallLog_new'").fetchone() is None
+    assert db.execute("SELECT COUNT(*) FROM CallLog").fetchone()[0] == 199990
+    assert db.execute("SELECT Number, NormalizedNo, Action, CallTime FROM CallLog WHERE CallLogID=2").fetchone() == \
+        ("8005500001", 18005500001, BLOCKED, int(start) + 600)
+    assert db.execute("SELECT Number, NormalizedNo FROM CallLog WHERE CallLogID=1").fetchone() == ("P", "P")
+    db.execute("INSERT INTO CallLog(Name) VALUES('NEXT')")
+    assert db.execute("SELECT MAX(CallLogID) FROM CallLog").fetchone()[0] == 200001
+
+    compact_size = file_size()
+    since = int(time.mktime(datetime(2022, 1, 1).timetuple()))
+    compact_count, compact_elapsed = range_query("""SELECT COUNT(*) FROM CallLog
+        WHERE CallTime >= ? AND Action = {}""".format(BLOCKED), since)
+    assert compact_count == text_count
+
+    print("CallLog of 200,000 calls: {:,} bytes as text, {:,} bytes compact; "
+          "range query {:.3f} sec as text, {:.3f} sec compact".format(
+              text_size, compact_size, text_elapsed, compact_elapsed))
+    assert compact_size < text_size * 0.7
+
+
+def test_unique_list_numbers(monkeypatch):
+    db = sqlite3.connect(":memory:")
+    monkeypatch.setattr(migrations, "MIGRATIONS", MIGRATIONS[:8])
+    monkeypatch.setattr(migrations, "SCHEMA_VERSION", 8)
+    migrate(db, {})
+    monkeypatch.undo()
+    db.executemany("INSERT INTO Whitelist(PhoneNo, Name, NormalizedNo) VALUES(?,?,?)", [
+        ("1-805-555-1234", "Old", "+18055551234"), ("8055551234", "New", "+18055551234"), ("P", "Private", "P")])
+    db.executemany("INSERT INTO CallLog(Number, NormalizedNo) VALUES(?,?)", [("18055551234", 18055551234), ("P", "P")])
+    db.commit()
+
+    migrate(db, {})
+
+    assert db.execute("SELECT Name FROM Whitelist ORDER BY Name").fetchall() == [("New",), ("Private",)]
+    with pytest.raises(sqlite3.IntegrityError):
+        db.execute("INSERT INTO Whitelist(PhoneNo, NormalizedNo) VALUES('+1 805 555 1234', '+18055551234')")
+
+    # The call log is joined with the lists on the normalized numbers, via the index
+    sql = "SELECT a.Number, b.Name FROM CallLog AS a {} ORDER BY a.CallLogID".format(list_join("Whitelist", "b"))
+    assert db.execute(sql).fetchall() == [("18055551234", "New"), ("P", "Private")]
+    assert "USING INDEX idx_Whitelist_CallLogNo" in query_plan(db, sql)
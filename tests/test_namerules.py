@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_namerules.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sqlite3
+
+import pytest
+
+from callattendant.screening.namerules import NameRules
+
+
+@pytest.fixture
+def namerules():
+
+    # Create the test db in RAM
+    db = sqlite3.connect(":memory:")
+
+    # Mock the application config, which is a dict-based object
+    config = {}
+    config['DEBUG'] = True
+    config['TESTING'] = True
+
+    # Create the name rules to be tested
+    namerules = NameRules(db, config)
+
+    return namerules
+
+
+def test_add_rule(namerules):
+    assert namerules.add_rule("card services", "Scam")
+    assert namerules.get_rules() == [(1, "CARD SERVICES", "Scam")]
+
+    assert not namerules.add_rule("  ", "Blank")
+    assert len(namerules.get_rules()) == 1
+
+
+def test_check_name(namerules):
+    namerules.add_rule("CARD SERVICES", "Scam")
+    namerules.add_rule("V###############", "Telemarketer Caller ID")
+
+    assert namerules.check_name("CARD SERVICES INC") == (True, "Scam")
+    assert namerules.check_name("V123456789012345") == (True, "Telemarketer Caller ID")
+    assert namerules.check_name("JOHN DOE") == (False, "")
+
+
+def test_rules_changed(namerules):
+    namerules.add_rule("CARD SERVICES", "Scam")
+    assert namerules.check_name("WIRELESS CALLER") == (False, "")
+
+    # Changes made through another instance, e.g., the web app, are applied
+    other = NameRules(namerules.db, namerules.config)
+    other.add_rule("WIRELESS CALLER", "Unknown")
+    assert namerules.check_name("WIRELESS CALLER") == (True, "Unknown")
+
+    rule_id = other.get_rules()[0][0]
+    assert other.update_rule(rule_id, "CARD", "Card")
+    assert namerules.check_name("CARD SERVICES") == (True, "Card")
+
+    assert other.remove_rule(rule_id)
+    assert namerules.check_name("CARD SERVICES") == (False, "")
+    assert namerules.check_name("WIRELESS CALLER") == (True, "Unknown")
+
+
+def test_refresh_reads_only_the_changed_rules(namerules):
+    namerules.add_rule("CARD SERVICES", "Scam")
+    assert namerules.check_name("CARD SERVICES") == (True, "Scam")
+
+    # The automaton is updated with the changed rows, not rebuilt from the table
+    namerules.get_rules = lambda: pytest.fail("The whole table was reloaded")
+    other = NameRules(namerules.db, namerules.config)
+    other.add_rule("WIRELESS CALLER", "Unknown")
+    rule_id = other.get_rules()[1][0]
+    assert namerules.check_name("WIRELESS CALLER") == (True, "Unknown")
+    assert other.update_rule(rule_id, "WIRELESS", "Wireless")
+    assert namerules.check_name("WIRELESS CALLER") == (True, "Wireless")
+    assert other.remove_rule(rule_id)
+    assert namerules.check_name("WIRELESS CALLER") == (False, "")
+    assert namerules.check_name("CARD SERVICES") == (True, "Scam")
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_neighborspoof.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sqlite3
+
+import pytest
+
+from callattendant.screening.calllogger import CallLogger
+from callattendant.screening.neighborspoof import NeighborSpoofDetector, split_number
+from callattendant.screening.whitelist import Whitelist
+
+
+@pytest.fixture
+def db():
+    # Create the test db in RAM
+    db = sqlite3.connect(":memory:")
+    config = {"DEBUG": False, "TESTING": False}
+    logger = CallLogger(db, config)
+    whitelist = Whitelist(db, config)
+    logger.log_caller({"NAME": "PLUMBER", "NMBR": "8055559876", "DATE": "1012", "TIME": "0600"}, "Screened", "")
+    logger.log_caller({"NAME": "MOM", "NMBR": "8054441234", "DATE": "1012", "TIME": "0600"}, "Permitted", "")
+    whitelist.add_caller({"NAME": "NEIGHBOR", "NMBR": "8053331234"}, "Neighbor")
+    return db
+
+
+@pytest.fixture
+def detector(db):
+    config = {
+        "DEBUG": False,
+        "TESTING": False,
+        "BLOCK_NEIGHBOR_HOME_NUMBER": "8055551234",
+        "BLOCK_NEIGHBOR_THRESHOLD": 4,
+    }
+    return NeighborSpoofDetector(db, config)
+
+
+def test_split_number():
+    assert split_number("8055551234") == ("805", "555")
+    assert split_number("18055551234") == ("805", "555")
+    assert split_number("5551234") is None
+    assert split_number("P") is None
+    assert split_number(None) is None
+
+
+def test_score(detector):
+    # Same exchange, never called, never permitted
+    assert detector.score("8055550000") == 4
+    # Same exchange, called before
+    assert detector.score("8055559876") == 3
+    # Same area code, exchange with a permitted caller
+    assert detector.score("8054440000") == 2
+    # Different area code
+    assert detector.score("2125550000") == 0
+
+
+def test_check_number(detector):
+    assert detector.check_number("8055550000") == (True, "Neighbor spoofing with score 4")
+    # The call was recorded
+    assert detector.check_number("8055550000") == (False, "")
+    assert detector.check_number("2125550000") == (False, "")
+
+
+def test_whitelist_changed(db, detector):
+    whitelist = Whitelist(db, detector.config)
+    whitelist.add_caller({"NAME": "FRIEND", "NMBR": "8055550000"}, "Friend")
+    # Same exchange, but permitted, in an exchange with a permitted caller
+    assert detector.score("8055550000") == 2
+    assert detector.score("8055551111") == 3
+
+    # A removed or expiring number is no longer trusted
+    whitelist.remove_number("805-555-0000")
+    assert detector.score("8055550000") == 4
+    assert detector.score("18053331234") == 1
+    whitelist.set_expires("8053331234", 1)
+    assert detector.score("8053331234") == 3
+    # Unless it was permitted in the call log
+    whitelist.add_caller({"NAME": "MOM", "NMBR": "8054441234"}, "Family")
+    whitelist.remove_number("8054441234")
+    assert detector.score("8054441234") == 0
+
+
+def test_whitelist_changes_dont_read_call_log(db, detector):
+    statements = []
+    db.set_trace_callback(statements.append)
+    Whitelist(db, detector.config).add_caller({"NAME": "FRIEND", "NMBR": "8055550000"}, "Friend")
+    assert detector.score("8055550000") == 2
+    assert not [sql for sql in statements if "CallLog" in sql]
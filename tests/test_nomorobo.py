@@ -23,12 +23,64 @@
 #  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 #  SOFTWARE.
 
+import glob
+import os
+import threading
+import time
+import tracemalloc
+from http.server import HTTPServer, BaseHTTPRequestHandler
 from pprint import pprint
 
 import pytest
 
 from callattendant.app import make_config
-from callattendant.screening.nomorobo import NomoroboService
+from callattendant.screening.nomorobo import NomoroboService, ProfileParser
+
+
+def read_page(filename):
+    with open(os.path.join(os.path.dirname(__file__), "pages", filename), "rb") as f:
+        return f.read()
+
+
+class LookupHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # Keep-alive
+    user_agents = []
+
+    def do_GET(self):
+        self.user_agents.append(self.headers.get("User-Agent"))
+        if self.path == "/lookup/800-555-1212":
+            # A moved page
+            self.send_response(301)
+            self.send_header("Location", "/lookup/562-286-2616")
+            body = b""
+        elif self.path == "/lookup/562-286-2616":
+            self.send_response(200)
+            body = read_page("nomorobo_spam.html")
+        else:
+            self.send_response(404)
+            body = read_page("nomorobo_not_found.html")
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(("127.0.0.1", 0), LookupHandler)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.start()
+    yield "http://127.0.0.1:{}".format(httpd.server_port)
+    httpd.shutdown()
+    httpd.server_close()
 
 
 def test_lookup():
@@ -40,3 +92,104 @@ def test_lookup():
     result = nomorobo.lookup_number("1234567890")
     pprint(result)
     assert not result.get("spam")
+
+
+def test_parse_lookup_page(mocker):
+    nomorobo = NomoroboService()
+
+    mocker.patch.object(nomorobo, "http_get", return_value=(200, read_page("nomorobo_spam.html")))
+    result = nomorobo.lookup_number("5622862616")
+    assert result == {"spam": True, "score": 2, "reason": "Robocall - Auto Warranty"}
+
+    mocker.patch.object(nomorobo, "http_get", return_value=(404, read_page("nomorobo_not_found.html")))
+    result = nomorobo.lookup_number("1234567890")
+    assert result == {"spam": False, "score": 0, "reason": ""}
+
+
+def test_keep_alive_lookup(server):
+    nomorobo = NomoroboService(timeout=2, base_url=server)
+    nomorobo.warm_up()
+
+    result = nomorobo.lookup_number("5622862616")
+    assert result["spam"]
+    result = nomorobo.lookup_number("1234567890")
+    assert not result["spam"]
+
+    # The warm-up connection was used for both lookups
+    assert nomorobo._pool.connections_opened == 1
+    nomorobo.close()
+
+
+def test_redirected_lookup(server):
+    nomorobo = NomoroboService(timeout=2, base_url=server)
+    del LookupHandler.user_agents[:]
+
+    result = nomorobo.lookup_number("8005551212")
+    assert result == {"spam": True, "score": 2, "reason": "Robocall - Auto Warranty"}
+    assert len(LookupHandler.user_agents) == 2
+    assert all(agent.startswith("Python-urllib/") for agent in LookupHandler.user_agents)
+    nomorobo.close()
+
+
+def test_profile_parser_stops_early():
+    content = read_page("nomorobo_spam.html")
+    parser = ProfileParser()
+    profile = parser.parse(content, chunk_size=1024)
+    assert "DO NOT ANSWER" in profile["profile-position"]
+    assert profile["profile-title"].strip() == "Robocall - Auto Warranty"
+    # The rest of the page was never fed to the parser
+    assert parser.getpos()[0] < content[:content.index(b"<footer")].count(b"\n")
+
+
+def benchmark(parse, content, iterations=20):
+    """Returns the result, the mean seconds and the tracemalloc peak bytes of parsing the page"""
+    start = time.perf_counter()
+    for i in range(iterations):
+        result = parse(content)
+    elapsed = (time.perf_counter() - start) / iterations
+    tracemalloc.start()
+    parse(content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def parse_profile(content):
+    profile = ProfileParser().parse(content)
+    return tuple(" ".join(profile[field].split()) if field in profile else None
+                 for field in ProfileParser.FIELDS)
+
+
+def saved_pages():
+    pages = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "pages", "nomorobo_*.html")))
+    assert pages
+    return [(os.path.basename(page), read_page(os.path.basename(page))) for page in pages]
+
+
+def test_profile_parser_benchmark():
+    for name, content in saved_pages():
+        result, elapsed, peak = benchmark(parse_profile, content)
+        print("{} ({:,} bytes): ProfileParser {:.2f} ms, {:.0f} KiB peak".format(
+            name, len(content), elapsed * 1000, peak / 1024))
+        # The page is decoded once, but no DOM is built
+        assert peak < 4 * len(content)
+        if "spam" in name:
+            assert result[1] == "Robocall - Auto Warranty"
+
+
+def test_profile_parser_vs_beautifulsoup():
+    bs4 = pytest.importorskip("bs4")
+
+    def parse_soup(content):
+        soup = bs4.BeautifulSoup(content, "html.parser")
+        return tuple(" ".join(element.get_text().split()) if element else None
+                     for element in (soup.find(class_=field) for field in ProfileParser.FIELDS))
+
+    for name, content in saved_pages():
+        result, elapsed, peak = benchmark(parse_profile, content)
+        soup_result, soup_elapsed, soup_peak = benchmark(parse_soup, content)
+        print("{} ({:,} bytes): ProfileParser {:.2f} ms, {:.0f} KiB peak; "
+              "BeautifulSoup {:.2f} ms, {:.0f} KiB peak".format(
+                  name, len(content), elapsed * 1000, peak / 1024, soup_elapsed * 1000, soup_peak / 1024))
+        assert result == soup_result
+        assert peak < soup_peak
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_normalize.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import time
+
+from callattendant.screening.normalize import canonical_number, national_number
+
+
+def test_canonical_number():
+    for number in ("8055551234", "18055551234", "805-555-1234", "+1 (805) 555-1234"):
+        assert canonical_number(number) == "+18055551234"
+    assert canonical_number("011442079460000") == "+442079460000"
+
+
+def test_canonical_number_other_country():
+    assert canonical_number("020 7946 0000", "44") == "+442079460000"
+    assert canonical_number("442079460000", "44") == "+442079460000"
+    assert canonical_number("00 1 805 555 1234", "44") == "+18055551234"
+    assert canonical_number("+1 805 555 1234", "44") == "+18055551234"
+
+
+def test_canonical_number_without_digits():
+    assert canonical_number(None) is None
+    assert canonical_number("P") == "P"
+    assert canonical_number("o") == "O"
+    assert canonical_number("1234") == "1234"
+
+
+def test_national_number():
+    for number in ("8005551212", "18005551212", "+1 (800) 555-1212"):
+        assert national_number(number) == "8005551212"
+    assert national_number("+44 20 7946 0000", "44") == "2079460000"
+    assert national_number("011442079460000") == "+442079460000"
+    assert national_number("5551212") == "5551212"
+    assert national_number("P") == "P"
+
+
+def test_canonical_number_is_memoized():
+    canonical_number.cache_clear()
+    numbers = ["805555{:04d}".format(i % 100) for i in range(100000)]
+
+    start = time.perf_counter()
+    for number in numbers:
+        canonical_number(number)
+    elapsed = time.perf_counter() - start
+
+    info = canonical_number.cache_info()
+    assert info.misses == 100
+    assert info.hits == len(numbers) - 100
+    print("Normalized {} numbers in {:.3f} sec".format(len(numbers), elapsed))
+    assert elapsed < 1.0
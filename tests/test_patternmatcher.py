@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_patternmatcher.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import re
+
+import pytest
+
+from callattendant.screening.patternmatcher import PatternMatcher
+
+
+patterns = {
+    "V[0-9]{15}": "Telemarketer Caller ID",
+    "^P$": "Private number",
+    "(800|888)[0-9]{7}": "Toll free",
+    "(?i)doe": "Doe family",
+    "(.)\\1{4}": "Repeated digits",
+    "WIRELESS": "Wireless caller",
+    "Q(z)": "First group",
+    "^(x)?(?(1)a|b)$": "Conditional group",
+}
+
+
+def search_each(text):
+    # The reference implementation: test each pattern in turn
+    for pattern, reason in patterns.items():
+        if re.search(pattern, text):
+            return reason
+    return None
+
+
+@pytest.mark.parametrize("text", [
+    "V123456789012345",
+    "P",
+    "PRIVATE",
+    "18005551234",
+    "JOHN DOE",
+    "5555512345",
+    "WIRELESS CALLER V123456789012345",
+    "CALLER",
+    "xa",
+    "xb",
+    "",
+])
+def test_search_matches_re_search(text):
+    matcher = PatternMatcher(patterns)
+    assert matcher.search(text) == search_each(text)
+
+
+def test_first_pattern_wins():
+    # The earlier pattern wins even though the later one matches earlier in the text
+    matcher = PatternMatcher({"XYZ": "first", "ABC": "second"})
+    assert matcher.search("ABC XYZ") == "first"
+
+
+def test_empty_patterns():
+    matcher = PatternMatcher({})
+    assert len(matcher) == 0
+    assert matcher.search("ANYTHING") is None
+
+
+def test_many_patterns():
+    many = {"^{:04d}".format(n): "Prefix {}".format(n) for n in range(500)}
+    matcher = PatternMatcher(many)
+    assert len(matcher) == 500
+    assert matcher.search("04995551234") == "Prefix 499"
+    assert matcher.search("9995551234") is None
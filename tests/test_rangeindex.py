@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_rangeindex.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import random
+import time
+
+from callattendant.screening.rangeindex import RangeIndex
+
+
+def test_search():
+    index = RangeIndex([
+        ("800", "800", "Toll free"),
+        ("888", "888", "Toll free"),
+        ("212555", "212559", "Exchanges"),
+        ("3105", "3105", "Prefix"),
+    ])
+    assert len(index) == 4
+
+    assert index.search("8005551212") == "Toll free"
+    assert index.search("8885551212") == "Toll free"
+    assert index.search("2125550000") == "Exchanges"
+    assert index.search("2125599999") == "Exchanges"
+    assert index.search("3105241189") == "Prefix"
+
+    assert index.search("2125540000") is None
+    assert index.search("2125600000") is None
+    assert index.search("8015551212") is None
+    assert index.search("21") is None
+    assert index.search("P") is None
+
+
+def test_overlapping_ranges():
+    index = RangeIndex([
+        ("200", "300", "Wide"),
+        ("250", "350", "Overlap"),
+        ("400", "500", None),
+    ])
+    assert index.search("2001234567") == "Wide"
+    assert index.search("3201234567") == "Overlap"
+    assert index.search("3501234567") == "Overlap"
+    assert index.search("3511234567") is None
+    assert index.search("4501234567") == "", "a null reason is still a match"
+
+
+def test_nested_ranges():
+    index = RangeIndex([
+        ("212000", "212999", "Area block"),
+        ("212555", "212555", "Known scammer"),
+        ("212550", "212559", "Exchanges"),
+        ("212", "212", "Area code"),
+        ("012", "019", "Leading zero"),
+    ])
+    # The most specific range wins, whatever the order they were given in
+    assert index.search("2125551212") == "Known scammer"
+    assert index.search("2125541212") == "Exchanges"
+    assert index.search("2125561212") == "Exchanges"
+    assert index.search("2125491212") == "Area block"
+    assert index.search("2125601212") == "Area block"
+    assert index.search("2120001212") == "Area block"
+    assert index.search("2129991212") == "Area block"
+    assert index.search("0155551212") == "Leading zero"
+
+
+def test_search_performance():
+    # Many disjoint NPA-NXX ranges
+    random.seed(1)
+    starts = random.sample(range(200000, 999990, 10), 50000)
+    index = RangeIndex([(str(s), str(s + 4), "Range") for s in starts])
+
+    start = time.perf_counter()
+    for i in range(10000):
+        index.search("{}1234".format(random.randrange(200000, 999999)))
+    elapsed = time.perf_counter() - start
+    print("{} ranges: {:.1f} usec per search".format(len(index), elapsed * 100))
+    assert elapsed < 1.0
+
+    assert index.search(str(starts[0] + 4) + "1234") == "Range"
+    assert index.search(str(starts[0] + 5) + "1234") in (None, "Range")
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_reputation.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import json
+import os
+import tempfile
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from callattendant.config import Config
+from callattendant.screening.reputation import ReputationService, SpamListService, HttpReputationService, \
+    create_services, merge_results
+
+
+spam = {"spam": True, "score": 2, "reason": "Robocaller"}
+nuisance = {"spam": False, "score": 1, "reason": "Political"}
+not_spam = {"spam": False, "score": 0, "reason": ""}
+
+
+class LookupHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        number = self.path.rsplit("/", 1)[-1]
+        body = json.dumps(spam if number == "8005551212" else not_spam).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(("127.0.0.1", 0), LookupHandler)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_reputation_service_is_abstract():
+    with pytest.raises(TypeError):
+        ReputationService()
+
+
+def test_spam_list():
+    fd, path = tempfile.mkstemp()
+    with os.fdopen(fd, "w") as f:
+        f.write("# Spam numbers\n800-555-1212, Car warranty\n+1 888 555 1212\n")
+    service = SpamListService(path)
+    service.warm_up()
+    assert len(service._numbers) == 2
+
+    # The numbers are matched in any format
+    result = service.lookup_number("8005551212")
+    assert result["spam"]
+    assert result["reason"] == "Car warranty"
+    assert service.lookup_number("18005551212")["spam"]
+    assert service.lookup_number("8885551212")["spam"]
+    assert not service.lookup_number("5551234567")["spam"]
+
+    # Changes to the file are picked up
+    with open(path, "w") as f:
+        f.write("5551234567\n")
+    os.utime(path, (0, 0))
+    assert service.lookup_number("5551234567")["spam"]
+    assert not service.lookup_number("8005551212")["spam"]
+
+    os.unlink(path)
+    assert not service.lookup_number("5551234567")["spam"]
+
+
+def test_spam_list_country_code():
+    fd, path = tempfile.mkstemp()
+    with os.fdopen(fd, "w") as f:
+        f.write("020 7946 0000\n")
+    service = SpamListService(path, "44")
+
+    assert service.lookup_number("+442079460000")["spam"]
+    assert service.lookup_number("02079460000")["spam"]
+    os.unlink(path)
+
+
+def test_http_service(server):
+    url = "http://127.0.0.1:{}/lookup/{{}}".format(server.server_port)
+    service = HttpReputationService(url, timeout=2)
+
+    assert service.lookup_number("8005551212") == spam
+    assert service.lookup_number("5551234567") == not_spam
+
+
+def test_create_services():
+    config = Config()
+    config["BLOCK_SERVICE"] = ["nomorobo", "SPAMLIST", "BOGUS"]
+    names = [name for name, service in create_services(config)]
+    assert names == ["NOMOROBO", "SPAMLIST"]
+
+    config["BLOCK_SERVICE"] = ""
+    assert create_services(config) == []
+
+
+def test_merge_results():
+    assert merge_results([]) is None
+
+    results = [("A", spam), ("B", nuisance), ("C", not_spam)]
+    assert merge_results(results, "any") == spam
+    assert not merge_results(results, "majority")["spam"]
+    assert not merge_results(results, "all")["spam"]
+    assert merge_results(results[:1], "all") == spam
+
+    # The highest score is reported when the caller isn't spam
+    result = merge_results(results[1:], "any")
+    assert not result["spam"]
+    assert result["reason"] == "Political"
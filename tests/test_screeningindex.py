@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_screeningindex.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from callattendant.screening.blacklist import Blacklist
+from callattendant.screening.blockedranges import BlockedRanges
+from callattendant.screening.whitelist import Whitelist
+from callattendant.screening.screeningindex import ScreeningIndex
+
+
+@pytest.fixture(scope='module')
+def db():
+    # Create the test db in RAM
+    return sqlite3.connect(":memory:")
+
+
+@pytest.fixture(scope='module')
+def config():
+    # Mock the application config, which is a dict-based object
+    config = {}
+    config['DEBUG'] = True
+    config['TESTING'] = False
+    return config
+
+
+@pytest.fixture(scope='module')
+def index(db, config):
+    # Ensure the tables exist before the index is loaded
+    whitelist = Whitelist(db, config)
+    blacklist = Blacklist(db, config)
+    BlockedRanges(db, config)
+    whitelist.add_caller({"NAME": "Friend", "NMBR": "8055551111"}, "Friend")
+    blacklist.add_caller({"NAME": "Spammer", "NMBR": "8055552222"}, "Spam")
+
+    return ScreeningIndex(db, config)
+
+
+def test_check_loaded_numbers(index):
+    assert index.check_whitelist("8055551111") == (True, "Friend")
+    assert index.check_blacklist("8055552222") == (True, "Spam")
+
+    assert index.check_whitelist("8055552222") == (False, "")
+    assert index.check_blacklist("8055551111") == (False, "")
+
+
+def test_refresh_on_change(index, db, config):
+    # Changes via another Blacklist object (e.g., the web app) are detected
+    blacklist = Blacklist(db, config)
+
+    assert blacklist.add_caller({"NAME": "Robocaller", "NMBR": "8055553333"}, "Robocall")
+    assert index.check_blacklist("8055553333") == (True, "Robocall")
+
+    assert blacklist.update_number("8055553333", "Robocaller", "Updated")
+    assert index.check_blacklist("8055553333") == (True, "Updated")
+
+    assert blacklist.remove_number("8055553333")
+    assert index.check_blacklist("8055553333") == (False, "")
+
+
+def test_refresh_on_data_version(index, tmp_path, config):
+    # Changes made via a different connection are detected via the db
+    db_file = str(tmp_path / "test.db")
+    db = sqlite3.connect(db_file)
+    Whitelist(db, config)
+    Blacklist(db, config)
+    BlockedRanges(db, config)
+    index = ScreeningIndex(db, config)
+
+    other = sqlite3.connect(db_file)
+    other.execute("INSERT INTO Blacklist(PhoneNo, Reason, NormalizedNo) VALUES('8055554444', 'Other', '+18055554444')")
+    other.commit()
+    other.close()
+
+    # Not rechecked until the interval has elapsed
+    assert index.check_blacklist("8055554444") == (False, "")
+
+    index.DATA_VERSION_INTERVAL = 0
+    assert index.check_blacklist("8055554444") == (True, "Other")
+
+
+def test_check_ranges(index, db, config):
+    ranges = BlockedRanges(db, config)
+    assert index.check_ranges("8005551212") == (False, "")
+
+    assert ranges.add_range("800", "800", "Toll free")
+    assert index.check_ranges("8005551212") == (True, "Toll free")
+    assert index.check_ranges("18005551212") == (True, "Toll free")
+    assert index.check_ranges("8015551212") == (False, "")
+
+
+def test_update_entry(index, db, config):
+    blacklist = Blacklist(db, config)
+    assert blacklist.add_caller({"NAME": "Spammer", "NMBR": "8055555555"}, "Spam")
+
+    index.update_entry("Blacklist", "8055555555", "Spam")
+
+    # The patch is accepted without reloading the tables
+    counts = dict(index._change_counts)
+    assert index.check_blacklist("8055555555") == (True, "Spam")
+    assert index._change_counts == counts
+
+
+def test_expired_entry(index, db, config):
+    whitelist = Whitelist(db, config)
+    assert whitelist.add_caller({"NAME": "Plumber", "NMBR": "8055556666"}, "Contractor", 48)
+    assert index.check_whitelist("8055556666") == (True, "Contractor")
+
+    # The index ignores the entry once it has expired
+    index._expires["Whitelist"]["+18055556666"] = (datetime.now() - timedelta(seconds=1)).strftime('%Y-%m-%d %H:%M:%S')
+    assert index.check_whitelist("8055556666") == (False, "")
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_screeningquery.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import sqlite3
+import time
+
+import pytest
+
+from callattendant.screening.blacklist import Blacklist
+from callattendant.screening.blockedranges import BlockedRanges
+from callattendant.screening.whitelist import Whitelist
+from callattendant.screening.screeningquery import ScreeningQuery
+
+
+@pytest.fixture
+def config():
+    # Mock the application config, which is a dict-based object
+    config = {}
+    config['DEBUG'] = False
+    config['TESTING'] = False
+    return config
+
+
+@pytest.fixture
+def lists(tmpdir, config):
+    # A file-based db, as used when the lists aren't held in memory
+    db = sqlite3.connect(os.path.join(str(tmpdir), "test.db"))
+    whitelist = Whitelist(db, config)
+    blacklist = Blacklist(db, config)
+    ranges = BlockedRanges(db, config)
+    whitelist.add_caller({"NAME": "Friend", "NMBR": "8055551111"}, "Friend")
+    blacklist.add_caller({"NAME": "Spammer", "NMBR": "8055552222"}, "Spam")
+    ranges.add_range("900", "900", "Premium rate")
+    yield db, whitelist, blacklist, ranges
+    db.close()
+
+
+def test_lookup(lists, config):
+    db, whitelist, blacklist, ranges = lists
+    query = ScreeningQuery(db, config)
+
+    assert query.lookup("8055551111") == {"Whitelist": "Friend"}
+    assert query.lookup("8055552222") == {"Blacklist": "Spam"}
+    assert query.lookup("9005551212") == {"BlockedRange": "Premium rate"}
+    assert query.lookup("19005551212") == {"BlockedRange": "Premium rate"}
+    assert query.lookup("8055553333") == {}
+
+    blacklist.add_caller({"NAME": "Friend", "NMBR": "8055551111"}, "Both")
+    assert query.lookup("8055551111") == {"Whitelist": "Friend", "Blacklist": "Both"}
+    query.close()
+
+
+def test_check_lists(lists, config):
+    db, whitelist, blacklist, ranges = lists
+    query = ScreeningQuery(db, config, blacklist)
+
+    assert query.check_whitelist("8055551111") == (True, "Friend")
+    assert query.check_blacklist("8055551111") == (False, "")
+    assert query.check_whitelist("8055552222") == (False, "")
+    assert query.check_blacklist("8055552222") == (True, "Spam")
+    assert query.check_blacklist("9005551212") == (True, "Premium rate")
+
+    # The whitelist result isn't reused after the tables change
+    assert query.check_whitelist("8055553333") == (False, "")
+    blacklist.add_caller({"NAME": "Spammer", "NMBR": "8055553333"}, "New")
+    assert query.check_blacklist("8055553333") == (True, "New")
+    query.close()
+
+
+def test_bloom_filter(tmpdir, lists):
+    db, whitelist, blacklist, ranges = lists
+    config = {"DEBUG": False, "TESTING": False, "BLOCK_BLOOM_FILTER": True}
+    blacklist = Blacklist(db, config)
+    query = ScreeningQuery(db, config, blacklist)
+
+    assert not blacklist.may_contain("8055553333")
+    assert query.check_blacklist("8055553333") == (False, "")
+    assert query.check_blacklist("8055552222") == (True, "Spam")
+    assert query.check_blacklist("9005551212") == (True, "Premium rate")
+    query.close()
+
+
+def test_single_query_latency(lists, config):
+    db, whitelist, blacklist, ranges = lists
+    for i in range(2000):
+        blacklist.add_caller({"NAME": "Spammer", "NMBR": str(7000000000 + i)}, "Spam")
+    numbers = [str(7000000000 + i) for i in range(0, 2000, 2)] + [str(8000000000 + i) for i in range(1000)]
+    query = ScreeningQuery(db, config)
+
+    # Separate queries, each with its own cursor, as before
+    def separate():
+        results = []
+        for number in numbers:
+            if not whitelist.check_number(number)[0]:
+                results.append(blacklist.check_number(number)[0] or ranges.check_number(number)[0])
+        return results
+
+    def combined():
+        results = []
+        for number in numbers:
+            if not query.check_whitelist(number)[0]:
+                results.append(query.check_blacklist(number)[0])
+        return results
+
+    # Both find the same callers
+    assert combined() == separate()
+    assert combined().count(True) == 1000
+
+    def best_time(func):
+        times = []
+        for i in range(3):
+            start = time.time()
+            func()
+            times.append(time.time() - start)
+        return min(times) / len(numbers)
+
+    separate_time = best_time(separate)
+    combined_time = best_time(combined)
+    query.close()
+
+    print("Per-call latency: separate queries {:.1f} usec, single query {:.1f} usec".format(
+        separate_time * 1e6, combined_time * 1e6))
+    # A generous bound, so a busy machine doesn't fail the test
+    assert combined_time < separate_time * 2
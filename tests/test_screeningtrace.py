@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_screeningtrace.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import sqlite3
+
+import pytest
+
+from callattendant.migrations import migrate
+from callattendant.screening.screeningtrace import ScreeningTrace, stage_percentiles
+
+
+@pytest.fixture
+def db():
+    db = sqlite3.connect(":memory:")
+    migrate(db, {})
+    return db
+
+
+def test_call():
+    trace = ScreeningTrace()
+
+    assert trace.call("Whitelist", lambda number: (False, "Not found"), "8055551234") == (False, "Not found")
+    assert trace.call("Blocked names", lambda name: None, "BRUCE") is None
+    assert trace.call("Blocked numbers", lambda number: "Toll free", "8005551234") == "Toll free"
+
+    stages = [stage[:3] for stage in trace.stages]
+    assert stages == [
+        ("Whitelist", False, ""),
+        ("Blocked names", False, ""),
+        ("Blocked numbers", True, "Toll free"),
+    ]
+    assert all(stage[3] >= 0 for stage in trace.stages)
+    assert trace.total() == sum(stage[3] for stage in trace.stages)
+    assert "Blocked numbers" in str(trace)
+
+
+def test_stage_percentiles(db):
+    db.execute("INSERT INTO CallLog(CallLogID, CallTime) VALUES(1, 1577872800)")
+    for call_no in range(2, 102):
+        db.execute("INSERT INTO CallLog(CallLogID, CallTime) VALUES(?, 1580551200)", (call_no,))
+    rows = [(1, 0, "Whitelist", 0, "", 5000)]
+    for call_no in range(2, 102):
+        # Whitelist takes 1..100 us, Blacklist 10 us
+        rows.append((call_no, 0, "Whitelist", 0, "", call_no - 1))
+        rows.append((call_no, 1, "Blacklist", 0, "", 10))
+    db.executemany("INSERT INTO ScreeningTrace VALUES(?,?,?,?,?,?)", rows)
+
+    stages = stage_percentiles(db, since=1580515200)
+    assert [stage["stage"] for stage in stages] == ["Whitelist", "Blacklist", "Total"]
+    whitelist, blacklist, total = stages
+    assert (whitelist["count"], whitelist["p50"], whitelist["p90"], whitelist["p99"], whitelist["max"]) == \
+        (100, 50, 90, 99, 100)
+    assert (blacklist["p50"], blacklist["max"]) == (10, 10)
+    assert (total["count"], total["p50"], total["max"]) == (100, 60, 110)
+
+    # The older call is included without a start time
+    stages = stage_percentiles(db)
+    assert stages[0]["count"] == 101
+    assert stages[0]["max"] == 5000
+
+
+def test_stage_percentiles_empty(db):
+    assert stage_percentiles(db) == []
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_spamsnapshot.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import os
+import threading
+import time
+
+import pytest
+
+from callattendant.screening.reputation import SnapshotService
+from callattendant.screening import spamsnapshot
+from callattendant.screening.spamsnapshot import SpamSnapshot, build_snapshot, number_key
+
+
+def test_number_key():
+    assert number_key("800-555-1212") == 18005551212
+    assert number_key("+1 (800) 555-1212") == 18005551212
+    assert number_key("P") is None
+    assert number_key("") is None
+
+
+def test_build_snapshot(tmp_path):
+    filename = str(tmp_path / "spam.bin")
+    count = build_snapshot(["8005551212", "1-800-555-1212", "888-555-1212", None, "P"], filename)
+    assert count == 2
+    assert not os.path.exists(filename + ".tmp")
+
+    snapshot = SpamSnapshot(filename)
+    assert len(snapshot) == 2
+    assert 18005551212 in snapshot
+    assert 18885551212 in snapshot
+    assert 18885551213 not in snapshot
+    assert 0 not in snapshot
+
+
+def test_build_snapshot_runs(tmp_path, mocker):
+    # The sorted runs are merged, and duplicates across the runs dropped
+    mocker.patch.object(spamsnapshot, "SORT_RUN", 3)
+    filename = str(tmp_path / "spam.bin")
+    numbers = ["80055512{:02d}".format(i % 7) for i in range(20, 0, -1)]
+    assert build_snapshot(numbers, filename) == 7
+
+    snapshot = SpamSnapshot(filename)
+    assert list(snapshot._keys) == [180055512 * 100 + i for i in range(7)]
+
+
+def test_empty_snapshot(tmp_path):
+    filename = str(tmp_path / "spam.bin")
+    assert build_snapshot([], filename) == 0
+    snapshot = SpamSnapshot(filename)
+    assert len(snapshot) == 0
+    assert 18005551212 not in snapshot
+
+
+def test_invalid_snapshot(tmp_path):
+    filename = str(tmp_path / "spam.bin")
+    with open(filename, "w") as f:
+        f.write("8005551212\n")
+    with pytest.raises(ValueError):
+        SpamSnapshot(filename)
+
+
+def test_snapshot_service(tmp_path):
+    filename = str(tmp_path / "spam.bin")
+    service = SnapshotService(filename)
+
+    # A missing snapshot isn't an error
+    assert not service.lookup_number("8005551212")["spam"]
+
+    build_snapshot(["8005551212"], filename)
+    result = service.lookup_number("8005551212")
+    assert result["spam"]
+    assert result["reason"] == "Spam snapshot"
+    assert not service.lookup_number("P")["spam"]
+
+    # A replaced snapshot is picked up
+    build_snapshot(["8885551212"], filename)
+    os.utime(filename, (0, 0))
+    assert service.lookup_number("8885551212")["spam"]
+    assert not service.lookup_number("8005551212")["spam"]
+
+
+def test_snapshot_refresh_while_screening(tmp_path):
+    filename = str(tmp_path / "spam.bin")
+    build_snapshot(["8005551212"], filename)
+    service = SnapshotService(filename)
+    errors = []
+    stop = threading.Event()
+
+    def screen():
+        while not stop.is_set():
+            try:
+                # The number is in every snapshot
+                if not service.lookup_number("8005551212")["spam"]:
+                    errors.append("missed")
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=screen) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for i in range(20):
+        build_snapshot(["8005551212", "88855512{:02d}".format(i)], filename)
+        os.utime(filename, (i, i))
+        time.sleep(0.005)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert service.lookup_number("8885551219")["spam"]
+
+
+def test_snapshot_lookup_performance(tmp_path):
+    filename = str(tmp_path / "spam.bin")
+    numbers = ["8{:09d}".format(i * 7) for i in range(500000)]
+    start = time.perf_counter()
+    build_snapshot(numbers, filename)
+    build_elapsed = time.perf_counter() - start
+    assert os.path.getsize(filename) == 16 + 8 * len(numbers)
+
+    service = SnapshotService(filename)
+    service.warm_up()
+    start = time.perf_counter()
+    for i in range(10000):
+        assert service.lookup_number(numbers[i * 50])["spam"]
+    elapsed = time.perf_counter() - start
+    print("Built {:,} numbers in {:.2f} sec; {:.1f} usec per lookup".format(
+        len(numbers), build_elapsed, elapsed / 10000 * 1000000))
+    assert elapsed < 2.0
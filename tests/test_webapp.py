@@ -23,13 +23,19 @@
 #  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 #  SOFTWARE.
 
+import io
 import os
 import tempfile
+import time
 
 import pytest
 
 # ~ from hardware.indicators import MessageIndicator
 from callattendant.userinterface.webapp import app, get_random_string, get_db
+from callattendant.screening.calllogger import BLOCKED, PERMITTED, SCREENED
+from callattendant.screening.circuitbreaker import CircuitBreaker
+from callattendant.migrations import migrate
+from callattendant.config import Config
 
 
 # Read in SQL for populating test data
@@ -79,3 +85,196 @@ def test_dashboard(client):
     assert b"Statistics" in response.data
     assert b"Recent Calls" in response.data
     assert b"Calls per Day" in response.data
+
+
+def test_calls_view_trace(myapp, client):
+    with myapp.app_context():
+        db = get_db()
+        migrate(db, {})
+        call_no = db.execute("SELECT MAX(CallLogID) FROM CallLog").fetchone()[0]
+        db.executemany("INSERT INTO ScreeningTrace VALUES(?,?,?,?,?,?)",
+                       [(call_no, 0, "Whitelist", 0, "", 120), (call_no, 1, "Blacklist", 1, "Spammer", 45)])
+        db.commit()
+
+    response = client.get('/calls/view/{}'.format(call_no))
+    assert response.status_code == 200
+    assert b"trace-table" in response.data
+    assert b"Matched Spammer" in response.data
+    assert b"165 &micro;s" in response.data
+
+
+def test_calls_search_phone(client):
+    # Any form of the number finds the calls
+    response = client.get('/calls?search=1 (805) 555-1080&submit=phone')
+    assert response.status_code == 200
+    assert b"805-555-1080" in response.data
+
+    response = client.get('/calls?search=805-555-0000&submit=phone')
+    assert b"805-555-1080" not in response.data
+
+
+def test_calls_search_name(client):
+    response = client.get('/calls?search=Bru&submit=name')
+    assert response.status_code == 200
+    assert b"805-555-1080" in response.data
+
+    # The search text is a parameter, not part of the SQL
+    response = client.get("/calls?search=O'Brien&submit=name")
+    assert response.status_code == 200
+    assert b"805-555-1080" not in response.data
+
+    response = client.get("/calls?search=%' OR Name <> '&submit=name")
+    assert response.status_code == 200
+    assert b"805-555-1080" not in response.data
+
+
+def test_dashboard_benchmark(myapp, client):
+    # Time the dashboard with a large call log, with and without the indexes
+    with myapp.app_context():
+        db = get_db()
+        migrate(db, {})
+        now = int(time.time())
+        rows = []
+        for i in range(200000):
+            rows.append(("CALLER", "80055{:05d}".format(i % 5000), (BLOCKED, PERMITTED, SCREENED)[i % 3],
+                         "", now - i * 180, 180055 * 100000 + i % 5000))
+        db.executemany("""INSERT INTO CallLog(Name, Number, Action, Reason, CallTime, NormalizedNo)
+            VALUES(?,?,?,?,?,?)""", rows)
+        db.commit()
+
+    def time_dashboard():
+        start = time.perf_counter()
+        response = client.get('/')
+        assert response.status_code == 200
+        return time.perf_counter() - start
+
+    indexed = min(time_dashboard() for i in range(3))
+
+    with myapp.app_context():
+        db = get_db()
+        indexes = db.execute("""SELECT name, sql FROM sqlite_master
+            WHERE type='index' AND name LIKE 'idx_%' AND tbl_name IN ('CallLog', 'Message')""").fetchall()
+        for name, sql in indexes:
+            db.execute("DROP INDEX {}".format(name))
+        db.commit()
+    unindexed = min(time_dashboard() for i in range(3))
+
+    print("Dashboard with 200,000 calls: {:.3f} sec indexed, {:.3f} sec unindexed".format(indexed, unindexed))
+    assert indexed < unindexed
+
+
+def test_settings_services(myapp, client, mocker):
+    breaker = CircuitBreaker("NOMOROBO", failure_threshold=1, cooldown=60)
+    breaker.record_failure(2.0, "Timed out")
+    mocker.patch.dict(myapp.config, {"SERVICE_STATUS": lambda: [breaker.status()]})
+
+    response = client.get('/settings')
+    assert response.status_code == 200
+    assert b"Screening Services" in response.data
+    assert b"NOMOROBO" in response.data
+    assert b"open" in response.data
+    assert b"stages-table" not in response.data
+
+
+def test_blocked_ranges(myapp, client):
+    response = client.get('/callers/blocked/ranges')
+    assert response.status_code == 200
+    assert b"Blocked Ranges" in response.data
+
+    response = client.post('/callers/blocked/ranges/add',
+                           data={"low": "212-555", "high": "212-559", "reason": "Exchanges"},
+                           follow_redirects=True)
+    assert response.status_code == 200
+    assert b"212559" in response.data
+    assert b"Exchanges" in response.data
+
+    response = client.post('/callers/blocked/ranges/add',
+                           data={"low": "212", "high": "2125", "reason": "Invalid"},
+                           follow_redirects=True)
+    assert b"must be the same length" in response.data
+
+    with myapp.app_context():
+        range_id = get_db().execute("SELECT RangeID FROM BlockedRange").fetchone()[0]
+    response = client.get('/callers/blocked/ranges/delete/{}'.format(range_id), follow_redirects=True)
+    assert response.status_code == 200
+    assert b"Exchanges" not in response.data
+
+
+def test_blocked_names(myapp, client):
+    response = client.get('/callers/blocked/names')
+    assert response.status_code == 200
+    assert b"Blocked Names" in response.data
+
+    response = client.post('/callers/blocked/names/add',
+                           data={"keyword": "card services", "reason": "Scam"},
+                           follow_redirects=True)
+    assert response.status_code == 200
+    assert b"<b>CARD SERVICES</b>" in response.data
+
+    response = client.post('/callers/blocked/names/add',
+                           data={"keyword": "  ", "reason": "Invalid"},
+                           follow_redirects=True)
+    assert b"must not be blank" in response.data
+
+    with myapp.app_context():
+        rule_id = get_db().execute("SELECT RuleID FROM NameRules").fetchone()[0]
+    response = client.post('/callers/blocked/names/update/{}'.format(rule_id),
+                           data={"keyword": "WIRELESS CALLER", "reason": "Scam"},
+                           follow_redirects=True)
+    assert b"<b>WIRELESS CALLER</b>" in response.data
+    assert b"<b>CARD SERVICES</b>" not in response.data
+
+    response = client.get('/callers/blocked/names/delete/{}'.format(rule_id), follow_redirects=True)
+    assert response.status_code == 200
+    assert b"<b>WIRELESS CALLER</b>" not in response.data
+
+
+def test_blocked_import(myapp, client):
+    data = {
+        "file": (io.BytesIO(b"Number\n800-555-1212\n888-555-1212\n"), "spam.csv"),
+        "reason": "Complaints",
+    }
+    response = client.post('/callers/blocked/import', data=data,
+                           content_type="multipart/form-data", follow_redirects=True)
+    assert response.status_code == 200
+    assert b"Imported 2 numbers" in response.data
+    assert b"Complaints" in response.data
+
+
+def test_settings_whatif(myapp, client):
+    config = Config()
+    config.update(myapp.config["MASTER_CONFIG"])
+    myapp.config["MASTER_CONFIG"] = config
+
+    response = client.get('/settings/whatif')
+    assert response.status_code == 200
+    assert b"BLOCK_NAME_PATTERNS" in response.data
+
+    data = {
+        "BLOCK_NAME_PATTERNS": "{'.*': 'Everyone'}",
+        "BLOCK_NUMBER_PATTERNS": "{}",
+        "PERMIT_NAME_PATTERNS": "{}",
+        "PERMIT_NUMBER_PATTERNS": "{}",
+        "months": "1200",
+    }
+    response = client.post('/settings/whatif', data=data)
+    assert response.status_code == 200
+    assert b"Changed Decisions" in response.data
+    assert b"Everyone" in response.data
+
+    data["BLOCK_NAME_PATTERNS"] = "{'(': 'Invalid'}"
+    response = client.post('/settings/whatif', data=data, follow_redirects=True)
+    assert b"Invalid rules" in response.data
+
+
+def test_permitted_expires(myapp, client):
+    response = client.post('/callers/permitted/add',
+                           data={"phone": "805-555-0001", "name": "Plumber", "reason": "Contractor", "expires": "48"},
+                           follow_redirects=True)
+    assert response.status_code == 200
+    assert b"Expires " in response.data
+
+    response = client.post('/callers/permitted/add',
+                           data={"phone": "805-555-0002", "name": "Plumber", "reason": "Contractor", "expires": "x"},
+                           follow_redirects=True)
+    assert b"The expiry must be a number of hours" in response.data
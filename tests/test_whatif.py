@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#  test_whatif.py
+#
+#  Copyright 2020 Bruce Schubert  <bruce@emxsys.com>
+#
+#  Permission is hereby granted, free of charge, to any person obtaining a copy
+#  of this software and associated documentation files (the "Software"), to deal
+#  in the Software without restriction, including without limitation the rights
+#  to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+#  copies of the Software, and to permit persons to whom the Software is
+#  furnished to do so, subject to the following conditions:
+#
+#  The above copyright notice and this permission notice shall be included in all
+#  copies or substantial portions of the Software.
+#
+#  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+#  IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+#  FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+#  AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+#  LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+#  OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+#  SOFTWARE.
+
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from callattendant.config import Config
+from callattendant.screening.blacklist import Blacklist
+from callattendant.screening.blockedranges import BlockedRanges
+from callattendant.screening.calllogger import CallLogger, BLOCKED, SCREENED
+from callattendant.screening.whitelist import Whitelist
+from callattendant.screening.whatif import make_screener, read_call_log, compare_decisions, months_ago
+
+
+@pytest.fixture
+def db():
+    # Create the test db in RAM
+    db = sqlite3.connect(":memory:")
+    CallLogger(db, {"DEBUG": False, "TESTING": False})
+    return db
+
+
+@pytest.fixture
+def config():
+    config = Config()
+    config["BLOCK_NAME_PATTERNS"] = {"V[0-9]{15}": "Telemarketer Caller ID"}
+    config["BLOCK_NUMBER_PATTERNS"] = {}
+    config["PERMIT_NAME_PATTERNS"] = {}
+    config["PERMIT_NUMBER_PATTERNS"] = {}
+    return config
+
+
+def add_calls(db, calls):
+    db.executemany("""INSERT INTO CallLog(Name, Number, Action, Reason, CallTime)
+        VALUES(?,?,?,?,?)""", calls)
+    db.commit()
+
+
+def test_screen_many(db, config):
+    config["BLOCK_NUMBER_PATTERNS"] = {"P": "Private number"}
+    config["PERMIT_NAME_PATTERNS"] = {".*DOE": "Anyone"}
+    Blacklist(db, config).add_caller({"NAME": "SPAMMER", "NMBR": "1234567890"}, "Spam")
+    Whitelist(db, config).add_caller({"NAME": "FRIEND", "NMBR": "1111111111"}, "Friend")
+    BlockedRanges(db, config).add_range("900", "900", "Premium rate")
+    spammer = {"NAME": "SPAMMER", "NMBR": "1234567890"}
+    callers = [spammer, {"NAME": "FRIEND", "NMBR": "1111111111"}, {"NAME": "V123456789012345", "NMBR": "8005551212"},
+               {"NAME": "JOHN DOE", "NMBR": "0987654321"}, spammer, {"NAME": "CALLER", "NMBR": "P"},
+               {"NAME": "CALLER", "NMBR": "19005551212"}]
+
+    # No threads are started and nothing is written
+    threads = threading.active_count()
+    changes = db.total_changes
+    screener = make_screener(db, config)
+    decisions = list(screener.screen_many(callers))
+    assert decisions == [
+        ("Blocked", "Spam"), ("Permitted", "Friend"), ("Blocked", "Telemarketer Caller ID"),
+        ("Permitted", "Anyone"), ("Blocked", "Spam"), ("Blocked", "Private number"), ("Blocked", "Premium rate")]
+
+    # Candidate rules don't change the lists
+    rules = {
+        "BLOCK_NAME_PATTERNS": {},
+        "PERMIT_NAME_PATTERNS": {"V[0-9]{15}": "Candidate"},
+        "BLACKLIST": {"123-456-7890": None, "0987654321": "Candidate"},
+    }
+    decisions = list(screener.screen_many(callers, rules))
+    assert decisions == [
+        ("Screened", "Not found"), ("Permitted", "Friend"), ("Permitted", "Candidate"),
+        ("Blocked", "Candidate"), ("Screened", "Not found"), ("Blocked", "Private number"), ("Blocked", "Premium rate")]
+    assert threading.active_count() == threads
+    assert db.total_changes == changes
+    assert Blacklist(db, config).check_number("1234567890") == (True, "Spam")
+
+
+def test_read_call_log(db):
+    now = int(time.time())
+    add_calls(db, [
+        ("OLD", "8005551212", SCREENED, "", now - 200 * 24 * 60 * 60),
+        ("RECENT", "8885551212", BLOCKED, "Spam", now),
+    ])
+
+    calls = list(read_call_log(db, since=months_ago(3), batch_size=1))
+    assert len(calls) == 1
+    assert calls[0]["NAME"] == "RECENT"
+    assert calls[0]["Action"] == "Blocked"
+    assert calls[0]["CallTime"] == now
+
+    assert len(list(read_call_log(db))) == 2
+
+
+def test_compare_decisions(db, config):
+    now = int(time.time())
+    add_calls(db, [
+        ("V123456789012345", "8005551212", BLOCKED, "Telemarketer Caller ID", now),
+        ("CHARITY", "8885551212", SCREENED, "", now),
+        ("FRIEND", "8775551212", SCREENED, "", now),
+    ])
+    screener = make_screener(db, config)
+    rules = {
+        "BLOCK_NAME_PATTERNS": {"CHARITY": "Charity"},
+        "WHITELIST": {"8775551212": "Friend"},
+    }
+    report = compare_decisions(screener, read_call_log(db), rules)
+
+    assert report["total"] == 3
+    assert report["transitions"] == {
+        ("Blocked", "Screened"): 1,
+        ("Screened", "Blocked"): 1,
+        ("Screened", "Permitted"): 1,
+    }
+    # Only the changed calls have their time formatted
+    date_time = datetime.fromtimestamp(now).strftime('%Y-%m-%d %H:%M:%S')
+    assert all(call["DateTime"] == date_time for call, old, new, reason in report["changes"])
+    changes = [(call["NAME"], old, new, reason) for call, old, new, reason in report["changes"]]
+    assert changes == [
+        ("V123456789012345", "Blocked", "Screened", "Not found"),
+        ("CHARITY", "Screened", "Blocked", "Charity"),
+        ("FRIEND", "Screened", "Permitted", "Friend"),
+    ]
+    # The live config is unchanged
+    assert config["BLOCK_NAME_PATTERNS"] == {"V[0-9]{15}": "Telemarketer Caller ID"}
+
+
+def test_compare_decisions_performance(db, config):
+    random.seed(1)
+    now = int(time.time())
+    numbers = [str(random.randrange(2000000000, 9999999999)) for i in range(20000)]
+    names = ["CALLER{}".format(i) for i in range(1000)] + ["V123456789012345"]
+    add_calls(db, [(random.choice(names), random.choice(numbers), SCREENED, "", now) for i in range(500000)])
+
+    screener = make_screener(db, config)
+    rules = {"BLOCK_NAME_PATTERNS": {"CALLER1[0-9]*": "Candidate"}}
+    report = compare_decisions(screener, read_call_log(db), rules)
+
+    print("Screened {:,} calls in {:.2f} seconds".format(report["total"], report["elapsed"]))
+    assert report["total"] == 500000
+    assert report["transitions"][("Screened", "Blocked")] > 0
+    # At least 100k calls per second, i.e., 500k calls in 5 seconds
+    assert report["total"] / report["elapsed"] > 100000
@@ -24,6 +24,7 @@
 #  SOFTWARE.
 
 import sqlite3
+from datetime import datetime, timedelta
 from pprint import pprint
 
 import pytest
@@ -113,3 +114,37 @@ def test_multiple(whitelist):
 
     caller = whitelist.get_number(number)
     pprint(caller)
+
+
+def test_expires(whitelist):
+    callerid = {"NAME": "Plumber", "NMBR": "8055550001", "DATE": "1012", "TIME": "0600"}
+    assert whitelist.add_caller(callerid, "Contractor", 48)
+    assert whitelist.check_number("8055550001") == (True, "Contractor")
+
+    # An expired entry is ignored, even before the reaper removes it
+    assert whitelist.set_expires("8055550001", datetime.now() - timedelta(seconds=1))
+    assert whitelist.check_number("8055550001") == (False, "")
+
+    # and it's replaced when the caller is added again
+    assert whitelist.add_caller(callerid, "Contractor")
+    assert whitelist.check_number("8055550001") == (True, "Contractor")
+
+
+def test_normalized_number(whitelist):
+    callerid = {"NAME": "Dentist", "NMBR": "805-555-0002", "DATE": "1012", "TIME": "0600"}
+    assert whitelist.add_caller(callerid, "Appointment")
+
+    # Any form of the number finds the entry
+    assert whitelist.check_number("8055550002") == (True, "Appointment")
+    assert whitelist.check_number("18055550002") == (True, "Appointment")
+    assert whitelist.check_number("+1 (805) 555-0002") == (True, "Appointment")
+
+    # Only one entry per number, and any form of the number edits it
+    assert not whitelist.add_caller(dict(callerid, NMBR="18055550002"), "Duplicate")
+    assert whitelist.update_number("8055550002", "Dr. Smith", "Checkup")
+    assert whitelist.check_number("805-555-0002") == (True, "Checkup")
+    assert whitelist.set_expires("+18055550002", datetime.now() - timedelta(hours=1))
+    assert whitelist.check_number("805-555-0002") == (False, "")
+
+    assert whitelist.remove_number("1-805-555-0002")
+    assert whitelist.check_number("8055550002") == (False, "")